@@ -0,0 +1,412 @@
+from gurobipy import Model, GRB, quicksum, tupledict, Column, Env # Required for optimisation
+import multiprocessing
+import itertools
+
+# Local packages
+import functions as fn
+from decomposition import TwoStageDecomposition
+
+# Objectives that depend on the sectioning (the others are fixed by the timetable)
+sectioning_objectives = ["ModuleRequest","ModePreferences","StudentConflicts"]
+
+"""
+Pricing problem of a single student
+"""
+
+class StudentPricingProblem():
+    """
+    Small model over the scheduled classes of the modules a student requests,
+    with the same structure as the student part of the base model:
+    one configuration per attended module, one class per subpart, parent
+    classes, required modules, attendance modes and pairwise conflicts.
+    The objective is set from the duals of the master problem on each call.
+    """
+    def __init__(self,P,timetable,s,classes,env):
+        self.s = s
+        self.P = P
+        self.M = Model("Student pricing problem", env = env)
+        self.M.Params.Threads = 1
+        self.a = tupledict()
+        self.m = tupledict()
+        self.n = tupledict()
+        self.h = tupledict()
+        # Attendance variables for each scheduled class and available mode
+        self.assignment = {}
+        for k in P.modules:
+            if(k.id not in s.modules):
+                continue
+            self.n[k.id] = self.M.addVar(vtype=GRB.BINARY)
+            for f in k.configs:
+                self.m[k.id,f.id] = self.M.addVar(vtype=GRB.BINARY)
+                for p in f.subparts:
+                    for c_id in p.classes:
+                        room, online, timeset = timetable.class_assignment(c_id)
+                        if(timeset == None):
+                            continue
+                        self.assignment[c_id] = (room, online, timeset)
+                        if(room != None):
+                            self.a[c_id,False] = self.M.addVar(vtype=GRB.BINARY)
+                        if(online == True):
+                            self.a[c_id,True] = self.M.addVar(vtype=GRB.BINARY)
+                    # One class from every subpart of an attended configuration
+                    subpart_sum = quicksum(var for (c_id,mode),var in self.a.items() if c_id in p.classes)
+                    self.M.addConstr(subpart_sum == self.m[k.id,f.id])
+            self.M.addConstr(quicksum(self.m[k.id,f.id] for f in k.configs) == self.n[k.id])
+            if(k.id in s.required_modules):
+                self.M.addConstr(self.n[k.id] == 1)
+        # Parent classes
+        for c_id in self.assignment:
+            parent = classes[c_id].parent
+            if(parent != None):
+                child_sum = quicksum(var for (i,mode),var in self.a.items() if i == c_id)
+                parent_sum = quicksum(var for (i,mode),var in self.a.items() if i == parent)
+                self.M.addConstr(child_sum <= parent_sum)
+        # Conflicts between pairs of classes in the modes they are attended
+        D_array = P.distribution_arrays["InteriorDistance"]
+        for (c1_id,c2_id) in itertools.combinations(sorted(self.assignment),2):
+            if(fn.skip_student_scheduling_issues(classes[c1_id],classes[c2_id]) == True):
+                continue
+            r1, o1, t1 = self.assignment[c1_id]
+            r2, o2, t2 = self.assignment[c2_id]
+            for (mode1,mode2) in itertools.product([False,True],[False,True]):
+                if((c1_id,mode1) not in self.a or (c2_id,mode2) not in self.a):
+                    continue
+                room1 = 0 if mode1 == True else r1
+                room2 = 0 if mode2 == True else r2
+                if(P.weightedRoomAdjacency.distance(room1,room2) > D_array[t1,t2]):
+                    if((c1_id,c2_id) not in self.h):
+                        self.h[c1_id,c2_id] = self.M.addVar(vtype=GRB.BINARY)
+                    self.M.addConstr(self.h[c1_id,c2_id] >= self.a[c1_id,mode1] + self.a[c2_id,mode2] - 1)
+        self.M.update()
+
+
+    # Cheapest schedule for the weights of each objective and the capacity duals
+    def price(self,weights,inperson_duals,total_duals):
+        wrong_mode = None
+        if(self.s.mode_preference == 1):
+            wrong_mode = True
+        elif(self.s.mode_preference == -1):
+            wrong_mode = False
+        objective = quicksum(weights["ModuleRequest"]*var for k_id,var in self.n.items() if k_id not in self.s.required_modules)
+        objective += quicksum(weights["StudentConflicts"]*var for var in self.h.values())
+        for (c_id,mode),var in self.a.items():
+            coefficient = -total_duals.get(c_id,0)
+            if(mode == False):
+                coefficient -= inperson_duals.get(c_id,0)
+            if(mode == wrong_mode):
+                coefficient += weights["ModePreferences"]
+            objective += coefficient*var
+        self.M.setObjective(objective, GRB.MINIMIZE)
+        self.M.optimize()
+        if(self.M.SolCount == 0):
+            return None, []
+        schedule = [(c_id,mode) for (c_id,mode),var in self.a.items() if var.X > 0.5]
+        return self.M.ObjVal, sorted(schedule)
+
+
+"""
+Column generation for student sectioning
+"""
+
+class ColumnGenerationDecomposition(TwoStageDecomposition):
+    """
+    The timetable is found as in the two stage decomposition, then students are
+    sectioned by column generation. Each column is one complete schedule of a student
+    with its objective values precomputed, the master problem only holds
+    the choice of one schedule per student and the capacity rows (31 and 32).
+    For each objective of the ordering the master LP is solved by pricing new
+    schedules for every student (in worker processes when more than one worker),
+    then the master MIP over the generated columns fixes the objective value.
+    """
+    def __init__(self,P,number_cores,node_memory,
+                 number_workers=1,
+                 max_iterations=100,
+                 artificial_penalty=10000,
+                 instance_settings=None,
+                 warm_start=None):
+        TwoStageDecomposition.__init__(self,P,number_cores,node_memory,
+                                       number_workers=number_workers,
+                                       instance_settings=instance_settings,
+                                       warm_start=warm_start)
+        self.max_iterations = max_iterations
+        self.artificial_penalty = artificial_penalty
+        self.classes = {c.id: c for c in P.classes}
+        self.rooms = {r.id: r for r in P.rooms}
+        self.students = {s.id: s for s in P.students}
+
+
+    # Stage two, sectioning every student by column generation
+    def solve_sectioning(self,timetable,ordered_objective_list):
+        # The pricing workers are forked before the environment is created
+        self.start_pricing(timetable)
+        if(self.env == None):
+            self.env = Env()
+        try:
+            self.build_master(timetable)
+            for objective in ordered_objective_list:
+                if(objective[0] not in sectioning_objectives):
+                    continue
+                self.set_master_objective(objective)
+                self.generate_columns(objective)
+                value = self.solve_master_integer()
+                print("Column generation {} = {} ({} columns)".format(objective[0],value,len(self.columns)))
+                # Fixing the objective for the following stages
+                coefficients = [self.objective_sign(objective)*column[2][objective[0]] for column in self.columns]
+                self.fix_rows[objective[0]] = self.master.addConstr(quicksum(c*var for c,var in zip(coefficients,self.column_vars)) <= self.objective_sign(objective)*value + 1e-6)
+                self.fix_signs[objective[0]] = self.objective_sign(objective)
+                self.master.update()
+        finally:
+            self.stop_pricing()
+            # Freed so the next ordering's workers are not forked with an environment
+            if(hasattr(self,"master")):
+                self.master.dispose()
+            self.dispose_env()
+        # Schedules of the final integer solution
+        attendance = []
+        for column,selected in zip(self.columns,self.integer_selection):
+            if(selected > 0.5):
+                for (c_id,online) in column[1]:
+                    attendance.append((column[0],c_id,online))
+        for s_id,selected in self.integer_artificials.items():
+            if(selected > 0.5):
+                print("Warning: Student {} could not be given their required modules".format(s_id))
+        return attendance
+
+
+    # Minimisation sign of an objective
+    def objective_sign(self,objective):
+        if(objective[1] == "Maximise"):
+            return -1
+        return 1
+
+
+    """
+    Master problem
+    """
+
+    # Master problem with an empty schedule (or an artificial) for each student
+    def build_master(self,timetable):
+        self.master = Model("Sectioning master problem", env = self.env)
+        self.master.Params.OutputFlag = 0
+        if(self.cores != None):
+            self.master.Params.Threads = self.cores
+        self.columns = []
+        self.column_vars = []
+        self.column_keys = set()
+        self.fix_rows = {}
+        self.fix_signs = {}
+        self.current_objective = None
+        self.current_sign = 0
+        self.integer_selection = None
+        self.integer_artificials = {}
+        # One schedule per student
+        self.convexity = {}
+        self.artificials = {}
+        for s in self.P.students:
+            self.convexity[s.id] = self.master.addConstr(quicksum([]) == 1)
+            if(len(s.required_modules) != 0):
+                self.artificials[s.id] = self.master.addVar(lb=0, column=Column([1],[self.convexity[s.id]]))
+        self.master.update()
+        # Capacity rows of the scheduled classes
+        self.inperson_rows = {}
+        self.total_rows = {}
+        for c in self.P.classes:
+            room, online, timeset = timetable.class_assignment(c.id)
+            if(timeset == None):
+                continue
+            if(room != None):
+                self.inperson_rows[c.id] = self.master.addConstr(quicksum([]) <= self.rooms[room].capacity)
+            self.total_rows[c.id] = self.master.addConstr(quicksum([]) <= c.sub_limit)
+        self.master.update()
+        for s in self.P.students:
+            if(len(s.required_modules) == 0):
+                self.add_column(s.id,[])
+
+    # Adds a schedule of a student to the master problem (if it is new)
+    def add_column(self,s_id,schedule):
+        key = (s_id,tuple(schedule))
+        if(key in self.column_keys):
+            return False
+        self.column_keys.add(key)
+        values = self.schedule_objectives(s_id,schedule)
+        coefficients = [1]
+        rows = [self.convexity[s_id]]
+        for (c_id,online) in schedule:
+            rows.append(self.total_rows[c_id])
+            coefficients.append(1)
+            if(online == False):
+                rows.append(self.inperson_rows[c_id])
+                coefficients.append(1)
+        for z in self.fix_rows:
+            rows.append(self.fix_rows[z])
+            coefficients.append(self.fix_signs[z]*values[z])
+        var = self.master.addVar(lb=0, obj=self.current_sign*values.get(self.current_objective,0), column=Column(coefficients,rows))
+        self.columns.append((s_id,schedule,values))
+        self.column_vars.append(var)
+        return True
+
+    # Objective values of a single schedule (as counted by the base model)
+    def schedule_objectives(self,s_id,schedule):
+        s = self.students[s_id]
+        attended = set(c_id for (c_id,online) in schedule)
+        # Requested modules with every subpart of a configuration attended
+        module_requests = 0
+        for k in self.P.modules:
+            if(k.id in s.modules and k.id not in s.required_modules):
+                for f in k.configs:
+                    if(all(len(attended.intersection(p.classes)) != 0 for p in f.subparts)):
+                        module_requests += 1
+                        break
+        # Classes attended in the mode that is not preferred
+        mode_preferences = 0
+        for (c_id,online) in schedule:
+            if((s.mode_preference == 1 and online == True) or (s.mode_preference == -1 and online == False)):
+                mode_preferences += 1
+        # Conflicting pairs of classes
+        D_array = self.P.distribution_arrays["InteriorDistance"]
+        student_conflicts = 0
+        for (c1_id,online1),(c2_id,online2) in itertools.combinations(schedule,2):
+            if(fn.skip_student_scheduling_issues(self.classes[c1_id],self.classes[c2_id]) == True):
+                continue
+            r1, o1, t1 = self.timetable.class_assignment(c1_id)
+            r2, o2, t2 = self.timetable.class_assignment(c2_id)
+            room1 = 0 if online1 == True else r1
+            room2 = 0 if online2 == True else r2
+            if(self.P.weightedRoomAdjacency.distance(room1,room2) > D_array[t1,t2]):
+                student_conflicts += 1
+        return {"ModuleRequest": module_requests,
+                "ModePreferences": mode_preferences,
+                "StudentConflicts": student_conflicts}
+
+    # Sets the master objective for a stage (artificials are heavily penalised)
+    def set_master_objective(self,objective):
+        self.current_objective = objective[0]
+        self.current_sign = self.objective_sign(objective)
+        for column,var in zip(self.columns,self.column_vars):
+            var.Obj = self.current_sign*column[2][objective[0]]
+        for var in self.artificials.values():
+            var.Obj = self.artificial_penalty
+        self.master.ModelSense = GRB.MINIMIZE
+        self.master.update()
+
+    # Solves the master MIP over the generated columns
+    def solve_master_integer(self):
+        self.master.setAttr("VType", self.column_vars, [GRB.BINARY]*len(self.column_vars))
+        self.master.optimize()
+        if(self.master.SolCount != 0):
+            if(self.master.Status != GRB.OPTIMAL):
+                print("Warning: Integer master stopped with status {}".format(self.master.Status))
+            self.integer_selection = [var.X for var in self.column_vars]
+            self.integer_artificials = {s_id: var.X for s_id,var in self.artificials.items()}
+        elif(self.integer_selection == None):
+            print("Warning: No integer master solution (status {}), every student is left unsectioned".format(self.master.Status))
+            self.integer_selection = [0]*len(self.column_vars)
+            self.integer_artificials = {s_id: 1 for s_id in self.artificials}
+        else:
+            print("Warning: No integer master solution (status {}), keeping the previous stage".format(self.master.Status))
+            self.integer_selection = self.integer_selection + [0]*(len(self.column_vars) - len(self.integer_selection))
+        value = sum(column[2][self.current_objective]*selected for column,selected in zip(self.columns,self.integer_selection))
+        self.master.setAttr("VType", self.column_vars, [GRB.CONTINUOUS]*len(self.column_vars))
+        # Keeping the integer solution as the start of the next stage
+        self.master.setAttr("Start", self.column_vars, self.integer_selection)
+        self.master.update()
+        return round(value)
+
+
+    """
+    Pricing
+    """
+
+    # Prices schedules against the master duals until no column improves the LP
+    def generate_columns(self,objective):
+        for iteration in range(self.max_iterations):
+            self.master.optimize()
+            if(self.master.Status != GRB.OPTIMAL):
+                print("Warning: Master LP not solved to optimality")
+                return
+            lp_value = self.master.ObjVal
+            # Duals of the linking rows
+            inperson_duals = {c_id: row.Pi for c_id,row in self.inperson_rows.items()}
+            total_duals = {c_id: row.Pi for c_id,row in self.total_rows.items()}
+            convexity_duals = {s_id: row.Pi for s_id,row in self.convexity.items()}
+            weights = {z: 0 for z in sectioning_objectives}
+            weights[objective[0]] += self.objective_sign(objective)
+            for z in self.fix_rows:
+                weights[z] -= self.fix_signs[z]*self.fix_rows[z].Pi
+            # Pricing every student
+            added = 0
+            for (s_id,value,schedule) in self.price_students(weights,inperson_duals,total_duals):
+                if(value != None and value - convexity_duals[s_id] < -1e-6):
+                    if(self.add_column(s_id,schedule) == True):
+                        added += 1
+            self.master.update()
+            print("Pricing iteration {}: LP {:.2f}, {} new columns".format(iteration,lp_value,added))
+            if(added == 0):
+                return
+
+
+    # Creates the pricing problems (in worker processes if possible)
+    def start_pricing(self,timetable):
+        self.timetable = timetable
+        self.workers = []
+        student_ids = [s.id for s in self.P.students]
+        if(self.number_workers > 1 and "fork" in multiprocessing.get_all_start_methods()):
+            context = multiprocessing.get_context("fork")
+            for w in range(self.number_workers):
+                connection, worker_connection = context.Pipe()
+                worker = context.Process(target=pricing_worker,
+                                         args=(worker_connection,self.P,timetable,student_ids[w::self.number_workers]))
+                worker.start()
+                self.workers.append((worker,connection))
+        else:
+            self.pricing_env = Env(empty=True)
+            self.pricing_env.setParam("OutputFlag",0)
+            self.pricing_env.start()
+            self.pricing = build_pricing_problems(self.P,timetable,student_ids,self.pricing_env)
+
+    # Prices all students with the given weights and duals
+    def price_students(self,weights,inperson_duals,total_duals):
+        if(len(self.workers) == 0):
+            return price_students(self.pricing,weights,inperson_duals,total_duals)
+        for (worker,connection) in self.workers:
+            connection.send((weights,inperson_duals,total_duals))
+        priced = []
+        for (worker,connection) in self.workers:
+            priced += connection.recv()
+        return priced
+
+    # Closes the worker processes
+    def stop_pricing(self):
+        for (worker,connection) in self.workers:
+            connection.send(None)
+            worker.join()
+        self.workers = []
+
+
+"""
+Pricing helper functions (shared by worker processes)
+"""
+
+def build_pricing_problems(P,timetable,student_ids,env):
+    classes = {c.id: c for c in P.classes}
+    students = {s.id: s for s in P.students}
+    return {s_id: StudentPricingProblem(P,timetable,students[s_id],classes,env) for s_id in student_ids}
+
+def price_students(pricing,weights,inperson_duals,total_duals):
+    priced = []
+    for s_id in pricing:
+        value, schedule = pricing[s_id].price(weights,inperson_duals,total_duals)
+        priced.append((s_id,value,schedule))
+    return priced
+
+def pricing_worker(connection,P,timetable,student_ids):
+    env = Env(empty=True)
+    env.setParam("OutputFlag",0)
+    env.start()
+    pricing = build_pricing_problems(P,timetable,student_ids,env)
+    while True:
+        message = connection.recv()
+        if(message == None):
+            break
+        connection.send(price_students(pricing,*message))
+    connection.close()
@@ -0,0 +1,277 @@
+import numpy as np
+import time
+
+# Local packages
+from solution import Solution
+
+
+"""
+Greedy construction of a timetable, used as a starting incumbent for the model.
+"""
+
+class GreedyConstruction():
+    """
+    Classes are given a room and timeset first (most constrained classes first),
+    respecting room time compatibility, room clashes, hybrid capability and
+    required SameAttendees distributions.
+    Students are then sectioned one at a time (required modules first), picking
+    the class of each subpart with the fewest conflicts in the preferred mode.
+    A student that cannot attend a required module is left out of the solution.
+    """
+    def __init__(self,P):
+        self.P = P
+        self.classes = {c.id: c for c in P.classes}
+        self.rooms = {r.id: r for r in P.rooms}
+        self.D_array = P.distribution_arrays["InteriorDistance"]
+        self.adjacency = P.weightedRoomAdjacency
+        # Overlap groups (sets of timesets sharing a timeslot) of each timeset
+        self.timeset_groups = [[] for t in P.timesets]
+        for g,overlaps in enumerate(P.timesetoverlaps):
+            for t in overlaps:
+                self.timeset_groups[t].append(g)
+        self.timeset_groups = [np.array(groups,dtype=np.int64) for groups in self.timeset_groups]
+        # Required SameAttendees partners of each class
+        self.same_attendees = {c_id: set() for c_id in self.classes}
+        for dist in P.distributions:
+            if(dist.required == True and dist.type == "SameAttendees"):
+                for c_id in dist.classes:
+                    self.same_attendees[c_id].update([i for i in dist.classes if i != c_id])
+        # Expected number of students in each class
+        requests = {}
+        for s in P.students:
+            for k_id in s.modules:
+                requests[k_id] = requests.get(k_id,0) + 1
+        self.demand = {}
+        for k in P.modules:
+            for f in k.configs:
+                for p in f.subparts:
+                    for c_id in p.classes:
+                        self.demand[c_id] = requests.get(k.id,0)/(len(k.configs)*len(p.classes))
+
+
+    # Builds the timetable and sections the students
+    def construct(self):
+        start_time = time.time()
+        self.assign_classes()
+        self.section_students()
+        solution = Solution(name=self.P.filename,
+                            number_of_days=self.P.number_of_days,
+                            number_of_weeks=self.P.number_of_weeks)
+        assignments = []
+        for c in self.P.classes:
+            if(c.id in self.assignment):
+                room, online, timeset = self.assignment[c.id]
+                assignments.append((c.id,room,online,timeset))
+        solution.set_classes(self.P,assignments)
+        solution.set_attendance(self.attendance)
+        print("Greedy construction took {:.2f} seconds".format(time.time() - start_time))
+        return solution
+
+
+    """
+    Assigning rooms and timesets
+    """
+
+    # Gives each class the best feasible room and timeset
+    def assign_classes(self):
+        self.assignment = {}
+        # Room usage of the overlap groups (rows follow the adjacency indices)
+        self.room_busy = np.zeros((len(self.P.rooms),len(self.P.timesetoverlaps)),dtype=bool)
+        # Most constrained classes first
+        order = sorted(self.P.classes, key=lambda c: (len(c.rooms)*len(c.timesets),c.id))
+        for c in order:
+            options = self.class_options(c)
+            if(len(options) == 0):
+                print("Warning: No feasible room and timeset for class {}".format(c.id))
+                continue
+            room, online, timeset = self.choose_option(c,options)
+            self.assignment[c.id] = (room, online, timeset)
+            if(room != None):
+                self.room_busy[self.adjacency.id_dictionary[room],self.timeset_groups[timeset]] = True
+
+    # Feasible (room, online, timeset) choices of a class with their score
+    def class_options(self,c):
+        """
+        Scores are compared as tuples: capacity shortfall against the expected
+        demand, then hybrid (in-person and online) classes, then the penalty.
+        """
+        options = []
+        physical_rooms = [r for r in c.rooms if r != 0]
+        for t in c.timesets:
+            # Physical rooms free at this time
+            choices = []
+            for r in physical_rooms:
+                if(self.P.roomtimeCompatibility.compatible(r,t) == False):
+                    continue
+                if(np.any(self.room_busy[self.adjacency.id_dictionary[r],self.timeset_groups[t]])):
+                    continue
+                choices.append((r,None))
+                if(0 in c.rooms and self.rooms[r].hybridcapable == True):
+                    choices.append((r,True))
+            if(0 in c.rooms):
+                choices.append((None,True))
+            for (room,online) in choices:
+                if(self.same_attendee_clash(c,room,online,t) == True):
+                    continue
+                capacity = 0
+                if(room != None):
+                    capacity = self.rooms[room].capacity
+                if(online == True):
+                    capacity = c.sub_limit
+                shortfall = max(self.demand[c.id] - capacity,0)
+                penalty = c.timesets[t]
+                if(room != None):
+                    penalty += c.rooms[room]
+                if(online == True):
+                    penalty += c.rooms[0]
+                hybrid = int(not (room != None and online == True))
+                options.append(((shortfall,hybrid,penalty),(room,online,t)))
+        return options
+
+    # Best scoring choice that leaves every SameAttendees partner of the class with a choice
+    def choose_option(self,c,options):
+        options = sorted(options, key=lambda option: option[0])
+        partners = [self.classes[i] for i in self.same_attendees[c.id] if i not in self.assignment and i in self.classes]
+        if(len(partners) == 0):
+            return options[0][1]
+        for option in options:
+            self.assignment[c.id] = option[1]
+            blocked = any(len(self.class_options(partner)) == 0 for partner in partners)
+            del self.assignment[c.id]
+            if(blocked == False):
+                return option[1]
+        return options[0][1]
+
+    # Checks if a choice breaks a required SameAttendees distribution with an assigned class
+    def same_attendee_clash(self,c,room,online,t):
+        used_rooms = self.used_rooms(room,online)
+        for other_id in self.same_attendees[c.id]:
+            if(other_id not in self.assignment):
+                continue
+            other_room, other_online, other_t = self.assignment[other_id]
+            available = self.D_array[t,other_t]
+            if(available < 0):
+                return True
+            for r1 in used_rooms:
+                for r2 in self.used_rooms(other_room,other_online):
+                    if(self.adjacency.distance(r1,r2) > available):
+                        return True
+        return False
+
+    # Rooms (including the online room) used by an assignment
+    def used_rooms(self,room,online):
+        used = []
+        if(room != None):
+            used.append(room)
+        if(online == True):
+            used.append(0)
+        return used
+
+
+    """
+    Sectioning students
+    """
+
+    # Gives each student classes for as many of their modules as possible
+    def section_students(self):
+        self.attendance = []
+        self.inperson_count = {c_id: 0 for c_id in self.assignment}
+        self.total_count = {c_id: 0 for c_id in self.assignment}
+        modules = {k.id: k for k in self.P.modules}
+        left_out = 0
+        for s in self.P.students:
+            chosen = {}
+            required_attended = True
+            ordered_modules = [k_id for k_id in s.modules if k_id in s.required_modules]
+            ordered_modules += [k_id for k_id in s.modules if k_id not in s.required_modules]
+            for k_id in ordered_modules:
+                module_choice = self.section_module(s,modules[k_id],chosen)
+                if(module_choice == None):
+                    if(k_id in s.required_modules):
+                        required_attended = False
+                        break
+                    continue
+                for c_id in module_choice:
+                    chosen[c_id] = module_choice[c_id]
+                    self.total_count[c_id] += 1
+                    if(module_choice[c_id] == False):
+                        self.inperson_count[c_id] += 1
+            # Students missing a required module are left for the solver
+            if(required_attended == False):
+                for c_id in chosen:
+                    self.total_count[c_id] -= 1
+                    if(chosen[c_id] == False):
+                        self.inperson_count[c_id] -= 1
+                left_out += 1
+                continue
+            for c_id in chosen:
+                self.attendance.append((s.id,c_id,chosen[c_id]))
+        if(left_out != 0):
+            print("Warning: {} students could not be given their required modules".format(left_out))
+
+    # Picks a class from each subpart of the first configuration that can be attended
+    def section_module(self,s,k,chosen):
+        for f in k.configs:
+            config_choice = {}
+            # Parent subparts are sectioned before their children
+            subparts = sorted(f.subparts, key=lambda p: self.class_depth(p.classes[0]))
+            for p in subparts:
+                best = None
+                for c_id in p.classes:
+                    candidate = self.class_candidate(s,c_id,chosen,config_choice)
+                    if(candidate != None and (best == None or candidate[0] < best[0])):
+                        best = candidate
+                if(best == None):
+                    config_choice = None
+                    break
+                config_choice[best[1]] = best[2]
+            if(config_choice != None):
+                return config_choice
+        return None
+
+    # Score, class id and mode (online or not) of the best way of attending a class
+    def class_candidate(self,s,c_id,chosen,config_choice):
+        if(c_id not in self.assignment):
+            return None
+        c = self.classes[c_id]
+        if(self.total_count[c_id] >= c.sub_limit):
+            return None
+        if(c.parent != None and c.parent not in config_choice and c.parent not in chosen):
+            return None
+        room, online, timeset = self.assignment[c_id]
+        best = None
+        for mode_online in [False,True]:
+            if(mode_online == False and (room == None or self.inperson_count[c_id] >= self.rooms[room].capacity)):
+                continue
+            if(mode_online == True and online != True):
+                continue
+            # Conflicts with the classes already chosen for the student
+            conflicts = 0
+            for other in [chosen,config_choice]:
+                for other_id in other:
+                    conflicts += self.student_conflict(c_id,mode_online,other_id,other[other_id])
+            # Mode the student does not prefer (indifferent students leave in-person space free)
+            wrong_mode = int((s.mode_preference == 1 and mode_online == True) or (s.mode_preference == -1 and mode_online == False))
+            if(s.mode_preference == 0):
+                wrong_mode = int(mode_online == False)*0.5
+            score = (conflicts,wrong_mode,self.total_count[c_id])
+            if(best == None or score < best[0]):
+                best = (score,c_id,mode_online)
+        return best
+
+    # Checks if a student can attend two classes in the given modes
+    def student_conflict(self,c1_id,c1_online,c2_id,c2_online):
+        r1, o1, t1 = self.assignment[c1_id]
+        r2, o2, t2 = self.assignment[c2_id]
+        room1 = 0 if c1_online == True else r1
+        room2 = 0 if c2_online == True else r2
+        return int(self.adjacency.distance(room1,room2) > self.D_array[t1,t2])
+
+    # Number of parents above a class
+    def class_depth(self,c_id):
+        depth = 0
+        c = self.classes[c_id]
+        while(c.parent != None and c.parent in self.classes):
+            depth += 1
+            c = self.classes[c.parent]
+        return depth
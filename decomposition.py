@@ -0,0 +1,375 @@
+from gurobipy import quicksum, tupledict, LinExpr, Env # Required for optimisation
+import itertools
+import multiprocessing
+import copy
+import math
+import time
+
+# Local packages
+import instance as inst
+import functions as fn
+from milp_model_construction import ModelObject
+from milp_model_solve import LexicographicOnly
+from evaluation import SolutionEvaluator
+
+
+"""
+Class timetabling model (stage one of the decomposition)
+"""
+
+class ClassTimetablingModel(ModelObject):
+    """
+    The base model built on a copy of the instance without students, so only the
+    class variables (x, yr, yt, g, q, w) and class constraints are created.
+    Students are replaced by an estimated demand for each class:
+    - ModuleRequest: requests of offered modules less the seats missing for the demand
+    - ModePreferences: seats missing in the mode students prefer
+    - StudentConflicts: overlaps of classes every requester of two modules must attend
+    """
+    def __init__(self, problem_instance,
+                 number_cores = None,
+                 node_memory = 1.0,
+                 console_output = True,
+                 time_limit = None,
+                 env = None):
+        self.full_P = problem_instance
+        class_P = copy.copy(problem_instance)
+        class_P.students = []
+        ModelObject.__init__(self, class_P,
+                             number_cores = number_cores,
+                             node_memory = node_memory,
+                             console_output = console_output,
+                             time_limit = time_limit,
+                             env = env)
+        print("Adding estimated demand to model")
+        self.addDemandEstimates()
+
+
+    # Adding the estimated demand variables and constraints
+    def addDemandEstimates(self):
+        rooms = {r.id: r for r in self.P.rooms}
+        classes = {c.id: c for c in self.P.classes}
+        # Requests of each module and how many requesters prefer each mode
+        self.requests = {k.id: 0 for k in self.P.modules}
+        inperson_requests = {k.id: 0 for k in self.P.modules}
+        online_requests = {k.id: 0 for k in self.P.modules}
+        for s in self.full_P.students:
+            for k_id in s.modules:
+                self.requests[k_id] += 1
+                if(s.mode_preference == 1):
+                    inperson_requests[k_id] += 1
+                elif(s.mode_preference == -1):
+                    online_requests[k_id] += 1
+        # Seats missing in each class (demand is spread evenly over configurations and classes)
+        self.u = tupledict()
+        self.v = tupledict()
+        self.o = tupledict()
+        for k in self.P.modules:
+            for f in k.configs:
+                for p in f.subparts:
+                    share = 1/(len(k.configs)*len(p.classes))
+                    for c_id in p.classes:
+                        c = classes[c_id]
+                        inperson_seats = quicksum(rooms[r].capacity*self.yr[c.id,r] for r in c.rooms if r != 0)
+                        online_seats = LinExpr()
+                        if(0 in c.rooms):
+                            online_seats = c.sub_limit*self.yr[c.id,0]
+                        self.u[c.id] = self.M.addVar(lb=0)
+                        self.M.addConstr(self.u[c.id] >= min(self.requests[k.id]*share,c.sub_limit) - inperson_seats - online_seats, name='cdemand')
+                        self.v[c.id] = self.M.addVar(lb=0)
+                        self.M.addConstr(self.v[c.id] >= inperson_requests[k.id]*share - inperson_seats, name='cdemandinperson')
+                        self.o[c.id] = self.M.addVar(lb=0)
+                        if(0 in c.rooms):
+                            self.M.addConstr(self.o[c.id] >= online_requests[k.id]*share*(1 - self.yr[c.id,0]), name='cdemandonline')
+                        else:
+                            self.M.addConstr(self.o[c.id] >= online_requests[k.id]*share, name='cdemandonline')
+        # Overlaps of classes that every requester of both modules attends
+        D_array = self.P.distribution_arrays["InteriorDistance"]
+        compulsory = {}
+        for k in self.P.modules:
+            if(len(k.configs) == 1):
+                compulsory[k.id] = [p.classes[0] for p in k.configs[0].subparts if len(p.classes) == 1]
+        corequests = {}
+        for s in self.full_P.students:
+            for pair in itertools.combinations(sorted(s.modules),2):
+                corequests[pair] = corequests.get(pair,0) + 1
+        self.z = tupledict()
+        self.z_weights = {}
+        for (k1,k2),count in corequests.items():
+            for c1_id in compulsory.get(k1,[]):
+                for c2_id in compulsory.get(k2,[]):
+                    c1 = classes[c1_id]
+                    c2 = classes[c2_id]
+                    overlaps = [(t1,t2) for t1 in c1.timesets for t2 in c2.timesets if D_array[t1,t2] < 0]
+                    if(len(overlaps) == 0):
+                        continue
+                    self.z[c1_id,c2_id] = self.M.addVar(lb=0)
+                    self.z_weights[c1_id,c2_id] = count
+                    for (t1,t2) in overlaps:
+                        self.M.addConstr(self.z[c1_id,c2_id] >= self.yt[c1_id,t1] + self.yt[c2_id,t2] - 1, name='cestimatedconflict')
+        self.M.update()
+        self.clear_objective_cache()
+
+
+    # Estimated student objectives (anything else uses the base model objectives)
+    def build_objective(self,z):
+        if(z == "ModuleRequest"):
+            return quicksum(self.requests[k_id]*var for k_id,var in self.g.items()) - quicksum(self.u.values())
+        elif(z == "ModePreferences"):
+            return quicksum(self.v.values()) + quicksum(self.o.values())
+        elif(z == "StudentConflicts"):
+            return quicksum(self.z_weights[pair]*var for pair,var in self.z.items())
+        return ModelObject.build_objective(self,z)
+
+
+"""
+Two stage decomposition: class timetabling then student sectioning
+"""
+
+class TwoStageDecomposition(LexicographicOnly):
+    """
+    For each ordering the timetable is solved with the estimated demand, then with
+    the timetable fixed the students are sectioned in batches (in worker processes
+    when instance settings are given). Each batch gets a share of the space in every
+    class in proportion to its requests for the class's module, rounded up, and a
+    repair step re-sections the students pushed out of classes over-full from the rounding.
+    """
+    def __init__(self,P,number_cores,node_memory,
+                 batch_size=100,
+                 number_workers=1,
+                 instance_settings=None,
+                 warm_start=None):
+        LexicographicOnly.__init__(self,P,number_cores,node_memory,instance_settings=instance_settings,warm_start=warm_start)
+        self.batch_size = batch_size
+        self.number_workers = number_workers
+        self.evaluator = SolutionEvaluator(P)
+
+
+    # Solve all possible orderings of the objectives given
+    def lexicographic_solve(self,objective_list):
+        results_dictionary = {}
+        for ordering in itertools.permutations(objective_list):
+            [objective_values,solution] = self.lexicographic_solve_ordering(list(ordering))
+            ordering_name = tuple([i[0] for i in ordering])
+            results_dictionary[ordering_name] = [objective_values,solution,self.non_optimal_objectives(list(ordering))]
+        return results_dictionary
+
+    # The decomposition never proves an objective optimal
+    def non_optimal_objectives(self,ordered_objective_list):
+        return [objective[0] for objective in ordered_objective_list]
+
+
+    # Solve a particular ordering of objectives
+    def lexicographic_solve_ordering(self,ordered_objective_list,base_model=None):
+        start_time = time.time()
+        timetable = self.solve_timetable(ordered_objective_list)
+        print("Timetable found after {:.2f} seconds".format(time.time() - start_time))
+        attendance = self.solve_sectioning(timetable,ordered_objective_list)
+        attendance = self.repair_capacity(timetable,attendance,ordered_objective_list)
+        solution = copy.copy(timetable)
+        solution.set_attendance(attendance)
+        print("Students sectioned after {:.2f} seconds".format(time.time() - start_time))
+        objective_values = self.evaluator.objective_values(solution)
+        objective_values = {objective[0]: objective_values[objective[0]] for objective in ordered_objective_list}
+        return objective_values,solution
+
+
+    # Stage one, the class timetable with the estimated demand
+    def solve_timetable(self,ordered_objective_list):
+        if(self.env == None):
+            self.env = Env()
+        class_model = ClassTimetablingModel(self.P,
+                                            number_cores = self.cores,
+                                            node_memory = self.nodemem,
+                                            env = self.env)
+        class_model.set_hierarchical_objectives(ordered_objective_list)
+        if(self.warm_start != None):
+            class_model.set_solution_start(self.warm_start)
+        class_model.solve_model()
+        timetable = class_model.solution
+        # The environment must not exist when the sectioning workers are forked
+        class_model.M.dispose()
+        self.dispose_env()
+        return timetable
+
+
+    # Stage two, sectioning batches of students into the fixed timetable
+    def solve_sectioning(self,timetable,ordered_objective_list):
+        student_ids = [s.id for s in self.P.students]
+        batches = [student_ids[i:i+self.batch_size] for i in range(0,len(student_ids),self.batch_size)]
+        print("Sectioning {} students in {} batches".format(len(student_ids),len(batches)))
+        capacity_shares = self.capacity_shares(timetable,batches)
+        parallel = (self.number_workers > 1 and self.instance_settings != None
+                    and "fork" in multiprocessing.get_all_start_methods())
+        if(parallel == True):
+            total_cores = self.cores
+            if(total_cores == None):
+                total_cores = multiprocessing.cpu_count()
+            worker_cores = max(int(total_cores/self.number_workers),1)
+            context = multiprocessing.get_context("fork")
+            with context.Pool(processes=self.number_workers,
+                              initializer=sectioning_worker_setup,
+                              initargs=(self.instance_settings,)) as pool:
+                batch_arguments = [(timetable,batch,ordered_objective_list,worker_cores,self.nodemem,capacity_left)
+                                   for batch,capacity_left in zip(batches,capacity_shares)]
+                batch_results = pool.starmap(sectioning_batch_worker,batch_arguments)
+        else:
+            if(self.env == None):
+                self.env = Env()
+            batch_results = [solve_sectioning_batch(self.P,timetable,batch,ordered_objective_list,self.cores,self.nodemem,capacity_left,self.env)
+                             for batch,capacity_left in zip(batches,capacity_shares)]
+        attendance = []
+        for batch_attendance in batch_results:
+            attendance += batch_attendance
+        return attendance
+
+
+    # Space in each class for each batch, in proportion to the batch's requests for the class's module
+    def capacity_shares(self,timetable,batches):
+        rooms = {r.id: r for r in self.P.rooms}
+        students = {s.id: s for s in self.P.students}
+        batch_requests = []
+        total_requests = {}
+        for batch in batches:
+            requests = {}
+            for s_id in batch:
+                for k_id in students[s_id].modules:
+                    requests[k_id] = requests.get(k_id,0) + 1
+                    total_requests[k_id] = total_requests.get(k_id,0) + 1
+            batch_requests.append(requests)
+        capacity_shares = []
+        for requests in batch_requests:
+            inperson_left = {}
+            total_left = {}
+            for c in self.P.classes:
+                room, class_online, timeset = timetable.class_assignment(c.id)
+                if(timeset == None):
+                    continue
+                capacity = 0
+                if(room != None):
+                    capacity = rooms[room].capacity
+                share = 0
+                if(total_requests.get(c.module,0) != 0):
+                    share = requests.get(c.module,0)/total_requests[c.module]
+                inperson_left[c.id] = math.ceil(capacity*share)
+                total_left[c.id] = math.ceil(c.sub_limit*share)
+            capacity_shares.append((inperson_left,total_left))
+        return capacity_shares
+
+    # Removes students from over-full classes and sections them again in the space left
+    def repair_capacity(self,timetable,attendance,ordered_objective_list):
+        rooms = {r.id: r for r in self.P.rooms}
+        classes = {c.id: c for c in self.P.classes}
+        inperson_count = {}
+        total_count = {}
+        counted = {}
+        evicted = set()
+        # Later batches give up their places first
+        for (s_id,c_id,online) in attendance:
+            if(s_id in evicted):
+                continue
+            room, class_online, timeset = timetable.class_assignment(c_id)
+            total_count[c_id] = total_count.get(c_id,0) + 1
+            if(online == False):
+                inperson_count[c_id] = inperson_count.get(c_id,0) + 1
+            counted.setdefault(s_id,[]).append((c_id,online))
+            over_inperson = online == False and inperson_count[c_id] > rooms[room].capacity
+            over_total = total_count[c_id] > classes[c_id].sub_limit
+            if(over_inperson or over_total):
+                evicted.add(s_id)
+                # The evicted student's places in their other classes are given up too
+                for (counted_c_id,counted_online) in counted[s_id]:
+                    total_count[counted_c_id] -= 1
+                    if(counted_online == False):
+                        inperson_count[counted_c_id] -= 1
+        if(len(evicted) == 0):
+            return attendance
+        print("Repairing capacity for {} students".format(len(evicted)))
+        kept = [a for a in attendance if a[0] not in evicted]
+        # Space left in each class once the kept students are placed
+        inperson_left = {}
+        total_left = {}
+        for c in self.P.classes:
+            room, class_online, timeset = timetable.class_assignment(c.id)
+            if(timeset == None):
+                continue
+            inperson_left[c.id] = 0
+            if(room != None):
+                inperson_left[c.id] = rooms[room].capacity
+            total_left[c.id] = c.sub_limit
+        for (s_id,c_id,online) in kept:
+            total_left[c_id] -= 1
+            if(online == False):
+                inperson_left[c_id] -= 1
+        if(self.env == None):
+            self.env = Env()
+        repaired = solve_sectioning_batch(self.P,timetable,sorted(evicted),ordered_objective_list,
+                                          self.cores,self.nodemem,
+                                          capacity_left=(inperson_left,total_left),
+                                          env=self.env)
+        return kept + repaired
+
+
+"""
+Student sectioning with a fixed timetable
+"""
+
+# Sections a batch of students, optionally within the space left in each class
+def solve_sectioning_batch(P,timetable,student_ids,ordered_objective_list,number_cores,node_memory,capacity_left=None,env=None):
+    batch_students = set(student_ids)
+    batch_P = copy.copy(P)
+    batch_P.students = [s for s in P.students if s.id in batch_students]
+    fixed_elements = inst.FixedElements(batch_P)
+    fixed_elements.fix_classes(timetable,[c.id for c in P.classes])
+    model = ModelObject(batch_P,
+                        solution = timetable,
+                        fixed_elements = fixed_elements,
+                        number_cores = number_cores,
+                        node_memory = node_memory,
+                        console_output = False,
+                        env = env)
+    # Space left for the batch once other batches are placed
+    if(capacity_left != None):
+        model.limit_capacity(capacity_left[0],capacity_left[1])
+    model.set_hierarchical_objectives(ordered_objective_list)
+    model.optimise_model()
+    if(model.M.SolCount == 0):
+        model.M.dispose()
+        if(len(student_ids) == 1):
+            print("Warning: No sectioning found for student {}".format(student_ids[0]))
+            return []
+        # Sectioning the students one at a time so only the students without a sectioning are left out
+        print("Warning: No sectioning found for a batch of {} students, sectioning them one at a time".format(len(student_ids)))
+        if(capacity_left != None):
+            capacity_left = (dict(capacity_left[0]),dict(capacity_left[1]))
+        attendance = []
+        for s_id in student_ids:
+            student_attendance = solve_sectioning_batch(P,timetable,[s_id],ordered_objective_list,number_cores,node_memory,capacity_left,env)
+            if(capacity_left != None):
+                for (a_s_id,c_id,online) in student_attendance:
+                    capacity_left[1][c_id] -= 1
+                    if(online == False):
+                        capacity_left[0][c_id] -= 1
+            attendance += student_attendance
+        return attendance
+    model.updateSolution()
+    sol = model.solution
+    model.M.dispose()
+    return list(zip(sol.attendance_students.tolist(),sol.attendance_classes.tolist(),sol.attendance_online.tolist()))
+
+
+"""
+Worker processes for parallel sectioning
+"""
+
+worker_instance = None
+worker_env = None
+
+# Loads the instance and creates the environment once in each worker process
+def sectioning_worker_setup(instance_settings):
+    global worker_instance, worker_env
+    worker_instance = fn.instancePrepare(instance_settings)
+    worker_env = Env()
+
+def sectioning_batch_worker(timetable,student_ids,ordered_objective_list,number_cores,node_memory,capacity_left=None):
+    return solve_sectioning_batch(worker_instance,timetable,student_ids,ordered_objective_list,number_cores,node_memory,capacity_left,worker_env)
@@ -0,0 +1,105 @@
+# External packages
+import argparse
+import time
+import pandas as pd
+
+# Local packages
+import functions as fn
+from milp_model_solve import LexicographicOnly, HierarchicalMultiObjective
+from decomposition import TwoStageDecomposition
+from column_generation import ColumnGenerationDecomposition
+
+"""
+Importing arguments
+"""
+
+parser = argparse.ArgumentParser(description='UCTTP solve engine benchmark')
+
+# Filename of instance
+parser.add_argument('--filename', type=str, default = 'wbg-fal10',
+                    help='Filename of the instance stored in data folder (default = wbg-fal10)')
+# Do not add a dummy to instance
+parser.add_argument('--nodummy',action='store_true',
+                    help='Do not build an instance with a dummy room')
+
+# Student count
+parser.add_argument('--studentcount', type=int, default = None,
+                    help='Number of students to be kept in the instance (default = All)')
+# Student count start point
+parser.add_argument('--studentstart', type=int, default = 1,
+                    help='The student that we start the student count from (default = 1)')
+# Online space distance
+parser.add_argument('--onlinedist', type=float, default = 1.5,
+                    help='Distance that the online space is away from physical space (default = 1.5)')
+# Online space distance
+parser.add_argument('--roomcapreduction', type=float, default = 75,
+                    help='Percentage decrease in room capacity e.g. 75 is a four-fold reduction (default = 75)')
+
+# Number of cores for solver
+parser.add_argument('--solvercores', type=int, default = None,
+                    help='Number of cores the solver can use (default = All)')
+# Number of cores for solver
+parser.add_argument('--solvernodefile', type=int, default = 1,
+                    help='Memory in GB before solver creates nodefile (default = 1)')
+# Number of worker processes for sectioning batches
+parser.add_argument('--solverworkers', type=int, default = 1,
+                    help='Number of worker processes sectioning student batches (or pricing schedules) in the decompositions (default = 1)')
+# Students per sectioning batch
+parser.add_argument('--batchsize', type=int, default = 100,
+                    help='Number of students in each sectioning batch of the decomposition (default = 100)')
+
+args = parser.parse_args()
+args.dummy = not args.nodummy
+
+"""
+Importing the instance
+"""
+
+instance_settings = {"filename": args.filename,
+                     "dummyRoomPenaltyScaling": 1,
+                     "dummyRoomDistanceScaling": args.onlinedist,
+                     "addDummy": args.dummy,
+                     "studentcount": args.studentcount,
+                     "studentstart": args.studentstart,
+                     "roomcapreduction": args.roomcapreduction,
+                     "proportion": (1,1,1)}
+P = fn.instancePrepare(instance_settings)
+
+"""
+Running the engines
+"""
+
+objective_list = [("ModuleRequest","Maximise"),("ModePreferences","Minimise"),("StudentConflicts","Minimise")]
+engines = {"LexicographicOnly": LexicographicOnly(P,args.solvercores,args.solvernodefile),
+           "HierarchicalMultiObjective": HierarchicalMultiObjective(P,args.solvercores,args.solvernodefile),
+           "TwoStageDecomposition": TwoStageDecomposition(P,args.solvercores,args.solvernodefile,
+                                                          batch_size=args.batchsize,
+                                                          number_workers=args.solverworkers,
+                                                          instance_settings=instance_settings),
+           "ColumnGenerationDecomposition": ColumnGenerationDecomposition(P,args.solvercores,args.solvernodefile,
+                                                                          number_workers=args.solverworkers,
+                                                                          instance_settings=instance_settings)}
+
+benchmark = pd.DataFrame(data={"Engine":[],"Ordering":[],
+                               "Z1":[],"Z2":[],"Z3":[],
+                               "EngineSeconds":[]})
+for engine_name in engines:
+    engine = engines[engine_name]
+    start_time = time.time()
+    results = engine.lexicographic_solve(objective_list)
+    engine_time = time.time() - start_time
+    for ordering in results:
+        new_row = {"Engine": engine_name,
+                   "Ordering": ordering,
+                   "Z1": results[ordering][0]["ModuleRequest"],
+                   "Z2": results[ordering][0]["ModePreferences"],
+                   "Z3": results[ordering][0]["StudentConflicts"],
+                   "EngineSeconds": engine_time}
+        benchmark = pd.concat([benchmark, pd.DataFrame([new_row])], ignore_index=True)
+
+# Relative gap of each objective to the monolithic lexicographic model
+monolithic = benchmark[benchmark["Engine"] == "LexicographicOnly"]
+for z in ["Z1","Z2","Z3"]:
+    reference = benchmark["Ordering"].map(dict(zip(monolithic["Ordering"],monolithic[z])))
+    benchmark[z+"Gap"] = (benchmark[z] - reference).abs()/reference.abs().clip(lower=1)
+benchmark.to_csv("output/"+str(args.filename)+"_engine_benchmark.csv", index=False)
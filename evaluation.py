@@ -0,0 +1,316 @@
+import numpy as np
+
+# Local packages
+import functions as fn
+
+
+"""
+Objective evaluation and feasibility checking of a solution without building the model.
+"""
+
+class SolutionEvaluator():
+    """
+    Everything that only depends on the instance is prepared once,
+    so many solutions (e.g. from a heuristic) can be scored quickly.
+    Objectives follow the model definitions:
+    - ModuleRequest: requested (non-required) modules with a complete configuration attended
+    - ModePreferences: classes attended in the mode a student does not prefer
+    - StudentConflicts: class pairs a student cannot attend (overlap or travel) that
+      could have a scheduling issue (see skip_student_scheduling_issues)
+    - RoomPenalty and TimesetPenalty: penalties of the rooms and timesets used
+    """
+    def __init__(self,P):
+        self.P = P
+        self.classes = {c.id: c for c in P.classes}
+        self.rooms = {r.id: r for r in P.rooms}
+        self.D_array = P.distribution_arrays["InteriorDistance"]
+        self.adjacency = P.weightedRoomAdjacency
+        # Module structure of each class
+        self.class_ids = np.array(sorted(self.classes),dtype=np.int64)
+        self.class_modules = np.array([self.classes[c_id].module for c_id in self.class_ids],dtype=np.int64)
+        self.class_configs = np.array([self.classes[c_id].module_config for c_id in self.class_ids],dtype=np.int64)
+        self.class_subparts = np.array([self.classes[c_id].module_subpart for c_id in self.class_ids],dtype=np.int64)
+        self.config_subparts = {}
+        for k in P.modules:
+            for f in k.configs:
+                self.config_subparts[k.id,f.id] = len(f.subparts)
+        # Timesets sharing at least one timeslot
+        self.timeset_overlap = np.zeros((len(P.timesets),len(P.timesets)),dtype=bool)
+        for overlaps in P.timesetoverlaps:
+            self.timeset_overlap[np.ix_(overlaps,overlaps)] = True
+        # Students
+        self.student_preferences = {s.id: s.mode_preference for s in P.students}
+        self.student_modules = {s.id: set(s.modules) for s in P.students}
+
+
+    # Position of class ids in the sorted class arrays (-1 for classes not in the instance)
+    def class_positions(self,class_ids):
+        class_ids = np.asarray(class_ids,dtype=np.int64)
+        if(len(self.class_ids) == 0):
+            return np.full(len(class_ids),-1,dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.class_ids, class_ids),len(self.class_ids) - 1)
+        return np.where(self.class_ids[positions] == class_ids, positions, -1)
+
+
+    """
+    Evaluating a solution
+    """
+
+    # Objective values and violated constraints of a solution
+    def evaluate(self,solution):
+        return self.objective_values(solution), self.violations(solution)
+
+    # All objective values of a solution
+    def objective_values(self,solution):
+        index = fn.student_attendance_index(solution)
+        objective_values = {"ModuleRequest": self.module_requests(solution),
+                            "ModePreferences": self.mode_preferences(solution),
+                            "StudentConflicts": self.student_conflicts(solution,index),
+                            "RoomPenalty": self.room_penalty(solution),
+                            "TimesetPenalty": self.timeset_penalty(solution),
+                            "RoomUsage": 0,
+                            "TimesetUsage": 0,
+                            "Switches": 0}
+        return objective_values
+
+    # Number of requested modules attended
+    def module_requests(self,solution):
+        positions = self.class_positions(solution.attendance_classes)
+        # Classes not in the instance or not scheduled are left out (they are StudentClass violations)
+        counted = (positions >= 0) & np.isin(solution.attendance_classes, solution.class_ids)
+        positions = positions[counted]
+        if(len(positions) == 0):
+            return 0
+        # Distinct subparts attended within each (student, module, config)
+        attended = np.unique(np.stack((solution.attendance_students[counted],
+                                       self.class_modules[positions],
+                                       self.class_configs[positions],
+                                       self.class_subparts[positions]),axis=1),axis=0)
+        configs, subpart_counts = np.unique(attended[:,:3], axis=0, return_counts=True)
+        # A module is attended if every subpart of one of its configurations is attended
+        attended_modules = set()
+        for (s_id,k_id,f_id),count in zip(configs.tolist(),subpart_counts.tolist()):
+            if(count == self.config_subparts[k_id,f_id]):
+                attended_modules.add((s_id,k_id))
+        module_requests = 0
+        for s in self.P.students:
+            for k in s.modules:
+                if(k not in s.required_modules and (s.id,k) in attended_modules):
+                    module_requests += 1
+        return module_requests
+
+    # Number of classes attended in the mode that is not preferred
+    def mode_preferences(self,solution):
+        preferences = np.array([self.student_preferences.get(int(s_id),0) for s_id in solution.attendance_students],dtype=np.int64)
+        wrong_mode = ((preferences == 1) & solution.attendance_online) | ((preferences == -1) & ~solution.attendance_online)
+        return int(np.sum(wrong_mode))
+
+    # Number of student conflicts
+    def student_conflicts(self,solution,index=None):
+        return len(self.student_conflict_pairs(solution,index))
+
+    # Students with the pair of classes (smallest id first) they cannot both attend
+    def student_conflict_pairs(self,solution,index=None):
+        if(index == None):
+            index = fn.student_attendance_index(solution)
+        class_rows = index["class_rows"]
+        positions = self.class_positions(solution.class_ids[class_rows])
+        # Classes not in the instance (UnknownClass violations) share no module with any other class
+        known = positions >= 0
+        modules = np.where(known, self.class_modules[positions], -1 - np.arange(len(positions)))
+        configs = np.where(known, self.class_configs[positions], -1)
+        subparts = np.where(known, self.class_subparts[positions], -1)
+        # Where each student is (online is the dummy room) and at what time
+        room_ids = np.where(index["online"], 0, solution.class_rooms[class_rows])
+        room_index = np.array([self.adjacency.id_dictionary[int(r)] for r in room_ids],dtype=np.int64)
+        timesets = solution.class_timesets[class_rows]
+        class_ids = solution.class_ids[class_rows]
+        conflicts = []
+        for size in np.unique(index["group_sizes"]):
+            if(size < 2):
+                continue
+            groups = np.nonzero(index["group_sizes"] == size)[0]
+            first, second = np.triu_indices(size, 1)
+            rows1 = index["group_starts"][groups][:,None] + first[None,:]
+            rows2 = index["group_starts"][groups][:,None] + second[None,:]
+            travel = self.adjacency.array[room_index[rows1], room_index[rows2]]
+            available = self.D_array[timesets[rows1], timesets[rows2]]
+            # Same module classes in different configs or the same subpart are never conflicts
+            same_module = modules[rows1] == modules[rows2]
+            skip = same_module & ((configs[rows1] != configs[rows2]) | (subparts[rows1] == subparts[rows2]))
+            group, pair = np.nonzero((travel > available) & ~skip)
+            students = index["students"][rows1[group,pair]]
+            first_ids = np.minimum(class_ids[rows1[group,pair]], class_ids[rows2[group,pair]])
+            second_ids = np.maximum(class_ids[rows1[group,pair]], class_ids[rows2[group,pair]])
+            conflicts.extend(zip(students.tolist(),first_ids.tolist(),second_ids.tolist()))
+        return conflicts
+
+    # Penalty of the rooms used
+    def room_penalty(self,solution):
+        penalty = 0
+        for i,c_id in enumerate(solution.class_ids):
+            c = self.classes[int(c_id)]
+            if(solution.class_rooms[i] != -1):
+                penalty += c.rooms.get(int(solution.class_rooms[i]),0)
+            if(solution.class_online[i] == True):
+                penalty += c.rooms.get(0,0)
+        return penalty
+
+    # Penalty of the timesets used
+    def timeset_penalty(self,solution):
+        penalty = 0
+        for i,c_id in enumerate(solution.class_ids):
+            penalty += self.classes[int(c_id)].timesets.get(int(solution.class_timesets[i]),0)
+        return penalty
+
+
+    """
+    Checking hard constraints
+    """
+
+    # List of violated constraints, each a tuple starting with the type of violation
+    def violations(self,solution):
+        violations = []
+        violations += self.class_violations(solution)
+        violations += self.room_clash_violations(solution)
+        violations += self.same_attendee_violations(solution)
+        violations += self.capacity_violations(solution)
+        violations += self.student_violations(solution)
+        return violations
+
+    # Classes must use their own rooms and timesets, compatible with each other
+    def class_violations(self,solution):
+        violations = []
+        for i,c_id in enumerate(solution.class_ids):
+            c_id = int(c_id)
+            if(c_id not in self.classes):
+                violations.append(("UnknownClass",c_id))
+                continue
+            c = self.classes[c_id]
+            room = int(solution.class_rooms[i])
+            timeset = int(solution.class_timesets[i])
+            if(timeset not in c.timesets):
+                violations.append(("ClassTimeset",c_id,timeset))
+            if(room != -1 and room not in c.rooms):
+                violations.append(("ClassRoom",c_id,room))
+            if(solution.class_online[i] == True and 0 not in c.rooms):
+                violations.append(("ClassRoom",c_id,0))
+            if(room == -1 and solution.class_online[i] == False):
+                violations.append(("ClassRoom",c_id,None))
+            # Resource compatibility (constraint 9)
+            for r in [room, 0 if solution.class_online[i] == True else -1]:
+                if(r in self.rooms and self.P.roomtimeCompatibility.compatible(r,timeset) == False):
+                    violations.append(("RoomTimeCompatibility",c_id,r,timeset))
+            # Hybrid teaching (constraint 13)
+            if(room != -1 and solution.class_online[i] == True and room in self.rooms):
+                if(self.rooms[room].hybridcapable == False):
+                    violations.append(("Hybrid",c_id,room))
+        return violations
+
+    # Physical rooms cannot host two classes at overlapping times (constraint 14)
+    def room_clash_violations(self,solution):
+        violations = []
+        physical = np.nonzero(solution.class_rooms != -1)[0]
+        order = physical[np.argsort(solution.class_rooms[physical], kind="stable")]
+        rooms = solution.class_rooms[order]
+        if(len(rooms) == 0):
+            return violations
+        starts = np.concatenate(([0], np.nonzero(rooms[1:] != rooms[:-1])[0] + 1, [len(rooms)]))
+        for g in range(len(starts)-1):
+            rows = order[starts[g]:starts[g+1]]
+            if(len(rows) < 2):
+                continue
+            timesets = solution.class_timesets[rows]
+            first, second = np.triu_indices(len(rows), 1)
+            clashes = self.timeset_overlap[timesets[first], timesets[second]]
+            for a,b in zip(first[clashes],second[clashes]):
+                violations.append(("RoomClash",int(rooms[starts[g]]),int(solution.class_ids[rows[a]]),int(solution.class_ids[rows[b]])))
+        return violations
+
+    # Required same attendee distributions (constraint 20)
+    def same_attendee_violations(self,solution):
+        violations = []
+        for dist in self.P.distributions:
+            if(dist.required == True and dist.type == "SameAttendees"):
+                for a in range(len(dist.classes)):
+                    for b in range(a+1,len(dist.classes)):
+                        room1, online1, t1 = solution.class_assignment(dist.classes[a])
+                        room2, online2, t2 = solution.class_assignment(dist.classes[b])
+                        if(t1 == None or t2 == None):
+                            continue
+                        rooms1 = [r for r in [room1, 0 if online1 == True else None] if r != None]
+                        rooms2 = [r for r in [room2, 0 if online2 == True else None] if r != None]
+                        distance = self.D_array[t1,t2]
+                        travel = max([self.adjacency.distance(r1,r2) for r1 in rooms1 for r2 in rooms2] + [0])
+                        if(distance < 0 or travel > distance):
+                            violations.append(("SameAttendees",dist.classes[a],dist.classes[b]))
+        return violations
+
+    # Room capacities and class limits (constraints 31 and 32)
+    def capacity_violations(self,solution):
+        violations = []
+        number_classes = len(solution.class_ids)
+        class_rows = [solution.class_row(int(c_id)) for c_id in solution.attendance_classes]
+        class_rows = np.array([-1 if i == None else i for i in class_rows],dtype=np.int64)
+        scheduled = class_rows >= 0
+        total = np.bincount(class_rows[scheduled], minlength=number_classes)
+        inperson = np.bincount(class_rows[scheduled], weights=(~solution.attendance_online[scheduled]).astype(np.float64), minlength=number_classes)
+        for i,c_id in enumerate(solution.class_ids):
+            c_id = int(c_id)
+            room = int(solution.class_rooms[i])
+            capacity = self.rooms[room].capacity if room in self.rooms else 0
+            if(inperson[i] > capacity):
+                violations.append(("RoomCapacity",c_id,int(inperson[i]),capacity))
+            if(c_id in self.classes and total[i] > self.classes[c_id].sub_limit):
+                violations.append(("ClassLimit",c_id,int(total[i]),self.classes[c_id].sub_limit))
+        return violations
+
+    # Students attend a valid set of classes in an available mode
+    def student_violations(self,solution):
+        violations = []
+        attended = {}
+        for j in range(len(solution.attendance_students)):
+            s_id = int(solution.attendance_students[j])
+            c_id = int(solution.attendance_classes[j])
+            i = solution.class_row(c_id)
+            # Class must be running and offered in that mode (constraints 25 and 26)
+            if(i == None or c_id not in self.classes):
+                violations.append(("StudentClass",s_id,c_id))
+                continue
+            if(solution.attendance_online[j] == True and solution.class_online[i] == False):
+                violations.append(("StudentMode",s_id,c_id,"online"))
+            if(solution.attendance_online[j] == False and solution.class_rooms[i] == -1):
+                violations.append(("StudentMode",s_id,c_id,"inperson"))
+            attended.setdefault(s_id,[]).append(c_id)
+        for s in self.P.students:
+            classes_attended = attended.get(s.id,[])
+            subparts = {}
+            configs = {}
+            for c_id in classes_attended:
+                c = self.classes[c_id]
+                # Only classes of requested modules
+                if(c.module not in self.student_modules[s.id]):
+                    violations.append(("StudentModule",s.id,c_id))
+                # At most one class from a subpart (constraint 29)
+                key = (c.module,c.module_config,c.module_subpart)
+                if(key in subparts):
+                    violations.append(("StudentSubpart",s.id,subparts[key],c_id))
+                subparts[key] = c_id
+                configs.setdefault(c.module,set()).add(c.module_config)
+                # Parent classes must be attended (constraint 33)
+                if(c.parent != None and c.parent not in classes_attended):
+                    violations.append(("StudentParent",s.id,c_id,c.parent))
+            # One complete configuration per module (constraints 27 and 28)
+            for k_id in configs:
+                if(len(configs[k_id]) > 1):
+                    violations.append(("StudentConfig",s.id,k_id))
+                    continue
+                f_id = list(configs[k_id])[0]
+                attended_subparts = len([key for key in subparts if key[0] == k_id and key[1] == f_id])
+                if(attended_subparts != self.config_subparts[k_id,f_id]):
+                    violations.append(("StudentConfig",s.id,k_id))
+            # Compulsory modules must be attended (constraint 23)
+            for k_id in s.required_modules:
+                if(k_id not in configs):
+                    violations.append(("RequiredModule",s.id,k_id))
+        return violations
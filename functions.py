@@ -4,6 +4,7 @@ This file contains many of the functions used to perform tasks outside of optimi
 import numpy as np
 import pickle
 import itertools
+import xml.etree.ElementTree as ET
 
 # Local packages
 import instance as inst
@@ -90,6 +91,48 @@ def instanceImport(filename="NA",
         outfile.close()
     return P
 
+# Imports an instance and applies the modifications described by the settings
+def instancePrepare(settings,force_reset=False):
+    """
+    Settings is a dictionary with the import parameters and modifications
+    so the same instance can be rebuilt from the on-disk cache (e.g. by workers).
+    """
+    P = instanceImport(filename=settings["filename"],
+                       dummyRoomPenaltyScaling=settings["dummyRoomPenaltyScaling"],
+                       dummyRoomDistanceScaling=settings["dummyRoomDistanceScaling"],
+                       addDummy=settings["addDummy"],
+                       force_reset=force_reset)
+    # Thinning the number of students
+    P.remove_students(count=settings["studentcount"],start=settings["studentstart"])
+    # Decreasing room capacity
+    P.reduce_capacity(settings["roomcapreduction"])
+    # Setting student preferences
+    P.student_preferences(proportion=settings["proportion"])
+    return P
+
+# Loads a solution from an ITC2019 solution file or a previous result dump
+def load_solution(P,filename,ordering=None):
+    """
+    Files ending in _dumped are read as the pickled results of main.py,
+    the solution of the given ordering (or the first ordering) is returned.
+    Any other file is read as an ITC2019 <solution> xml file.
+    """
+    from solution import Solution
+    if(filename.endswith("_dumped")):
+        infile = open(filename,"rb")
+        results = pickle.load(infile)
+        infile.close()
+        if(ordering == None):
+            ordering = list(results.keys())[0]
+        print("Loading solution of ordering {} from {}".format(ordering,filename))
+        solution = results[ordering][1]
+        if(isinstance(solution,Solution)):
+            return solution
+    else:
+        print("Loading solution from {}".format(filename))
+        solution = ET.parse(filename).getroot()
+    return Solution.from_xml(P,solution)
+
 """
 Resource relation functions
 """
@@ -366,171 +409,207 @@ Solution analysis
 """
 
 # Attendance breakdown
-def attendance_breakdown(xml_solution):
+def attendance_breakdown(solution,index=None):
     """
     Function finds the attendance metrics for an instance.
     """
-    attendance_breakdown = {"total": 0,
-                            "inperson": 0,
-                            "online": 0}
-    for cls in xml_solution:
-        for student in cls:
-            attendance_breakdown["total"] += 1
-            if(student.attrib["mode"] == "online"):
-                attendance_breakdown["online"] += 1
-            else:
-                attendance_breakdown["inperson"] += 1
+    if(index == None):
+        index = student_attendance_index(solution)
+    online = int(np.sum(index["online"]))
+    total = int(len(index["students"]))
+    attendance_breakdown = {"total": total,
+                            "inperson": total - online,
+                            "online": online}
     return attendance_breakdown
 
 
+# Per student events
+def student_events(solution,index=None):
+    """
+    Builds one event (student, week, day, start, online) for every day and week
+    that an attended class meets on, in one pass over the solution.
+    Events are sorted once by student, week, day and start
+    (ties keep the order of the classes in the solution).
+    """
+    if(index == None):
+        index = student_attendance_index(solution)
+    number_classes = len(solution.class_ids)
+    # Weeks and days each class meets on
+    pair_weeks = []
+    pair_days = []
+    pair_counts = np.zeros(number_classes,dtype=np.int64)
+    for i in range(number_classes):
+        weeks = solution.weeks(i)
+        days = [d for d in solution.days(i) if d <= 7]
+        for w in weeks:
+            for d in days:
+                pair_weeks.append(w)
+                pair_days.append(d)
+        pair_counts[i] = len(weeks)*len(days)
+    pair_weeks = np.array(pair_weeks,dtype=np.int64)
+    pair_days = np.array(pair_days,dtype=np.int64)
+    pair_offsets = np.cumsum(pair_counts) - pair_counts
+    # Class row of each attendance row (grouped by student)
+    class_rows = index["class_rows"]
+    # Expanding the attendance into events
+    event_counts = pair_counts[class_rows]
+    event_total = int(np.sum(event_counts))
+    event_attendance = np.repeat(np.arange(len(class_rows)), event_counts)
+    event_position = np.arange(event_total) - np.repeat(np.cumsum(event_counts) - event_counts, event_counts)
+    event_pairs = pair_offsets[class_rows][event_attendance] + event_position
+    event_class_rows = class_rows[event_attendance]
+    events = {"students": index["students"][event_attendance],
+              "weeks": pair_weeks[event_pairs],
+              "days": pair_days[event_pairs],
+              "starts": solution.class_starts[event_class_rows],
+              "online": index["online"][event_attendance]}
+    # Sorting the events
+    order = np.lexsort((event_class_rows, events["starts"], events["days"], events["weeks"], events["students"]))
+    for key in events:
+        events[key] = events[key][order]
+    return events
+
+
 # Switch counting
-def switch_detection(xml_solution):
+def switch_detection(solution,index=None):
     """
     Functions finds the number of students who at some point,
     switch modes more than once in a single day.
     """
+    events = student_events(solution,index)
+    # Consecutive events on the same day of the same student
+    same_day = ((events["students"][1:] == events["students"][:-1]) &
+                (events["weeks"][1:] == events["weeks"][:-1]) &
+                (events["days"][1:] == events["days"][:-1]))
+    switch = same_day & (events["online"][1:] != events["online"][:-1])
+    # Counting the switches for each student day
+    day_starts = np.concatenate(([0], np.nonzero(~same_day)[0] + 1)).astype(np.int64)
+    day_id = np.cumsum(np.concatenate(([True], ~same_day))) - 1
+    switches_per_day = np.bincount(day_id[1:], weights=switch.astype(np.float64), minlength=len(day_starts))
+    # If switches greater than 2 then log student
     students_who_have_two_switches = []
-    # Finding how many weeks there are
-    max_weeks = 0
-    for cls in xml_solution:
-        if(max(cls.attrib["weeks"]) >= max_weeks):
-            max_weeks = max(cls.attrib["weeks"])
-    all_weeks = [i+1 for i in range(max_weeks)]
-    for week in all_weeks:
-        for day in [1,2,3,4,5,6,7]:
-            # Identify students who take a class on a certain day on a certain week
-            student_list = []
-            for cls in xml_solution:
-                if(day in cls.attrib["days"] and week in cls.attrib["weeks"]):
-                    for student in cls:
-                        student_list.append(student.attrib["id"])
-            student_list = list(set(student_list))
-            # Iterate through these students and identify the start time and mode
-            for s in student_list:
-                activity = []
-                for cls in xml_solution:
-                    if(day in cls.attrib["days"] and week in cls.attrib["weeks"]):
-                        for student in cls:
-                            if(student.attrib["id"] == s):
-                                activity.append((cls.attrib["start"],student.attrib["mode"]))
-                # Sort the activities by starting time and then discard time
-                activity = sorted(activity, key=lambda x: x[0])
-                activity = [x[1] for x in activity]
-                # Count the switches
-                switches = 0
-                for i in range(len(activity)):
-                    if(i != 0):
-                        if(activity[i-1] != activity[i]):
-                            switches += 1
-                # If switches greater than 2 then log student
-                if(switches >= 2):
-                    students_who_have_two_switches.append(s)
-    # Clean up the list of students
-    students_who_have_two_switches = list(set(students_who_have_two_switches))
+    if(len(events["students"]) > 0):
+        students_who_have_two_switches = list(set([int(s) for s in events["students"][day_starts[switches_per_day >= 2]]]))
     switch_breakdown = {"total": len(students_who_have_two_switches), 
                         "students": students_who_have_two_switches}
     return switch_breakdown
 
 
+# Per student attendance index
+def student_attendance_index(solution):
+    """
+    Groups the attendance rows by student (keeping solution order within a student).
+    Returns the class row and mode of each grouped row, and where each student's group starts.
+    Attendance of classes that are not scheduled is left out.
+    """
+    class_rows = [solution.class_row(int(c_id)) for c_id in solution.attendance_classes]
+    class_rows = np.array([-1 if i == None else i for i in class_rows],dtype=np.int64)
+    student_order = np.argsort(solution.attendance_students, kind="stable")
+    student_order = student_order[class_rows[student_order] >= 0]
+    students = solution.attendance_students[student_order]
+    student_ids, group_starts, group_sizes = np.unique(students, return_index=True, return_counts=True)
+    index = {"students": students,
+             "class_rows": class_rows[student_order],
+             "online": solution.attendance_online[student_order],
+             "student_ids": student_ids,
+             "group_starts": group_starts,
+             "group_sizes": group_sizes,
+             "group_index": {int(s_id): i for i,s_id in enumerate(student_ids)}}
+    return index
+
+
 # Electives offered
-def elective_breakdown(P,xml_solution):
+def elective_breakdown(P,solution,index=None):
     """
     Approximates the number of electives attended by each student
     """
+    if(index == None):
+        index = student_attendance_index(solution)
+    # Module of each class in the solution
+    class_module = {c.id: c.module for c in P.classes}
+    row_modules = np.array([class_module.get(int(c_id),-1) for c_id in solution.class_ids],dtype=np.int64)
+    attended_modules = row_modules[index["class_rows"]]
     elective_breakdown = {}
     for s in P.students:
         # Workout what electives exist
         electives = list(set(s.modules)-set(s.required_modules))
-        # Check if elective is attended
-        attended_electives = []
-        for cls in xml_solution:
-            for student in cls:
-                if(student.attrib["id"] == s.id):
-                    for c in P.classes:
-                        if(c.id == cls.attrib["id"]):
-                            attended_electives.append(c.module)
-        # Filter out repeats and recording 100 for no electives
-        attended_electives = list(set(attended_electives))
+        # Recording 100 for no electives
         if(len(electives) == 0):
             elective_breakdown[s.id] = float(100)
             continue
+        # Check if elective is attended (filtering out repeats)
+        attended_electives = []
+        if(s.id in index["group_index"]):
+            i = index["group_index"][s.id]
+            start = index["group_starts"][i]
+            modules = attended_modules[start:start+index["group_sizes"][i]]
+            attended_electives = np.unique(modules[modules != -1])
         # Recording electives if some are requested
         elective_breakdown[s.id] = float((len(attended_electives)/len(electives))*100)
     return elective_breakdown
 
 
 # Conflict breakdown
-def conflict_breakdown(P,xml_solution):
-    """
-    Works out the number of conflicts that each student experiences
-    """
+def conflict_breakdown(P,solution,index=None):
+    """
+    Works out the number of conflicts that each student experiences.
+    Students attending the same number of classes are checked together,
+    comparing every class pair against the travel and interior distances.
+    """
+    if(index == None):
+        index = student_attendance_index(solution)
+    adjacency = P.weightedRoomAdjacency
+    D_array_sameattendee = P.distribution_arrays["InteriorDistance"]
+    # Where each student is (online is the dummy room) and at what time
+    room_ids = np.where(index["online"], 0, solution.class_rooms[index["class_rows"]])
+    room_index = np.array([adjacency.id_dictionary[int(r)] for r in room_ids],dtype=np.int64)
+    timesets = solution.class_timesets[index["class_rows"]]
+    # Checking if a conflicts exist
+    conflicts = np.zeros(len(index["student_ids"]),dtype=np.int64)
+    for size in np.unique(index["group_sizes"]):
+        if(size < 2):
+            continue
+        groups = np.nonzero(index["group_sizes"] == size)[0]
+        first, second = np.triu_indices(size, 1)
+        rows1 = index["group_starts"][groups][:,None] + first[None,:]
+        rows2 = index["group_starts"][groups][:,None] + second[None,:]
+        travel = adjacency.array[room_index[rows1], room_index[rows2]]
+        available = D_array_sameattendee[timesets[rows1], timesets[rows2]]
+        conflicts[groups] = np.sum(travel > available, axis=1)
+    # Recording conflict count
     conflict_breakdown = {}
     for s in P.students:
-        # Working out what classes are taken by this student, how they attend, and what time
-        classes_taken = []
-        for cls in xml_solution:
-            for student in cls:
-                if(student.attrib["id"] == s.id):
-                    # Recording the class
-                    class_id = cls.attrib["id"]
-                    # Recording the room
-                    if(student.attrib["mode"] == "online"):
-                        room_id = 0
-                    else:
-                        room_id = cls.attrib["room"]
-                    # Recording the timeset
-                    for t in P.timesets:
-                        if(t.weeks == cls.attrib["weeks"] and
-                           t.days == cls.attrib["days"] and
-                           t.start == cls.attrib["start"] and
-                           t.length == cls.attrib["length"]):
-                            timeset_id = t.id
-                            break
-                    # Recoridng tuple
-                    classes_taken.append((class_id,room_id,timeset_id))
-        # Checking if a conflicts exist
-        D_array_sameattendee = P.distribution_arrays["InteriorDistance"]
-        conflict_count = 0
-        class_pair_combos = itertools.combinations(classes_taken, 2)
-        for pair in class_pair_combos:
-            c1 = pair[0]
-            c2 = pair[1]
-            if(P.weightedRoomAdjacency.distance(c1[1],c2[1]) > D_array_sameattendee[c1[2],c2[2]]):
-                conflict_count += 1
-        # Recording conflict count
-        conflict_breakdown[s.id] = conflict_count
+        if(s.id in index["group_index"]):
+            conflict_breakdown[s.id] = int(conflicts[index["group_index"][s.id]])
+        else:
+            conflict_breakdown[s.id] = 0
     return conflict_breakdown
 
 
 # Mode breakdown
-def mode_breakdown(P,xml_solution):
+def mode_breakdown(P,solution,index=None):
     """
     This function takes a problem instance and solution and for each student
     identifies the percentage of classes attended in correct mode.
     """
+    if(index == None):
+        index = student_attendance_index(solution)
+    online_counts = np.zeros(len(index["student_ids"]),dtype=np.int64)
+    if(len(index["group_starts"]) > 0):
+        online_counts = np.add.reduceat(index["online"].astype(np.int64), index["group_starts"])
     mode_breakdown_dictionary = {}
     for s in P.students:
-        # Skipping students who don't care, checking those who do
-        if(s.mode_preference == 0):
+        # Skipping students who don't care and recording 100 if none attended
+        if(s.mode_preference == 0 or s.id not in index["group_index"]):
             mode_breakdown_dictionary[s.id] = float(100)
             continue
-        elif(s.mode_preference == 1):
-            ideal = "inperson"
-        else:
-            ideal = "online"
         # Checking
-        class_count = 0
-        correct_mode = 0
-        for cls in xml_solution:
-            for student in cls:
-                if(student.attrib["id"] == s.id):
-                    class_count += 1
-                    if(student.attrib["mode"] == ideal):
-                        correct_mode += 1
-        # Recording 100 if none attended
-        if(class_count == 0):
-            mode_breakdown_dictionary[s.id] = float(100)
-            continue
+        class_count = int(index["group_sizes"][index["group_index"][s.id]])
+        online_count = int(online_counts[index["group_index"][s.id]])
+        if(s.mode_preference == 1):
+            correct_mode = class_count - online_count
+        else:
+            correct_mode = online_count
         # Recording percentage if attended
         mode_breakdown_dictionary[s.id] = float((correct_mode/class_count)*100)
-    return mode_breakdown_dictionary
\ No newline at end of file
+    return mode_breakdown_dictionary
@@ -426,21 +426,23 @@ class Problem():
     def student_preferences(self,proportion=(1,1,1)):
         print("Modifying student preferences with the proportion {}".format(proportion))
         total_students_considered = 0
+        if(sum(proportion) == 0):
+            return
         while True:
             # First
-            for i in range(proportion[0]):
+            for i in range(min(proportion[0],len(self.students) - total_students_considered)):
                 self.students[total_students_considered].mode_preference = 1
                 total_students_considered += 1
             if(total_students_considered == len(self.students)):
                 break
             # Second
-            for i in range(proportion[1]):
+            for i in range(min(proportion[1],len(self.students) - total_students_considered)):
                 self.students[total_students_considered].mode_preference = 0
                 total_students_considered += 1
             if(total_students_considered == len(self.students)):
                 break
             # Third
-            for i in range(proportion[2]):
+            for i in range(min(proportion[2],len(self.students) - total_students_considered)):
                 self.students[total_students_considered].mode_preference = -1
                 total_students_considered += 1
             if(total_students_considered == len(self.students)):
@@ -481,6 +483,12 @@ class AdjacencyArray():
                 self.array[0,i] = float(max_distance*dummy_scaling)
                 self.array[i,0] = float(max_distance*dummy_scaling)
     
+    # Moves the dummy room to a new multiple of the largest physical distance
+    def set_dummy_distance(self,dummy_scaling):
+        max_distance = self.array[1:,1:].max()
+        self.array[0,1:] = float(max_distance*dummy_scaling)
+        self.array[1:,0] = float(max_distance*dummy_scaling)
+
     def distance(self,room_id1,room_id2):
         rindex1 = self.id_dictionary[room_id1]
         rindex2 = self.id_dictionary[room_id2]
@@ -681,12 +689,39 @@ class FixedElements:
 
     # Fixing students
     # Fix students -> fix a selection of classes
-    def fix_students(solution,student_ids):
-        pass
+    def fix_students(self,solution,student_ids):
+        """
+        The variables of a fixed student depend on the rooms and timesets
+        of the classes they attend, so those classes are also fixed.
+        """
+        for s_id in student_ids:
+            if(s_id not in self.students):
+                self.students.append(s_id)
+            for c_id in solution.student_attendance(s_id):
+                if(c_id not in self.classes):
+                    self.classes.append(c_id)
+
     # Fixing classes
     # Fix classes -> maybe end up fixing students
-    def fix_classes(solution,class_ids):
-        pass
+    def fix_classes(self,solution,class_ids):
+        for c_id in class_ids:
+            if(c_id not in self.classes):
+                self.classes.append(c_id)
+
+    # Fixing everything apart from a neighbourhood of classes and students
+    def fix_all_except(self,solution,free_classes,free_students):
+        """
+        Students attending a free class are also left free
+        (a fixed student needs the classes they attend to be fixed).
+        """
+        free_students = set(free_students)
+        for c_id in free_classes:
+            i = solution.class_row(c_id)
+            if(i != None):
+                for j in solution.attendance_rows(i):
+                    free_students.add(int(solution.attendance_students[j]))
+        self.classes = [c.id for c in self.P.classes if c.id not in free_classes]
+        self.students = [s.id for s in self.P.students if s.id not in free_students]
             
             
         
@@ -0,0 +1,367 @@
+import numpy as np
+import random as rd
+import copy
+import math
+import time
+
+
+# Objectives that depend on the sectioning (the others are fixed by the timetable)
+sectioning_objectives = ["ModuleRequest","ModePreferences","StudentConflicts"]
+
+
+"""
+Local search over the student sectioning of a fixed timetable.
+"""
+
+class SectioningLocalSearch():
+    """
+    Simulated annealing with the classes kept in place. The moves are
+    - swapping a student to another class of the same subpart
+    - switching the mode (online or in-person) a student attends a class in
+    - dropping or adding a requested (non-required) module
+    The change in ModuleRequest, ModePreferences and StudentConflicts of a move is
+    found from the student's own classes only, conflicts are counted against the
+    InteriorDistance array and the room adjacency array.
+    The objectives are combined with weights of level_weight per priority level for
+    the annealing, the best solution is kept by comparing the objectives in order.
+    """
+    def __init__(self,P,seed=0,level_weight=1000):
+        self.P = P
+        self.random = rd.Random(seed)
+        self.level_weight = level_weight
+        self.classes = {c.id: c for c in P.classes}
+        self.rooms = {r.id: r for r in P.rooms}
+        self.students = {s.id: s for s in P.students}
+        self.modules = {k.id: k for k in P.modules}
+        self.config_subparts = {}
+        for k in P.modules:
+            for f in k.configs:
+                self.config_subparts[k.id,f.id] = len(f.subparts)
+        self.D_array = P.distribution_arrays["InteriorDistance"]
+        self.adjacency = P.weightedRoomAdjacency
+
+
+    # Improves the sectioning of a solution for an ordering of the objectives
+    def improve(self,solution,ordered_objective_list,time_limit=60,iterations=None,temperature=1.0,cooling=0.9995):
+        start_time = time.time()
+        self.prepare_timetable(solution)
+        self.prepare_students(solution)
+        if(len(self.student_ids) == 0):
+            print("Local search skipped, no students to move")
+            return solution
+        self.set_weights(ordered_objective_list)
+        current = self.objective_array()
+        best = current.copy()
+        best_schedule = self.copy_schedule()
+        print("Local search start {}".format(dict(zip(sectioning_objectives,current.tolist()))))
+        iteration = 0
+        accepted = 0
+        while(time.time() - start_time < time_limit and (iterations == None or iteration < iterations)):
+            iteration += 1
+            move = self.random_move()
+            if(move == None):
+                continue
+            delta = move[-1]
+            energy = float(np.dot(self.weights,delta))
+            if(energy <= 0 or self.random.random() < math.exp(-energy/max(temperature,1e-9))):
+                self.apply_move(move)
+                current += delta
+                accepted += 1
+                if(self.key(current) < self.key(best)):
+                    best = current.copy()
+                    best_schedule = self.copy_schedule()
+            temperature *= cooling
+        print("Local search accepted {} of {} moves in {:.2f} seconds, best {}".format(
+            accepted,iteration,time.time() - start_time,dict(zip(sectioning_objectives,best.tolist()))))
+        improved = copy.copy(solution)
+        improved.set_attendance(self.attendance(best_schedule))
+        return improved
+
+
+    """
+    Preparing the timetable and the students
+    """
+
+    # Arrays over the rows of the solution's class arrays
+    def prepare_timetable(self,solution):
+        self.solution = solution
+        number_classes = len(solution.class_ids)
+        class_list = [self.classes[int(c_id)] for c_id in solution.class_ids]
+        self.class_modules = np.array([c.module for c in class_list],dtype=np.int64)
+        self.class_configs = np.array([c.module_config for c in class_list],dtype=np.int64)
+        self.class_subparts = np.array([c.module_subpart for c in class_list],dtype=np.int64)
+        self.class_timesets = solution.class_timesets
+        # Adjacency index of where a student is in each mode (online is the dummy room)
+        self.inperson_room = np.array([self.adjacency.id_dictionary[int(r)] if r != -1 else -1 for r in solution.class_rooms],dtype=np.int64)
+        self.online_room = self.adjacency.id_dictionary[0]
+        self.can_online = solution.class_online.copy()
+        self.capacity = np.array([self.rooms[int(r)].capacity if r != -1 else 0 for r in solution.class_rooms],dtype=np.int64)
+        self.sub_limit = np.array([c.sub_limit for c in class_list],dtype=np.int64)
+        self.parent_row = np.array([-1 if c.parent == None or solution.class_row(c.parent) == None else solution.class_row(c.parent) for c in class_list],dtype=np.int64)
+        self.inperson_count = np.zeros(number_classes,dtype=np.int64)
+        self.total_count = np.zeros(number_classes,dtype=np.int64)
+        # Scheduled classes of each subpart
+        self.subpart_rows = {}
+        for i in range(number_classes):
+            key = (int(self.class_modules[i]),int(self.class_configs[i]),int(self.class_subparts[i]))
+            self.subpart_rows.setdefault(key,[]).append(i)
+
+    # Class rows and modes attended by each student, with the class counts
+    def prepare_students(self,solution):
+        self.schedule = {s.id: [] for s in self.P.students}
+        for j in range(len(solution.attendance_students)):
+            i = solution.class_row(int(solution.attendance_classes[j]))
+            s_id = int(solution.attendance_students[j])
+            if(i == None or s_id not in self.schedule):
+                continue
+            online = bool(solution.attendance_online[j])
+            self.schedule[s_id].append([i,online])
+            self.total_count[i] += 1
+            if(online == False):
+                self.inperson_count[i] += 1
+        self.student_ids = [s_id for s_id in self.schedule if len(self.students[s_id].modules) != 0]
+
+    # Minimisation weights of the objectives for the annealing
+    def set_weights(self,ordered_objective_list):
+        self.weights = np.zeros(len(sectioning_objectives))
+        self.signs = np.zeros(len(sectioning_objectives))
+        self.priority = []
+        ordered = [objective for objective in ordered_objective_list if objective[0] in sectioning_objectives]
+        for level,objective in enumerate(ordered):
+            z = sectioning_objectives.index(objective[0])
+            self.signs[z] = -1 if objective[1] == "Maximise" else 1
+            self.weights[z] = self.signs[z]*self.level_weight**(len(ordered) - 1 - level)
+            self.priority.append(z)
+
+    # Objectives compared in order (all minimised)
+    def key(self,values):
+        return tuple(self.signs[z]*values[z] for z in self.priority)
+
+
+    """
+    Counting objectives
+    """
+
+    # Objective values of the current sectioning
+    def objective_array(self):
+        values = np.zeros(len(sectioning_objectives))
+        for s_id in self.student_ids:
+            schedule = self.schedule[s_id]
+            values[0] += len(self.requested_modules(s_id,schedule))
+            values[1] += sum(self.wrong_mode(s_id,online) for (i,online) in schedule)
+            for a in range(len(schedule)):
+                values[2] += self.conflicts(schedule[a][0],schedule[a][1],schedule[a+1:])
+        return values
+
+    # Non-required modules with classes in the schedule
+    def attended_optional_modules(self,s_id,schedule):
+        s = self.students[s_id]
+        return set(int(self.class_modules[i]) for (i,online) in schedule if int(self.class_modules[i]) not in s.required_modules)
+
+    # Non-required requested modules with every subpart of a configuration in the schedule
+    def requested_modules(self,s_id,schedule):
+        s = self.students[s_id]
+        subparts = {}
+        for (i,online) in schedule:
+            subparts.setdefault((int(self.class_modules[i]),int(self.class_configs[i])),set()).add(int(self.class_subparts[i]))
+        return set(k_id for (k_id,f_id),attended in subparts.items()
+                   if k_id in s.modules and k_id not in s.required_modules and len(attended) == self.config_subparts[k_id,f_id])
+
+    # Attending in the mode the student does not prefer
+    def wrong_mode(self,s_id,online):
+        preference = self.students[s_id].mode_preference
+        return int((preference == 1 and online == True) or (preference == -1 and online == False))
+
+    # Conflicts of a class attended in a mode with a list of attended classes
+    def conflicts(self,i,online,others):
+        if(len(others) == 0):
+            return 0
+        rows = np.array([o[0] for o in others],dtype=np.int64)
+        modes = np.array([o[1] for o in others],dtype=bool)
+        rooms = np.where(modes, self.online_room, self.inperson_room[rows])
+        room = self.online_room if online == True else self.inperson_room[i]
+        travel = self.adjacency.array[room,rooms]
+        available = self.D_array[self.class_timesets[i],self.class_timesets[rows]]
+        # Same module classes in different configs or the same subpart are never conflicts
+        same_module = self.class_modules[rows] == self.class_modules[i]
+        skip = same_module & ((self.class_configs[rows] != self.class_configs[i]) | (self.class_subparts[rows] == self.class_subparts[i]))
+        return int(np.sum((travel > available) & ~skip))
+
+
+    """
+    Moves
+    """
+
+    # A random move of a random student with its objective change (or None)
+    def random_move(self):
+        s_id = self.student_ids[self.random.randrange(len(self.student_ids))]
+        move_type = self.random.random()
+        if(move_type < 0.4):
+            return self.swap_move(s_id)
+        if(move_type < 0.8):
+            return self.mode_move(s_id)
+        if(move_type < 0.9):
+            return self.drop_move(s_id)
+        return self.add_move(s_id)
+
+    # Another class of the same subpart for one of the student's classes
+    def swap_move(self,s_id):
+        schedule = self.schedule[s_id]
+        if(len(schedule) == 0):
+            return None
+        a = self.random.randrange(len(schedule))
+        i, online = schedule[a]
+        key = (int(self.class_modules[i]),int(self.class_configs[i]),int(self.class_subparts[i]))
+        attended = set(row for (row,mode) in schedule)
+        # Classes that are parents of other attended classes stay
+        if(any(self.parent_row[row] == i for row in attended)):
+            return None
+        options = [j for j in self.subpart_rows[key] if j != i and (self.parent_row[j] == -1 or self.parent_row[j] in attended)]
+        if(len(options) == 0):
+            return None
+        j = options[self.random.randrange(len(options))]
+        modes = [mode for mode in [online,not online] if self.has_space(j,mode)]
+        if(len(modes) == 0):
+            return None
+        new_online = modes[0]
+        others = schedule[:a] + schedule[a+1:]
+        delta = np.zeros(len(sectioning_objectives))
+        delta[1] = self.wrong_mode(s_id,new_online) - self.wrong_mode(s_id,online)
+        delta[2] = self.conflicts(j,new_online,others) - self.conflicts(i,online,others)
+        return ("swap",s_id,[(a,j,new_online)],delta)
+
+    # Changing the mode of one of the student's classes
+    def mode_move(self,s_id):
+        schedule = self.schedule[s_id]
+        if(len(schedule) == 0):
+            return None
+        a = self.random.randrange(len(schedule))
+        i, online = schedule[a]
+        # The student keeps their place in the class limit
+        if(online == False and self.can_online[i] == False):
+            return None
+        if(online == True and (self.inperson_room[i] == -1 or self.inperson_count[i] >= self.capacity[i])):
+            return None
+        others = schedule[:a] + schedule[a+1:]
+        delta = np.zeros(len(sectioning_objectives))
+        delta[1] = self.wrong_mode(s_id,not online) - self.wrong_mode(s_id,online)
+        delta[2] = self.conflicts(i,not online,others) - self.conflicts(i,online,others)
+        return ("swap",s_id,[(a,i,not online)],delta)
+
+    # Removing every class of an attended non-required module
+    def drop_move(self,s_id):
+        schedule = self.schedule[s_id]
+        modules = sorted(self.attended_optional_modules(s_id,schedule))
+        if(len(modules) == 0):
+            return None
+        k_id = modules[self.random.randrange(len(modules))]
+        dropped = [a for a,(i,online) in enumerate(schedule) if self.class_modules[i] == k_id]
+        kept = [schedule[a] for a in range(len(schedule)) if a not in dropped]
+        delta = np.zeros(len(sectioning_objectives))
+        delta[0] = -int(k_id in self.requested_modules(s_id,schedule))
+        for a in dropped:
+            i, online = schedule[a]
+            delta[1] -= self.wrong_mode(s_id,online)
+            delta[2] -= self.conflicts(i,online,kept)
+        # Conflicts between the dropped classes themselves
+        dropped_classes = [schedule[a] for a in dropped]
+        for b in range(len(dropped_classes)):
+            delta[2] -= self.conflicts(dropped_classes[b][0],dropped_classes[b][1],dropped_classes[b+1:])
+        return ("drop",s_id,dropped,delta)
+
+    # Attending a random configuration of a requested module that is not attended
+    def add_move(self,s_id):
+        s = self.students[s_id]
+        schedule = self.schedule[s_id]
+        attended_modules = set(int(self.class_modules[i]) for (i,online) in schedule)
+        modules = [k_id for k_id in s.modules if k_id not in attended_modules and k_id in self.modules]
+        if(len(modules) == 0):
+            return None
+        k = self.modules[modules[self.random.randrange(len(modules))]]
+        f = k.configs[self.random.randrange(len(k.configs))]
+        added = []
+        attended = set(row for (row,mode) in schedule)
+        # Parent subparts before their children
+        subparts = sorted(f.subparts, key=lambda p: self.subpart_depth(k.id,f.id,p.id))
+        for p in subparts:
+            options = []
+            for j in self.subpart_rows.get((k.id,f.id,p.id),[]):
+                if(self.parent_row[j] != -1 and self.parent_row[j] not in attended):
+                    continue
+                for mode in [False,True]:
+                    if(self.has_space(j,mode)):
+                        options.append((j,mode))
+            if(len(options) == 0):
+                return None
+            choice = options[self.random.randrange(len(options))]
+            added.append(choice)
+            attended.add(choice[0])
+        delta = np.zeros(len(sectioning_objectives))
+        if(k.id not in s.required_modules and len(added) == self.config_subparts[k.id,f.id]):
+            delta[0] = 1
+        current = list(schedule)
+        for (j,mode) in added:
+            delta[1] += self.wrong_mode(s_id,mode)
+            delta[2] += self.conflicts(j,mode,current)
+            current.append([j,mode])
+        return ("add",s_id,added,delta)
+
+    # Space left for one more student in a mode
+    def has_space(self,i,online):
+        if(self.total_count[i] >= self.sub_limit[i]):
+            return False
+        if(online == True):
+            return bool(self.can_online[i])
+        return self.inperson_room[i] != -1 and self.inperson_count[i] < self.capacity[i]
+
+    # Number of parents above the classes of a subpart
+    def subpart_depth(self,k_id,f_id,p_id):
+        rows = self.subpart_rows.get((k_id,f_id,p_id),[])
+        if(len(rows) == 0):
+            return 0
+        depth = 0
+        i = rows[0]
+        while(self.parent_row[i] != -1):
+            depth += 1
+            i = self.parent_row[i]
+        return depth
+
+    # Updates the schedule and class counts with a move
+    def apply_move(self,move):
+        move_type, s_id, changes, delta = move
+        schedule = self.schedule[s_id]
+        if(move_type == "swap"):
+            for (a,j,online) in changes:
+                self.count(schedule[a][0],schedule[a][1],-1)
+                schedule[a] = [j,online]
+                self.count(j,online,1)
+        elif(move_type == "drop"):
+            for a in changes:
+                self.count(schedule[a][0],schedule[a][1],-1)
+            self.schedule[s_id] = [schedule[a] for a in range(len(schedule)) if a not in changes]
+        elif(move_type == "add"):
+            for (j,online) in changes:
+                schedule.append([j,online])
+                self.count(j,online,1)
+
+    # Changes the class counts for a student in a mode
+    def count(self,i,online,change):
+        self.total_count[i] += change
+        if(online == False):
+            self.inperson_count[i] += change
+
+
+    """
+    Results
+    """
+
+    def copy_schedule(self):
+        return {s_id: [list(entry) for entry in schedule] for s_id,schedule in self.schedule.items()}
+
+    # Attendance tuples of a schedule
+    def attendance(self,schedule):
+        attendance = []
+        for s_id in schedule:
+            for (i,online) in schedule[s_id]:
+                attendance.append((s_id,int(self.solution.class_ids[i]),online))
+        return attendance
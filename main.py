@@ -7,7 +7,14 @@ import pandas as pd
 import functions as fn
 import instance as inst
 from milp_model_construction import ModelObject
-from milp_model_solve import LexicographicOnly
+from milp_model_solve import LexicographicOnly, HierarchicalMultiObjective, LargeNeighbourhoodSearch, RollingStudentBatches
+from solution_analysis import SolutionAnalysis
+from construction import GreedyConstruction
+from decomposition import TwoStageDecomposition
+from column_generation import ColumnGenerationDecomposition
+from local_search import SectioningLocalSearch
+from evaluation import SolutionEvaluator
+from pareto import EpsilonConstraintPareto
 import xml.etree.ElementTree as ET
 
 """
@@ -42,12 +49,39 @@ parser.add_argument('--roomcapreduction', type=float, default = 75,
                     help='Percentage decrease in room capacity e.g. 75 is a four-fold reduction (default = 75)')
 
 
+# Solution method
+parser.add_argument('--engine', type=str, default = 'lexicographic', choices = ['lexicographic','hierarchical','rolling','lns','decomposition','columngeneration'],
+                    help='Lexicographic stages, the solver hierarchical multi-objective, hierarchical with students added in rolling batches, large neighbourhood search, two stage decomposition or decomposition with column generation sectioning (default = lexicographic)')
+# Solution used as the starting incumbent
+parser.add_argument('--warmstart', type=str, default = None,
+                    help='ITC2019 solution file or previous output/<filename>_dumped to start from (default = None)')
+# Greedy starting incumbent
+parser.add_argument('--greedystart',action='store_true',
+                    help='Start the first stage of each ordering from a greedy construction (ignored with --warmstart)')
 # Timelimit for solver
 parser.add_argument('--timelimit', type=int, default = None,
-                    help='Time limit for the solver (default = None)')
+                    help='Time limit in seconds shared by the stages of the lexicographic engine or the orderings of the hierarchical engine, or the large neighbourhood search budget (default = None, or 600 for lns)')
+# Time limit of each large neighbourhood search iteration
+parser.add_argument('--lnsiterationtime', type=int, default = 60,
+                    help='Time limit in seconds for each neighbourhood solve, the total budget is --timelimit (default = 60)')
+# Students per sectioning batch of the decomposition (or per batch added by the rolling engine)
+parser.add_argument('--batchsize', type=int, default = 100,
+                    help='Number of students in each sectioning batch of the decomposition or added at a time by the rolling engine (default = 100)')
+# Checkpoint of the completed stages
+parser.add_argument('--checkpoint',action='store_true',
+                    help='Store completed lexicographic stages in output/<filename>_checkpoint and resume from it if it exists')
+# Local search on the sectioning of each result
+parser.add_argument('--polishtime', type=int, default = None,
+                    help='Seconds of local search on the student sectioning of each ordering after solving (default = None)')
+# Epsilon-constraint Pareto front
+parser.add_argument('--paretogrid', type=int, default = None,
+                    help='Number of bounds per objective in an epsilon-constraint grid for the Pareto front after solving (default = None)')
 # Number of cores for solver
 parser.add_argument('--solvercores', type=int, default = None,
                     help='Number of cores the solver can use (default = All)')
+# Number of worker processes for orderings
+parser.add_argument('--solverworkers', type=int, default = None,
+                    help='Number of worker processes solving orderings in parallel (default = None, sequential)')
 # Number of cores for solver
 parser.add_argument('--solvernodefile', type=int, default = 1,
                     help='Memory in GB before solver creates nodefile (default = 1)')
@@ -55,38 +89,110 @@ parser.add_argument('--solvernodefile', type=int, default = 1,
 
 args = parser.parse_args()
 args.dummy = not args.nodummy
+# The time limit is only shared out by the lexicographic, hierarchical and lns engines
+if(args.timelimit != None and args.engine in ['rolling','decomposition','columngeneration']):
+    parser.error("--timelimit is not supported by the {} engine".format(args.engine))
 
 """
 Importing the instance
 """
 
-P = fn.instanceImport(filename=args.filename,
-                      dummyRoomPenaltyScaling=1,
-                      dummyRoomDistanceScaling=args.onlinedist, 
-                      addDummy=args.dummy, 
-                      force_reset=args.reset)
+instance_settings = {"filename": args.filename,
+                     "dummyRoomPenaltyScaling": 1,
+                     "dummyRoomDistanceScaling": args.onlinedist,
+                     "addDummy": args.dummy,
+                     "studentcount": args.studentcount,
+                     "studentstart": args.studentstart,
+                     "roomcapreduction": args.roomcapreduction,
+                     "proportion": (1,1,1)}
 
 """
 Modifying the instance
 """
 
-# Thinning the number of students
-P.remove_students(count=args.studentcount,start=args.studentstart)
-# Decreasing room capacity
-P.reduce_capacity(args.roomcapreduction)
-# Setting student preferences
-P.student_preferences(proportion=(1,1,1))
+# Thinning students, decreasing room capacity and setting student preferences
+P = fn.instancePrepare(instance_settings, force_reset=args.reset)
 
 """
 Applying a method
 """
 
-LexModel = LexicographicOnly(P,args.solvercores,args.solvernodefile)
+warm_start = None
+if(args.warmstart != None):
+    warm_start = fn.load_solution(P,args.warmstart)
+elif(args.greedystart == True):
+    warm_start = GreedyConstruction(P).construct()
+if(args.engine == 'hierarchical'):
+    LexModel = HierarchicalMultiObjective(P,args.solvercores,args.solvernodefile,instance_settings=instance_settings,warm_start=warm_start,
+                                          time_limit=args.timelimit)
+elif(args.engine == 'rolling'):
+    LexModel = RollingStudentBatches(P,args.solvercores,args.solvernodefile,
+                                     batch_size=args.batchsize,
+                                     instance_settings=instance_settings,
+                                     warm_start=warm_start)
+elif(args.engine == 'lns'):
+    time_budget = args.timelimit
+    if(time_budget == None):
+        time_budget = 600
+    LexModel = LargeNeighbourhoodSearch(P,args.solvercores,args.solvernodefile,
+                                        time_budget=time_budget,
+                                        iteration_time=args.lnsiterationtime,
+                                        instance_settings=instance_settings,
+                                        warm_start=warm_start)
+elif(args.engine == 'decomposition'):
+    number_workers = args.solverworkers
+    if(number_workers == None):
+        number_workers = 1
+    LexModel = TwoStageDecomposition(P,args.solvercores,args.solvernodefile,
+                                     batch_size=args.batchsize,
+                                     number_workers=number_workers,
+                                     instance_settings=instance_settings,
+                                     warm_start=warm_start)
+elif(args.engine == 'columngeneration'):
+    number_workers = args.solverworkers
+    if(number_workers == None):
+        number_workers = 1
+    LexModel = ColumnGenerationDecomposition(P,args.solvercores,args.solvernodefile,
+                                             number_workers=number_workers,
+                                             instance_settings=instance_settings,
+                                             warm_start=warm_start)
+else:
+    checkpoint = None
+    if(args.checkpoint == True):
+        checkpoint = "output/"+str(args.filename)+"_checkpoint"
+    LexModel = LexicographicOnly(P,args.solvercores,args.solvernodefile,instance_settings=instance_settings,warm_start=warm_start,
+                                 time_limit=args.timelimit,checkpoint=checkpoint)
 objective_list = [("ModuleRequest","Maximise"),("ModePreferences","Minimise"),("StudentConflicts","Minimise")]
 #objective_list = [("ModuleRequest","Maximise"),("ModePreferences","Minimise")]
-results = LexModel.lexicographic_solve(objective_list)
+if(args.solverworkers != None and args.engine == 'lexicographic'):
+    results = LexModel.lexicographic_solve_parallel(objective_list,args.solverworkers)
+else:
+    results = LexModel.lexicographic_solve(objective_list)
+# Orderings without a solution (time limit or infeasible stage) are left out
+for ordering in [ordering for ordering in results if results[ordering][1] is None]:
+    print("Warning: No solution found for {}".format(ordering))
+    del results[ordering]
+if(args.polishtime != None):
+    evaluator = SolutionEvaluator(P)
+    senses = dict(objective_list)
+    for ordering in results:
+        ordered_objective_list = [(z,senses[z]) for z in ordering]
+        solution = SectioningLocalSearch(P).improve(results[ordering][1],ordered_objective_list,time_limit=args.polishtime)
+        objective_values = evaluator.objective_values(solution)
+        results[ordering] = [{z: objective_values[z] for z in ordering},solution,results[ordering][2]]
 for ordering in results:
     print(ordering,results[ordering][0],results[ordering][1])
+if(args.paretogrid != None):
+    # The engine's environment must not exist when the Pareto workers are forked
+    LexModel.dispose_env()
+    number_workers = args.solverworkers
+    if(number_workers == None):
+        number_workers = 1
+    pareto_front = EpsilonConstraintPareto(P,args.solvercores,args.solvernodefile,
+                                           grid_points=args.paretogrid,
+                                           number_workers=number_workers,
+                                           instance_settings=instance_settings,
+                                           warm_start=warm_start).pareto_solve(objective_list,results)
    
     
 """
@@ -112,40 +218,68 @@ table4 = pd.DataFrame(data={"Instance":[P.filename],
                             "Hybrid":[fn.hybrid_capable_count(P)]})
 table4.to_csv("output/"+str(args.filename)+"_table4.csv", index=False)
 
+# Each solution is only indexed once for Table 5 and Table 6
+analyses = {}
+for ordering in results:
+    analyses[ordering] = SolutionAnalysis(P,results[ordering][1])
+
 # Table 5
 table5 = pd.DataFrame(data={"Ordering":[],
                             "Z1":[],"Z2":[],"Z3":[],
                             "Total":[],"IP":[],"ONL":[],
                             "Switch":[]})
 for ordering in results:
+    attendance = analyses[ordering].attendance_breakdown()
     new_row = {"Ordering": ordering,
                 "Z1":results[ordering][0]["ModuleRequest"],
                 "Z2":results[ordering][0]["ModePreferences"],
                 "Z3":results[ordering][0]["StudentConflicts"],
-                "Total":fn.attendance_breakdown(results[ordering][1])["total"],
-                "IP":fn.attendance_breakdown(results[ordering][1])["inperson"],
-                "ONL":fn.attendance_breakdown(results[ordering][1])["online"],
-                "Switch":fn.switch_detection(results[ordering][1])["total"]}
+                "Total":attendance["total"],
+                "IP":attendance["inperson"],
+                "ONL":attendance["online"],
+                "Switch":analyses[ordering].switch_detection()["total"]}
+    # Stages stopped by the time limit
+    if(args.timelimit != None):
+        new_row["NonOptimal"] = " ".join(results[ordering][2])
     table5 = pd.concat([table5, pd.DataFrame([new_row])], ignore_index=True)
 table5.to_csv("output/"+str(args.filename)+"_table5.csv", index=False)
 
+# Pareto set
+if(args.paretogrid != None):
+    pareto = pd.DataFrame(data={"Z1":[],"Z2":[],"Z3":[],
+                                "Total":[],"IP":[],"ONL":[],
+                                "Switch":[]})
+    for result in pareto_front:
+        objective_values = result[0]
+        analysis = SolutionAnalysis(P,result[1])
+        attendance = analysis.attendance_breakdown()
+        new_row = {"Z1":objective_values["ModuleRequest"],
+                   "Z2":objective_values["ModePreferences"],
+                   "Z3":objective_values["StudentConflicts"],
+                   "Total":attendance["total"],
+                   "IP":attendance["inperson"],
+                   "ONL":attendance["online"],
+                   "Switch":analysis.switch_detection()["total"]}
+        pareto = pd.concat([pareto, pd.DataFrame([new_row])], ignore_index=True)
+    pareto.to_csv("output/"+str(args.filename)+"_pareto.csv", index=False)
+
 # Table 6
 data_prep = {"Ordering":[],"Measure":[]}
 for s in P.students:
     data_prep[s.id] = []
 table6 = pd.DataFrame(data=data_prep)
 for ordering in results:
-    solution_for_order = results[ordering][1]
+    analysis = analyses[ordering]
     # Adding the electives
     new_row = {"Ordering": ordering, "Measure": "Electives"}
-    new_row.update(fn.elective_breakdown(P,solution_for_order))
+    new_row.update(analysis.elective_breakdown())
     table6 = pd.concat([table6, pd.DataFrame([new_row])], ignore_index=True)
     # Adding the conflicts
     new_row = {"Ordering": ordering, "Measure": "Conflict"}
-    new_row.update(fn.conflict_breakdown(P,solution_for_order))
+    new_row.update(analysis.conflict_breakdown())
     table6 = pd.concat([table6, pd.DataFrame([new_row])], ignore_index=True)
     # Adding the mode
     new_row = {"Ordering": ordering, "Measure": "Mode"}
-    new_row.update(fn.mode_breakdown(P,solution_for_order))
+    new_row.update(analysis.mode_breakdown())
     table6 = pd.concat([table6, pd.DataFrame([new_row])], ignore_index=True)
 table6.to_csv("output/"+str(args.filename)+"_table6.csv", index=False)
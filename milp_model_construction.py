@@ -9,6 +9,8 @@ import xml.etree.ElementTree as ET
 # Local packages
 import functions as fn
 from instance import FixedElements
+from solution import Solution
+from evaluation import SolutionEvaluator
 
 """
 Model object
@@ -24,12 +26,16 @@ class ModelObject:
                  console_output = True,
                  feasible_only = False,
                  presolve = -1,
-                 mipgap = 0):
+                 mipgap = 0,
+                 time_limit = None,
+                 env = None):
         
         # Required variables
         self.P = problem_instance
         
-        # Optional input
+        # Optional input (solution trees are converted to the compact solution)
+        if(isinstance(solution,ET.Element)):
+            solution = Solution.from_xml(self.P,solution)
         self.solution = solution
         self.fixed_elements = fixed_elements
         self.inactive_constraints = inactive_constraints
@@ -41,7 +47,22 @@ class ModelObject:
         self.feasible_only = feasible_only
         self.presolve = presolve
         self.mipgap = mipgap
+        self.time_limit = time_limit
+        self.env = env
         
+        # Objective expressions built so far (cleared when variables change)
+        self.objective_cache = {}
+        self.objective_terms_cache = {}
+        # Best value the current objective can take, the solve stops once it is reached
+        self.objective_target = None
+        # Objective last set, set again when students are added or removed
+        self.objective_setting = None
+        # Mode preference rows of each student and class (constraint 34)
+        self.preference_constraints = {}
+        # Rows involving the online room: (constraint, room 1, room 2, time available, rhs, relaxed rhs)
+        self.online_distance_constraints = []
+        self.built_online_distance = self.P.dummyRoomDistanceScaling
+
         # Building the model
         self.inititialise_model()
 
@@ -65,8 +86,12 @@ class ModelObject:
         """
         This function creates the model and embeds all of the solver options.
         """
-        # Creating model with or without output
-        if(self.console_output != True):
+        # Creating model with or without output (in a shared environment if given)
+        if(self.env != None):
+            self.M = Model("University timetabling problem", env = self.env)
+            if(self.console_output != True):
+                self.M.Params.OutputFlag = 0
+        elif(self.console_output != True):
             env = Env(empty=True)
             env.setParam("OutputFlag",0)
             env.start()
@@ -81,6 +106,8 @@ class ModelObject:
             self.M.Params.Threads = self.number_cores
         self.M.Params.Presolve = self.presolve
         self.M.Params.MIPGap = self.mipgap
+        if(self.time_limit != None):
+            self.M.Params.TimeLimit = self.time_limit
         
     
     """
@@ -93,42 +120,143 @@ class ModelObject:
     
     def optimise_model(self):
         print("Optimising the model")
+        # The solve stops once the incumbent reaches the objective target
+        if(self.objective_target != None):
+            self.M.Params.BestObjStop = self.objective_target
+        else:
+            self.M.Params.BestObjStop = -GRB.INFINITY*self.M.ModelSense
         self.M.optimize()
+
+    # Checks if the incumbent reached the objective target (so it is optimal)
+    def target_reached(self):
+        if(self.objective_target == None or self.M.SolCount == 0):
+            return False
+        return self.M.ModelSense*(self.M.ObjVal - self.objective_target) <= 1e-6
     
+    # Values of every variable in the current incumbent
+    def get_incumbent(self):
+        return np.array(self.M.getAttr("X", self.M.getVars()))
+
+    # Uses the values of a previous incumbent as the MIP start
+    def set_start(self,incumbent):
+        self.M.setAttr("Start", self.M.getVars(), list(incumbent))
+        self.M.update()
+
+    # Uses a solution (e.g. an ITC2019 solution file or a previous result) as the MIP start
+    def set_solution_start(self,solution):
+        """
+        Every class and offering variable is given a start value from the timetable.
+        Student variables are only given start values for students with attendance
+        in the solution, the rest are left for the solver to complete (partial start).
+        """
+        if(isinstance(solution,ET.Element)):
+            solution = Solution.from_xml(self.P,solution)
+        start = {}
+        # Class variables
+        for c in self.P.classes:
+            room, online, timeset = solution.class_assignment(c.id)
+            for r in c.rooms:
+                used = (r == room) or (r == 0 and online == True)
+                start[self.yr[c.id,r]] = int(used)
+                for t in c.timesets:
+                    start[self.x[c.id,r,t]] = int(used and t == timeset)
+            for t in c.timesets:
+                start[self.yt[c.id,t]] = int(t == timeset)
+        # Offering variables
+        for k in self.P.modules:
+            for f in k.configs:
+                for p in f.subparts:
+                    offered = any(solution.class_row(c_id) != None for c_id in p.classes)
+                    start[self.w[k.id,f.id,p.id]] = int(offered)
+                start[self.q[k.id,f.id]] = min(start[self.w[k.id,f.id,p.id]] for p in f.subparts)
+            start[self.g[k.id]] = max(start[self.q[k.id,f.id]] for f in k.configs)
+        # Student variables
+        classes = {c.id: c for c in self.P.classes}
+        student_attendance = {}
+        for s_id,c_id,online in zip(solution.attendance_students.tolist(),
+                                    solution.attendance_classes.tolist(),
+                                    solution.attendance_online.tolist()):
+            student_attendance.setdefault(s_id,{})[c_id] = "online" if online else "inperson"
+        for s in self.P.students:
+            if(s.id not in student_attendance):
+                continue
+            attended_classes = student_attendance[s.id]
+            classes_for_student = []
+            for k in self.P.modules:
+                if(k.id in s.modules):
+                    for f in k.configs:
+                        for p in f.subparts:
+                            for c_id in p.classes:
+                                c = classes[c_id]
+                                classes_for_student.append(c_id)
+                                mode = attended_classes.get(c_id)
+                                online = int(mode == "online")
+                                inperson = int(mode == "inperson")
+                                start[self.a[s.id,k.id,f.id,p.id,c_id]] = online + inperson
+                                start[self.alphaonl[s.id,c_id]] = online
+                                start[self.alphainp[s.id,c_id]] = inperson
+                                start[self.tau[s.id,c_id]] = int(s.mode_preference*(online - inperson) > 0)
+                                for t in c.timesets:
+                                    start[self.betaonl[s.id,c_id,t]] = online*start[self.yt[c_id,t]]
+                                    start[self.betainp[s.id,c_id,t]] = inperson*start[self.yt[c_id,t]]
+                                    for r in c.rooms:
+                                        if(r == 0):
+                                            start[self.gamma[s.id,c_id,r,t]] = start[self.betaonl[s.id,c_id,t]]*start[self.yr[c_id,r]]
+                                        else:
+                                            start[self.gamma[s.id,c_id,r,t]] = start[self.betainp[s.id,c_id,t]]*start[self.yr[c_id,r]]
+                            start[self.b[s.id,k.id,f.id,p.id]] = max(start[self.a[s.id,k.id,f.id,p.id,c_id]] for c_id in p.classes)
+                        start[self.m[s.id,k.id,f.id]] = min(start[self.b[s.id,k.id,f.id,p.id]] for p in f.subparts)
+                    start[self.n[s.id,k.id]] = max(start[self.m[s.id,k.id,f.id]] for f in k.configs)
+            for pair in itertools.combinations(classes_for_student, 2):
+                start[self.h[s.id,min(pair),max(pair)]] = 0
+        # Conflicts of the students given start values
+        for (s_id,c1_id,c2_id) in SolutionEvaluator(self.P).student_conflict_pairs(solution):
+            if(s_id in student_attendance and (s_id,c1_id,c2_id) in self.h):
+                start[self.h[s_id,c1_id,c2_id]] = 1
+        # Setting the start (anything not given a value is left undefined)
+        self.M.setAttr("Start", self.M.getVars(), [GRB.UNDEFINED]*self.M.NumVars)
+        self.M.setAttr("Start", list(start.keys()), list(start.values()))
+        self.M.update()
+
     def updateSolution(self):
         print("Creating model solution file")
-        # Creating the main file
-        sol = ET.Element("solution")
-        sol.attrib["name"] = self.P.filename
-        # Adding the classes that are being ran
+        # Retrieving the values of each variable family at once
+        x_values = self.M.getAttr("X", self.x)
+        alphaonl_values = self.M.getAttr("X", self.alphaonl)
+        alphainp_values = self.M.getAttr("X", self.alphainp)
+        # Grouping the students attending each class
+        class_attendees = {}
+        for var in alphaonl_values:
+            if(alphaonl_values[var] != 0):
+                class_attendees.setdefault(var[1],[]).append((var[0],True))
+            if(alphainp_values[var] != 0):
+                class_attendees.setdefault(var[1],[]).append((var[0],False))
+        # Finding the room and timeset of the classes that are being ran
+        assignments = []
+        attendance = []
         for c in self.P.classes:
-            class_info = {"id": c.id, "room": None, "online": None}
+            room = None
+            online = None
+            timeset = None
             for r in c.rooms:
                 for t in c.timesets:
-                    if(self.x[c.id,r,t].X != 0):
-                        # Appending the time
-                        timeset = self.P.timesets[t]
-                        class_info["days"] = timeset.days
-                        class_info["start"] = timeset.start
-                        class_info["length"] = timeset.length
-                        class_info["weeks"] = timeset.weeks
-                        # Appending the room
+                    if(x_values[c.id,r,t] != 0):
+                        timeset = t
                         if(r == 0):
-                            class_info["online"] = True
+                            online = True
                         else:
-                            class_info["room"] = r
-            if(len(class_info) > 3):
-                cls_add = ET.SubElement(sol, "class")
-                cls_add.attrib = class_info
+                            room = r
+            if(timeset != None):
+                assignments.append((c.id,room,online,timeset))
                 # Adding the students who are attending this class
-                for var in self.alphaonl:
-                    if(self.alphaonl[var].X != 0 and var[1] == c.id):
-                        student_add = ET.SubElement(cls_add, "student")
-                        student_add.attrib = {"id": var[0], "mode": "online"}
-                    if(self.alphainp[var].X != 0 and var[1] == c.id):
-                        student_add = ET.SubElement(cls_add, "student")
-                        student_add.attrib = {"id": var[0], "mode": "inperson"}
+                for (s_id,online_mode) in class_attendees.get(c.id,[]):
+                    attendance.append((s_id,c.id,online_mode))
         # Saving solution to the object (replaces any input solution)
+        sol = Solution(name=self.P.filename,
+                       number_of_days=self.P.number_of_days,
+                       number_of_weeks=self.P.number_of_weeks)
+        sol.set_classes(self.P,assignments)
+        sol.set_attendance(attendance)
         self.solution = sol
 
     """
@@ -143,6 +271,8 @@ class ModelObject:
         self.addVarBaseStudent()
         # Update the model
         self.M.update()
+        # Any cached objectives refer to the old variables
+        self.clear_objective_cache()
     
     # Adding the x variables
     def addVarBaseX(self):
@@ -192,32 +322,37 @@ class ModelObject:
         self.h = tupledict()
         # Adding variables for each student
         for s in self.P.students:
-            classes_for_student = []
-            for k in self.P.modules:
-                if(k.id in s.modules):
-                    self.n[s.id,k.id] = self.M.addVar(vtype=GRB.BINARY)
-                    for f in k.configs:
-                        self.m[s.id,k.id,f.id] = self.M.addVar(vtype=GRB.BINARY)
-                        for p in f.subparts:
-                            self.b[s.id,k.id,f.id,p.id] = self.M.addVar(vtype=GRB.BINARY)
-                            for c in self.P.classes:
-                                if(c.id in p.classes):
-                                    self.a[s.id,k.id,f.id,p.id,c.id] = self.M.addVar(vtype=GRB.BINARY)
-                                    self.alphaonl[s.id,c.id] = self.M.addVar(vtype=GRB.BINARY)
-                                    self.alphainp[s.id,c.id] = self.M.addVar(vtype=GRB.BINARY)
-                                    self.tau[s.id,c.id] = self.M.addVar(vtype=GRB.BINARY)
-                                    classes_for_student.append(c.id)
-                                    for t in c.timesets:
-                                        self.betaonl[s.id,c.id,t] = self.M.addVar(vtype=GRB.BINARY)
-                                        self.betainp[s.id,c.id,t] = self.M.addVar(vtype=GRB.BINARY)
-                                        for r in c.rooms:
-                                            self.gamma[s.id,c.id,r,t] = self.M.addVar(vtype=GRB.BINARY)
-            class_pair_combos = itertools.combinations(classes_for_student, 2)
-            for pair in class_pair_combos:
-                if(pair[0] < pair[1]):
-                    self.h[s.id,pair[0],pair[1]] = self.M.addVar(vtype=GRB.BINARY)
-                else:
-                    self.h[s.id,pair[1],pair[0]] = self.M.addVar(vtype=GRB.BINARY)
+            self.addStudentVariables(s)
+
+    # Adding the variables of a single student
+    def addStudentVariables(self,s):
+        classes_for_student = []
+        for k in self.P.modules:
+            if(k.id in s.modules):
+                self.n[s.id,k.id] = self.M.addVar(vtype=GRB.BINARY)
+                for f in k.configs:
+                    self.m[s.id,k.id,f.id] = self.M.addVar(vtype=GRB.BINARY)
+                    for p in f.subparts:
+                        self.b[s.id,k.id,f.id,p.id] = self.M.addVar(vtype=GRB.BINARY)
+                        for c in self.P.classes:
+                            if(c.id in p.classes):
+                                self.a[s.id,k.id,f.id,p.id,c.id] = self.M.addVar(vtype=GRB.BINARY)
+                                self.alphaonl[s.id,c.id] = self.M.addVar(vtype=GRB.BINARY)
+                                self.alphainp[s.id,c.id] = self.M.addVar(vtype=GRB.BINARY)
+                                self.tau[s.id,c.id] = self.M.addVar(vtype=GRB.BINARY)
+                                classes_for_student.append(c.id)
+                                for t in c.timesets:
+                                    self.betaonl[s.id,c.id,t] = self.M.addVar(vtype=GRB.BINARY)
+                                    self.betainp[s.id,c.id,t] = self.M.addVar(vtype=GRB.BINARY)
+                                    for r in c.rooms:
+                                        self.gamma[s.id,c.id,r,t] = self.M.addVar(vtype=GRB.BINARY)
+        class_pair_combos = itertools.combinations(classes_for_student, 2)
+        for pair in class_pair_combos:
+            if(pair[0] < pair[1]):
+                self.h[s.id,pair[0],pair[1]] = self.M.addVar(vtype=GRB.BINARY)
+            else:
+                self.h[s.id,pair[1],pair[0]] = self.M.addVar(vtype=GRB.BINARY)
+        return classes_for_student
                     
 
     """
@@ -228,48 +363,35 @@ class ModelObject:
         # Retrieving fixed elements
         fixed_classes = self.fixed_elements.classes
         fixed_students = self.fixed_elements.students
+        # Lookups shared by every fixed class and student
+        classes = {c.id: c for c in self.P.classes}
+        students = {s.id: s for s in self.P.students}
+        attendance = {}
+        for s_id,c_id,online in zip(self.solution.attendance_students.tolist(),
+                                    self.solution.attendance_classes.tolist(),
+                                    self.solution.attendance_online.tolist()):
+            attendance.setdefault(s_id,{})[c_id] = "online" if online == True else "inperson"
 
         # Fixing the x, yr and yt variables
         for fc in fixed_classes:
-            self.fix_class_variables(fc)  
+            self.fix_class_variables(fc,classes)
         # Fixing the g, q and w variables (course offering variables)
         # Fixing the student related variables
         for fs in fixed_students:
-            self.fix_student_variables(fs)
+            self.fix_student_variables(fs,students,classes,attendance.get(fs,{}))
 
     # Fixing the class variables
-    def fix_class_variables(self,fc):
+    def fix_class_variables(self,fc,classes=None):
         """
         Takes a fixed class and fixes the x variables and
         also fixes the yt and yr variables for a class. 
         """
-        solution = self.solution
         # Getting the class object
-        for c_check in self.P.classes:
-            if(c_check.id == fc):
-                c = c_check
-                break
+        if(classes == None):
+            classes = {c.id: c for c in self.P.classes}
+        c = classes[fc]
         # Check if class has an allocation at all
-        timeset = None
-        room = None
-        online = None
-        for c_sol in solution:
-            if(c_sol.attrib['id'] == fc):
-                # Locations
-                room = c_sol.attrib['room']
-                online = c_sol.attrib['online']
-                # Timeset
-                days = c_sol.attrib['online']
-                start = c_sol.attrib['start']
-                length = c_sol.attrib['length']
-                weeks = c_sol.attrib['weeks']
-                for t in self.P.timesets:
-                    if(t.days == days and
-                       t.start == start and
-                       t.length == length and
-                       t.weeks == weeks):
-                        timeset = t.id
-                break
+        room, online, timeset = self.solution.class_assignment(fc)
         # Fixing the x variables
         for r in c.rooms:
             for t in c.timesets:
@@ -302,56 +424,47 @@ class ModelObject:
                 self.yt[c.id,t].lb = 0
 
     # Fixing the student variables
-    def fix_student_variables(self,fs):
+    def fix_student_variables(self,fs,students=None,classes=None,attended_classes=None):
         """
         Takes a student and ensures that they still attend
         the same classes in the same mode.
         It fixes the variables associated with that student.
+        The lookups are built here if they are not given.
         """
         solution = self.solution
         # Getting the student who is fixed
-        for s_check in self.P.students:
-            if(s_check.id == fs):
-                s = s_check
-                break
+        if(students == None):
+            students = {s.id: s for s in self.P.students}
+        s = students[fs]
+        if(classes == None):
+            classes = {c.id: c for c in self.P.classes}
         # Getting all of the classes that student fs is attending (with mode)
-        attended_classes = {}
-        for c_sol in solution:
-            for s_sol in c_sol:
-                if(s_sol.attrib['id'] == fs):
-                    attended_classes[c_sol.attrib['id']] = s_sol.attrib['mode']
+        if(attended_classes == None):
+            attended_classes = solution.student_attendance(fs)
         # Fixing the "a" student variable
         classes_for_student = []
         for k in self.P.modules:
             if(k.id in s.modules):
                 for f in k.configs:
                     for p in f.subparts:
-                        for c in self.P.classes:
-                            if(c.id in p.classes):
-                                classes_for_student.append(c.id)
-                                if(c.id in list(attended_classes.keys())):
-                                    self.a[s.id,k.id,f.id,p.id,c.id].ub = 1
-                                    self.a[s.id,k.id,f.id,p.id,c.id].lb = 1
+                        for c_id in p.classes:
+                            if(c_id in classes):
+                                classes_for_student.append(c_id)
+                                if(c_id in attended_classes):
+                                    self.a[s.id,k.id,f.id,p.id,c_id].ub = 1
+                                    self.a[s.id,k.id,f.id,p.id,c_id].lb = 1
                                 else:
-                                    self.a[s.id,k.id,f.id,p.id,c.id].ub = 0
-                                    self.a[s.id,k.id,f.id,p.id,c.id].lb = 0
+                                    self.a[s.id,k.id,f.id,p.id,c_id].ub = 0
+                                    self.a[s.id,k.id,f.id,p.id,c_id].lb = 0
         # Fixing the alphas and taus
         for c_id in classes_for_student:
-            if(c_id not in list(attended_classes.keys())):
+            if(c_id not in attended_classes):
                 self.alphaonl[s.id,c_id].ub = 0
                 self.alphaonl[s.id,c_id].lb = 0
                 self.alphainp[s.id,c_id].ub = 0
                 self.alphainp[s.id,c_id].lb = 0
                 self.tau[s.id,c_id].ub = 0
                 self.tau[s.id,c_id].lb = 0
-                for t in c.timesets:
-                    self.betaonl[s.id,c_id,t].ub = 0
-                    self.betaonl[s.id,c_id,t].lb = 0
-                    self.betainp[s.id,c_id,t].ub = 0
-                    self.betainp[s.id,c_id,t].lb = 0
-                    for r in c.rooms:
-                        self.gamma[s.id,c_id,t,r,t].ub = 0
-                        self.gamma[s.id,c_id,t,r,t].lb = 0
             elif(attended_classes[c_id] == "online"):
                 self.alphaonl[s.id,c_id].ub = 1
                 self.alphaonl[s.id,c_id].lb = 1
@@ -376,126 +489,62 @@ class ModelObject:
                     self.tau[s.id,c_id].lb = 0
         # Fixing the betas and gammas
         for c_id in classes_for_student:
-            # Getting class object
-            for c_check in self.P.classes:
-                if(c_check.id == c_id):
-                    c = c_check
-                    break 
-            # Fixing elements
-            if(c_id not in list(attended_classes.keys())):    
-                for t in c.timesets:
+            c = classes[c_id]
+            room, online, timeset = solution.class_assignment(c_id)
+            for t in c.timesets:
+                if(c_id not in attended_classes or timeset != t):
                     self.betaonl[s.id,c_id,t].ub = 0
                     self.betaonl[s.id,c_id,t].lb = 0
                     self.betainp[s.id,c_id,t].ub = 0
                     self.betainp[s.id,c_id,t].lb = 0
                     for r in c.rooms:
-                        self.gamma[s.id,c_id,t,r,t].ub = 0
-                        self.gamma[s.id,c_id,t,r,t].lb = 0
-            else:
-                # Getting properties of solution
-                for c_sol in solution:
-                    if(c_sol.attrib['id'] == c_id):
-                        # Locations
-                        room = c_sol.attrib['room']
-                        # Timeset
-                        days = c_sol.attrib['online']
-                        start = c_sol.attrib['start']
-                        length = c_sol.attrib['length']
-                        weeks = c_sol.attrib['weeks']
-                        for t in self.P.timesets:
-                            if(t.days == days and
-                            t.start == start and
-                            t.length == length and
-                            t.weeks == weeks):
-                                timeset = t.id
-                        break
-                # Fixing the variables
-                for t in c.timesets:
-                    if(timeset != t):
-                        self.betaonl[s.id,c_id,t].ub = 0
-                        self.betaonl[s.id,c_id,t].lb = 0
-                        self.betainp[s.id,c_id,t].ub = 0
-                        self.betainp[s.id,c_id,t].lb = 0
-                        for r in c.rooms:
-                            self.gamma[s.id,c_id,t,r,t].ub = 0
-                            self.gamma[s.id,c_id,t,r,t].lb = 0
-                    else:
-                        if(attended_classes[c_id] == "online"):
-                            self.betaonl[s.id,c_id,t].ub = 1
-                            self.betaonl[s.id,c_id,t].lb = 1
-                            self.betainp[s.id,c_id,t].ub = 0
-                            self.betainp[s.id,c_id,t].lb = 0
-                            for r in c.rooms:
-                                if(r == 0):
-                                    self.gamma[s.id,c_id,t,r,t].ub = 1
-                                    self.gamma[s.id,c_id,t,r,t].lb = 1
-                                else:
-                                    self.gamma[s.id,c_id,t,r,t].ub = 0
-                                    self.gamma[s.id,c_id,t,r,t].lb = 0
+                        self.gamma[s.id,c_id,r,t].ub = 0
+                        self.gamma[s.id,c_id,r,t].lb = 0
+                elif(attended_classes[c_id] == "online"):
+                    self.betaonl[s.id,c_id,t].ub = 1
+                    self.betaonl[s.id,c_id,t].lb = 1
+                    self.betainp[s.id,c_id,t].ub = 0
+                    self.betainp[s.id,c_id,t].lb = 0
+                    for r in c.rooms:
+                        if(r == 0):
+                            self.gamma[s.id,c_id,r,t].ub = 1
+                            self.gamma[s.id,c_id,r,t].lb = 1
                         else:
-                            self.betaonl[s.id,c_id,t].ub = 0
-                            self.betaonl[s.id,c_id,t].lb = 0
-                            self.betainp[s.id,c_id,t].ub = 1
-                            self.betainp[s.id,c_id,t].lb = 1
-                            for r in c.rooms:
-                                if(r == room):
-                                    self.gamma[s.id,c_id,t,r,t].ub = 1
-                                    self.gamma[s.id,c_id,t,r,t].lb = 1
-                                else:
-                                    self.gamma[s.id,c_id,t,r,t].ub = 0
-                                    self.gamma[s.id,c_id,t,r,t].lb = 0
+                            self.gamma[s.id,c_id,r,t].ub = 0
+                            self.gamma[s.id,c_id,r,t].lb = 0
+                else:
+                    self.betaonl[s.id,c_id,t].ub = 0
+                    self.betaonl[s.id,c_id,t].lb = 0
+                    self.betainp[s.id,c_id,t].ub = 1
+                    self.betainp[s.id,c_id,t].lb = 1
+                    for r in c.rooms:
+                        if(r == room):
+                            self.gamma[s.id,c_id,r,t].ub = 1
+                            self.gamma[s.id,c_id,r,t].lb = 1
+                        else:
+                            self.gamma[s.id,c_id,r,t].ub = 0
+                            self.gamma[s.id,c_id,r,t].lb = 0
         # Fixing the h variables
         class_pair_combos = itertools.combinations(classes_for_student, 2)
         for pair in class_pair_combos:
+            if(pair[0] < pair[1]):
+                h_var = self.h[s.id,pair[0],pair[1]]
+            else:
+                h_var = self.h[s.id,pair[1],pair[0]]
             # If one (or both) of the classes is not attended then no conflict
-            if(pair[0] not in list(attended_classes.keys()) or pair[1] not in list(attended_classes.keys())):
-                if(pair[0] < pair[1]):
-                    self.h[s.id,pair[0],pair[1]].ub = 0
-                    self.h[s.id,pair[0],pair[1]].lb = 0
-                else:
-                    self.h[s.id,pair[1],pair[0]].ub = 0
-                    self.h[s.id,pair[1],pair[0]].lb = 0
+            if(pair[0] not in attended_classes or pair[1] not in attended_classes):
+                h_var.ub = 0
+                h_var.lb = 0
                 continue
             # Getting properties of solution
-            for c_sol in solution:
-                if(c_sol.attrib['id'] == pair[0]):
-                    # Locations
-                    room1 = c_sol.attrib['room']
-                    # Timeset
-                    days = c_sol.attrib['online']
-                    start = c_sol.attrib['start']
-                    length = c_sol.attrib['length']
-                    weeks = c_sol.attrib['weeks']
-                    for t in self.P.timesets:
-                        if(t.days == days and
-                        t.start == start and
-                        t.length == length and
-                        t.weeks == weeks):
-                            timeset1 = t.id
-                if(c_sol.attrib['id'] == pair[1]):
-                    # Locations
-                    room2 = c_sol.attrib['room']
-                    # Timeset
-                    days = c_sol.attrib['online']
-                    start = c_sol.attrib['start']
-                    length = c_sol.attrib['length']
-                    weeks = c_sol.attrib['weeks']
-                    for t in self.P.timesets:
-                        if(t.days == days and
-                        t.start == start and
-                        t.length == length and
-                        t.weeks == weeks):
-                            timeset2 = t.id
+            room1, online1, timeset1 = solution.class_assignment(pair[0])
+            room2, online2, timeset2 = solution.class_assignment(pair[1])
             # Check if the timesets overlap, if they do then set variables
             t1 = self.P.timesets[timeset1]
             t2 = self.P.timesets[timeset2]
             if(fn.timesetOverlapCheck(t1,t2) == True):
-                if(pair[0] < pair[1]):
-                    self.h[s.id,pair[0],pair[1]].ub = 1
-                    self.h[s.id,pair[0],pair[1]].lb = 1
-                else:
-                    self.h[s.id,pair[1],pair[0]].ub = 1
-                    self.h[s.id,pair[1],pair[0]].lb = 1
+                h_var.ub = 1
+                h_var.lb = 1
                 continue
             # Checking how the student is attending so we know where student is
             if(attended_classes[pair[0]] == "online"):
@@ -510,20 +559,257 @@ class ModelObject:
             time_distance = self.P.distribution_arrays['InteriorDistance'][timeset1,timeset2]
             # Check if the travel time between rooms is greater than the time available
             if(time_distance < room_distance):
-                if(pair[0] < pair[1]):
-                    self.h[s.id,pair[0],pair[1]].ub = 1
-                    self.h[s.id,pair[0],pair[1]].lb = 1
-                else:
-                    self.h[s.id,pair[1],pair[0]].ub = 1
-                    self.h[s.id,pair[1],pair[0]].lb = 1
+                h_var.ub = 1
+                h_var.lb = 1
+            else:
+                h_var.ub = 0
+                h_var.lb = 0
+
+
+    """
+    Adding and removing students in the built model
+    """
+
+    # Adds students with their variables and constraints
+    def add_students(self,students):
+        """
+        The students are put into the existing capacity rows (31 and 32) in place
+        and the objective last set is set again with their terms. Students are not
+        added while objectives are constrained (the rows would not include them),
+        and students requesting a module that is not in the instance are left out.
+        The current incumbent is kept as a partial start (new students are left for the solver).
+        """
+        if(self.objective_constraints_present("added")):
+            return
+        start = self.current_start()
+        existing = set(s.id for s in self.P.students)
+        students = [s for s in students if s.id not in existing]
+        modules = set(k.id for k in self.P.modules)
+        unknown = [s.id for s in students if any(k_id not in modules for k_id in s.modules)]
+        if(len(unknown) != 0):
+            print("Warning: Students {} request modules that are not in the instance and are not added".format(unknown))
+            students = [s for s in students if s.id not in unknown]
+        # The instance is copied so the caller's student list is unchanged
+        self.P = copy.copy(self.P)
+        self.P.students = self.P.students + students
+        student_classes = {}
+        for s in students:
+            student_classes[s.id] = self.addStudentVariables(s)
+        self.M.update()
+        self.addStudentConstraints(students)
+        # Attendance of the new students in the capacity rows
+        for s in students:
+            for c_id in student_classes[s.id]:
+                if(c_id in self.capacity_constraints):
+                    c31, c32 = self.capacity_constraints[c_id]
+                    self.M.chgCoeff(c31, self.alphainp[s.id,c_id], 1)
+                    self.M.chgCoeff(c32, self.alphainp[s.id,c_id], 1)
+                    self.M.chgCoeff(c32, self.alphaonl[s.id,c_id], 1)
+        self.M.update()
+        self.clear_objective_cache()
+        self.reapply_objective()
+        self.restore_start(start)
+        print("Added {} students to the model".format(len(students)))
+
+    # Removes students with their variables and constraints
+    def remove_students(self,student_ids):
+        """
+        Rows containing a removed variable are removed as well, apart from the
+        capacity rows (31 and 32) which are shared, and the objective last set is
+        set again without their terms. Students are not removed while objectives
+        are constrained (the right hand sides would no longer hold).
+        """
+        if(self.objective_constraints_present("removed")):
+            return
+        start = self.current_start()
+        student_ids = set(student_ids)
+        removed_vars = []
+        for family in [self.a,self.alphaonl,self.alphainp,self.tau,self.b,self.m,self.n,
+                       self.betaonl,self.betainp,self.gamma,self.h]:
+            for key in [key for key in family.keys() if key[0] in student_ids]:
+                removed_vars.append(family[key])
+                del family[key]
+        # Student rows are found through the columns of their variables
+        shared = set()
+        for (c31,c32) in self.capacity_constraints.values():
+            shared.add(c31.index)
+            shared.add(c32.index)
+        removed_constrs = {}
+        for var in removed_vars:
+            col = self.M.getCol(var)
+            for i in range(col.size()):
+                constr = col.getConstr(i)
+                if(constr.index not in shared):
+                    removed_constrs[constr.index] = constr
+        removed_indices = set(var.index for var in removed_vars)
+        start = [(var,value) for (var,value) in start if var.index not in removed_indices]
+        self.preference_constraints = {key: constr for key,constr in self.preference_constraints.items() if key[0] not in student_ids}
+        self.online_distance_constraints = [row for row in self.online_distance_constraints if row[0].index not in removed_constrs]
+        self.M.remove(list(removed_constrs.values()))
+        self.M.remove(removed_vars)
+        self.M.update()
+        # The instance is copied so the caller's student list is unchanged
+        self.P = copy.copy(self.P)
+        self.P.students = [s for s in self.P.students if s.id not in student_ids]
+        if(self.fixed_elements != None):
+            self.fixed_elements = copy.copy(self.fixed_elements)
+            self.fixed_elements.students = [s_id for s_id in self.fixed_elements.students if s_id not in student_ids]
+        self.clear_objective_cache()
+        self.reapply_objective()
+        self.restore_start(start)
+        print("Removed {} students from the model".format(len(student_ids)))
+
+    # Checks for objective constraints or bounds before students are changed
+    def objective_constraints_present(self,change):
+        self.M.update()
+        names = self.M.getAttr("ConstrName", self.M.getConstrs())
+        constrained = [name for name in names if name.startswith(("objective_fix_","objective_bound_"))]
+        if(len(constrained) != 0):
+            print("Warning: Students cannot be {} while objectives are constrained ({})".format(change,", ".join(constrained)))
+            return True
+        return False
+
+    # Variables with their value in the current incumbent (empty if there is none)
+    def current_start(self):
+        if(self.M.SolCount == 0):
+            return []
+        try:
+            variables = self.M.getVars()
+            return list(zip(variables,self.M.getAttr("X", variables)))
+        except gurobipy.GurobiError:
+            return []
+
+    # Uses previous values of some variables as a partial MIP start
+    def restore_start(self,start):
+        if(len(start) == 0):
+            return
+        self.M.setAttr("Start", self.M.getVars(), [GRB.UNDEFINED]*self.M.NumVars)
+        self.M.setAttr("Start", [var for (var,value) in start], [value for (var,value) in start])
+        self.M.update()
+
+
+    """
+    Changing instance parameters in the built model
+    """
+
+    # Changes room capacities in the capacity constraints (31) in place
+    def set_room_capacities(self,capacities):
+        """
+        Capacities is a dictionary of room id to the new capacity,
+        rooms that are not given keep their current capacity.
+        """
+        self.P = copy.copy(self.P)
+        self.P.rooms = [copy.copy(r) for r in self.P.rooms]
+        for r in self.P.rooms:
+            if(r.id in capacities):
+                r.capacity = capacities[r.id]
+        for c in self.P.classes:
+            if(c.id not in self.capacity_constraints):
+                continue
+            c31, c32 = self.capacity_constraints[c.id]
+            for r_id in c.rooms:
+                if(r_id != 0 and r_id in capacities):
+                    self.M.chgCoeff(c31, self.yr[c.id,r_id], -capacities[r_id])
+        self.M.update()
+
+    # Leaves space in the capacity rows (31 and 32) for students outside of the model
+    def reserve_capacity(self,attendance):
+        """
+        Attendance is a list of (student id, class id, online) of students who are not
+        in the model. Their classes must be fixed to the solution, so the room is known.
+        """
+        rooms = {r.id: r for r in self.P.rooms}
+        classes = {c.id: c for c in self.P.classes}
+        inperson_count = {}
+        total_count = {}
+        for (s_id,c_id,online) in attendance:
+            total_count[c_id] = total_count.get(c_id,0) + 1
+            if(online == False):
+                inperson_count[c_id] = inperson_count.get(c_id,0) + 1
+        inperson_left = {}
+        total_left = {}
+        for c_id in total_count:
+            room, online, timeset = self.solution.class_assignment(c_id)
+            capacity = 0
+            if(room != None):
+                capacity = rooms[room].capacity
+            inperson_left[c_id] = capacity - inperson_count.get(c_id,0)
+            total_left[c_id] = classes[c_id].sub_limit - total_count[c_id]
+        self.limit_capacity(inperson_left,total_left)
+
+    # Limits the in-person and total attendance of classes in the capacity rows (31 and 32)
+    def limit_capacity(self,inperson_left,total_left):
+        """
+        The classes must be fixed to the solution, so the room is known.
+        Classes that are not given keep their current limits.
+        """
+        rooms = {r.id: r for r in self.P.rooms}
+        for c_id in total_left:
+            if(c_id not in self.capacity_constraints):
                 continue
+            c31, c32 = self.capacity_constraints[c_id]
+            room, online, timeset = self.solution.class_assignment(c_id)
+            capacity = 0
+            if(room != None):
+                capacity = rooms[room].capacity
+            c31.RHS = min(max(inperson_left[c_id],0),capacity) - capacity
+            c32.RHS = max(total_left[c_id],0)
+        self.M.update()
+
+    # Changes the mode preferences of students in constraint 34 in place
+    def set_mode_preferences(self,preferences):
+        """
+        Preferences is a dictionary of student id to the new preference (1, 0 or -1).
+        The tau variables of fixed students are fixed again for the new preference.
+        """
+        self.P = copy.copy(self.P)
+        self.P.students = [copy.copy(s) for s in self.P.students]
+        changed = {}
+        for s in self.P.students:
+            if(s.id in preferences and preferences[s.id] != s.mode_preference):
+                s.mode_preference = preferences[s.id]
+                changed[s.id] = s.mode_preference
+        for (s_id,c_id),c34 in self.preference_constraints.items():
+            if(s_id in changed):
+                self.M.chgCoeff(c34, self.alphaonl[s_id,c_id], -changed[s_id])
+                self.M.chgCoeff(c34, self.alphainp[s_id,c_id], changed[s_id])
+        # Fixed students keep their classes, so only whether the mode is wrong changes
+        if(self.fixed_elements != None and self.solution != None):
+            for s_id in self.fixed_elements.students:
+                if(s_id not in changed):
+                    continue
+                attended_classes = self.solution.student_attendance(s_id)
+                for c_id in attended_classes:
+                    wrong_mode = ((attended_classes[c_id] == "online" and changed[s_id] == 1) or
+                                  (attended_classes[c_id] == "inperson" and changed[s_id] == -1))
+                    self.tau[s_id,c_id].lb = int(wrong_mode)
+                    self.tau[s_id,c_id].ub = int(wrong_mode)
+        self.M.update()
+
+    # Moves the online room to a new multiple of the largest physical distance
+    def set_online_distance(self,dummy_scaling):
+        """
+        Rows involving the online room are made binding or relaxed (rather than
+        added or removed), so the model must have been built with the largest
+        online distance that is used.
+        """
+        if(dummy_scaling > self.built_online_distance):
+            print("Warning: Online distance is larger than the distance the model was built with")
+        self.P = copy.copy(self.P)
+        self.P.weightedRoomAdjacency = copy.deepcopy(self.P.weightedRoomAdjacency)
+        self.P.weightedRoomAdjacency.set_dummy_distance(dummy_scaling)
+        self.P.dummyRoomDistanceScaling = dummy_scaling
+        constraints = []
+        rhs = []
+        for (constr,r1,r2,available,binding,relaxed) in self.online_distance_constraints:
+            constraints.append(constr)
+            if(self.P.weightedRoomAdjacency.distance(r1,r2) > available):
+                rhs.append(binding)
             else:
-                if(pair[0] < pair[1]):
-                    self.h[s.id,pair[0],pair[1]].ub = 0
-                    self.h[s.id,pair[0],pair[1]].lb = 0
-                else:
-                    self.h[s.id,pair[1],pair[0]].ub = 0
-                    self.h[s.id,pair[1],pair[0]].lb = 0
+                rhs.append(relaxed)
+        if(len(constraints) != 0):
+            self.M.setAttr("RHS", constraints, rhs)
+        self.M.update()
 
 
     """
@@ -532,6 +818,21 @@ class ModelObject:
 
     # Function to convert a string into the relevant objective function
     def objective_string2gurobi(self,z):
+        """
+        Objective expressions are only built the first time they are requested,
+        afterwards the cached expression is returned.
+        """
+        if(z not in self.objective_cache):
+            self.objective_cache[z] = self.build_objective(z)
+        return self.objective_cache[z]
+
+    # Removes all cached objective expressions
+    def clear_objective_cache(self):
+        self.objective_cache = {}
+        self.objective_terms_cache = {}
+
+    # Builds the objective expression for a string
+    def build_objective(self,z):
         if(z == "ModuleRequest"):
             z_new = self.objective_module_requests()
         elif(z == "ModePreferences"):
@@ -560,6 +861,75 @@ class ModelObject:
         else:
             self.M.setObjective(z_gc, GRB.MINIMIZE)
         self.M.update()
+        self.objective_target = self.objective_bound(z,sense)
+        self.objective_setting = ("objective",z,sense)
+
+    # Variable indices, coefficients and constant of an objective expression
+    def objective_terms(self,z):
+        if(z not in self.objective_terms_cache):
+            z_gc = self.objective_string2gurobi(z)
+            variables = [z_gc.getVar(i) for i in range(z_gc.size())]
+            coefficients = np.array([z_gc.getCoeff(i) for i in range(z_gc.size())])
+            self.objective_terms_cache[z] = (variables,coefficients,z_gc.getConstant())
+        return self.objective_terms_cache[z]
+
+    # Best value of an objective from the bounds of its variables (None if unbounded)
+    def objective_bound(self,z,sense = "Minimise"):
+        """
+        Each variable is put at whichever of its bounds is better for the objective,
+        e.g. ModuleRequest is bounded by the number of elective requests and
+        StudentConflicts by 0.
+        """
+        variables, coefficients, constant = self.objective_terms(z)
+        if(len(variables) == 0):
+            return constant
+        lower = np.array(self.M.getAttr("LB", variables))
+        upper = np.array(self.M.getAttr("UB", variables))
+        if(sense == "Maximise"):
+            best = np.where(coefficients > 0, upper, lower)
+        else:
+            best = np.where(coefficients > 0, lower, upper)
+        if(np.any(np.abs(best) >= GRB.INFINITY)):
+            return None
+        return constant + float(np.dot(coefficients,best))
+
+    # Value of an objective in a previous incumbent
+    def incumbent_objective(self,z,incumbent):
+        variables, coefficients, constant = self.objective_terms(z)
+        indices = np.array([var.index for var in variables],dtype=int)
+        return constant + float(np.dot(coefficients,np.asarray(incumbent)[indices]))
+
+    # Sets every objective at once, prioritised by the order given
+    def set_hierarchical_objectives(self,ordered_objective_list):
+        """
+        Uses the multi-objective interface so the solver handles the
+        lexicographic ordering. Earlier objectives have higher priority and
+        since the model minimises, maximised objectives have a weight of -1.
+        """
+        number_objectives = len(ordered_objective_list)
+        self.objective_target = None
+        self.M.ModelSense = GRB.MINIMIZE
+        self.M.NumObj = number_objectives
+        self.M.update()
+        for i,objective in enumerate(ordered_objective_list):
+            if(objective[1] == "Maximise"):
+                weight = -1
+            else:
+                weight = 1
+            z_gc = self.objective_string2gurobi(objective[0])
+            self.M.setObjectiveN(z_gc, index=i, priority=number_objectives-i, weight=weight,
+                                 abstol=0, reltol=0, name=str(objective[0]))
+        self.M.update()
+        self.objective_setting = ("hierarchical",list(ordered_objective_list))
+
+    # Sets the objective last set again (its expression changes with the students)
+    def reapply_objective(self):
+        if(self.objective_setting == None):
+            return
+        if(self.objective_setting[0] == "hierarchical"):
+            self.set_hierarchical_objectives(self.objective_setting[1])
+        else:
+            self.set_objective(self.objective_setting[1],sense=self.objective_setting[2])
 
     # Fixes an objective function at a certain value
     def constrain_objective(self,z,value,sense = "Minimise"):
@@ -577,10 +947,32 @@ class ModelObject:
         self.M.remove(self.M.getConstrByName("objective_fix_"+str(z)))
         self.M.update()
 
+    # Bounds an objective function (an existing bound is moved with its right hand side)
+    def bound_objective(self,z,value,sense = "Minimise"):
+        constr = self.M.getConstrByName("objective_bound_"+str(z))
+        if(constr != None):
+            constr.RHS = value - self.objective_string2gurobi(z).getConstant()
+        else:
+            z_gc = self.objective_string2gurobi(z)
+            if(sense == "Maximise"):
+                self.M.addConstr(z_gc >= value, name="objective_bound_"+str(z))
+            else:
+                self.M.addConstr(z_gc <= value, name="objective_bound_"+str(z))
+        self.M.update()
+
+    # Removes the bound on an objective function
+    def unbound_objective(self,z):
+        self.M.remove(self.M.getConstrByName("objective_bound_"+str(z)))
+        self.M.update()
+
     # Get objective value
     def objective_value(self):
         obj = self.M.getObjective()
         return obj.getValue()
+
+    # Get the value of a named objective in the current solution
+    def named_objective_value(self,z):
+        return self.objective_string2gurobi(z).getValue()
     
     """
     Base model objectives
@@ -588,61 +980,26 @@ class ModelObject:
     
     # Maximise requested courses
     def objective_module_requests(self):
-        z = LinExpr()
-        for s in self.P.students:
-            for k in s.modules:
-                if(k not in s.required_modules):
-                    z.add(self.n[s.id,k])
-        return z
+        required_modules = {s.id: s.required_modules for s in self.P.students}
+        return quicksum(var for (s_id,k_id),var in self.n.items() if k_id not in required_modules[s_id])
     
     # Maximise alignment with preferences
     def objective_mode_preference(self):
-        z = LinExpr()
-        for s in self.P.students:
-            for k in self.P.modules:
-                if(k.id in s.modules):
-                    for f in k.configs:
-                        for p in f.subparts:
-                            for c in self.P.classes:
-                                if(c.id in p.classes):
-                                    z.add(1*self.tau[s.id,c.id])
-        return z
+        return quicksum(self.tau.values())
     
     # Minimise conflicts
     def objective_student_conflict(self):
-        z = LinExpr()
-        for s in self.P.students:
-            classes_for_student = []
-            for k in self.P.modules:
-                if(k.id in s.modules):
-                    for f in k.configs:
-                        for p in f.subparts:
-                            for c in self.P.classes:
-                                if(c.id in p.classes):
-                                    classes_for_student.append(c.id)
-            class_pair_combos = itertools.combinations(classes_for_student, 2)
-            for pair in class_pair_combos:
-                if(pair[0] < pair[1]):
-                    z.add(self.h[s.id,pair[0],pair[1]])
-                else:
-                    z.add(self.h[s.id,pair[1],pair[0]])
-        return z
+        return quicksum(self.h.values())
     
     # Minimise room penalties
     def objective_room_penalty(self):
-        z = LinExpr()
-        for c in self.P.classes:
-            for r in c.rooms:
-                z.add(c.rooms[r]*self.yr[c.id,r])
-        return z
+        classes = {c.id: c for c in self.P.classes}
+        return quicksum(classes[c_id].rooms[r]*var for (c_id,r),var in self.yr.items())
 
     # Minimise timeset penalties
     def objective_timeset_penalty(self):
-        z = LinExpr()
-        for c in self.P.classes:
-            for t in c.timesets:
-                z.add(c.timesets[t]*self.yt[c.id,t])
-        return z
+        classes = {c.id: c for c in self.P.classes}
+        return quicksum(classes[c_id].timesets[t]*var for (c_id,t),var in self.yt.items())
     
     # Minimise total room usage
     def objective_room_usage(self):
@@ -706,6 +1063,29 @@ class ModelObject:
                 self.addBase45to53()
         # Update the model
         self.M.update()
+
+    # Constraints of the students given (the ones only involving their variables)
+    def addStudentConstraints(self,students):
+        self.addBase22(students)
+        self.addBase23(students)
+        self.addBase2526(students)
+        self.addBase27(students)
+        self.addBase28(students)
+        self.addBase29(students)
+        self.addBase30(students)
+        self.addBase33(students)
+        self.addBase3435(students)
+        if(len(fn.intersection([36,37,38,39,40,41,42,43,44],self.inactive_constraints)) == 0):
+            self.addBase36to44(students)
+            if(len(fn.intersection([45,46,47,48,49,51,52,53],self.inactive_constraints)) == 0):
+                self.addBase45to53(students)
+        self.M.update()
+
+    # Students that student constraints are added for (all of them by default)
+    def constrained_students(self,students):
+        if(students == None):
+            return self.P.students
+        return students
         
     
     # Linking constraints for resource assignment 
@@ -895,7 +1275,7 @@ class ModelObject:
     
     
     # Student does not attend a module that is not offered
-    def addBase22(self):
+    def addBase22(self,students=None):
         """
         Student cannot attend a module that isn't happening
         """
@@ -903,13 +1283,13 @@ class ModelObject:
         if(fn.intersection([22],self.inactive_constraints)):
             return
         # Adding constraint
-        for s in self.P.students:
+        for s in self.constrained_students(students):
             for k_id in s.modules:
                 self.M.addConstr(self.n[s.id,k_id] <= self.g[k_id], name='ctwentytwo')
                 
 
     # Student must attend all compulsory modules
-    def addBase23(self):
+    def addBase23(self,students=None):
         """
         All compulsory modules need to be attended
         """
@@ -917,13 +1297,13 @@ class ModelObject:
         if(fn.intersection([23],self.inactive_constraints)):
             return
         # Adding constraint
-        for s in self.P.students:
+        for s in self.constrained_students(students):
             for k_id in s.required_modules:
                 self.M.addConstr(self.n[s.id,k_id] == 1, name='ctwentythree')
 
 
     # Student does not attend a class that is not offered
-    def addBase2526(self):
+    def addBase2526(self,students=None):
         """
         Student doesn't attend a class that isn't offered
         """
@@ -931,7 +1311,7 @@ class ModelObject:
         if(fn.intersection([25,26],self.inactive_constraints)):
             return
         # Adding constraint
-        for s in self.P.students:
+        for s in self.constrained_students(students):
             classes_for_student = []
             for k in self.P.modules:
                 if(k.id in s.modules):
@@ -954,7 +1334,7 @@ class ModelObject:
                     self.M.addConstr(self.alphaonl[s.id,c.id] <= expression, name='ctwentysix')
                 
     # Student attends a module if they attend a configuration for that module
-    def addBase27(self):
+    def addBase27(self,students=None):
         """
         Student attends module if they attend a configuration for that module
         """
@@ -962,7 +1342,7 @@ class ModelObject:
         if(fn.intersection([27],self.inactive_constraints)):
             return
         # Adding constraint
-        for s in self.P.students:
+        for s in self.constrained_students(students):
             for k in self.P.modules:
                 if(k.id in s.modules):
                     summation = quicksum(self.m[s.id,k.id,f.id] for f in k.configs)
@@ -970,7 +1350,7 @@ class ModelObject:
     
 
     # Student attends a configuration if they attend a class from each subpart  
-    def addBase28(self):
+    def addBase28(self,students=None):
         """
         Student is assigned a configuration if they attend a class from each subpart
         """
@@ -978,7 +1358,7 @@ class ModelObject:
         if(fn.intersection([28],self.inactive_constraints)):
             return
         # Adding constraint            
-        for s in self.P.students:
+        for s in self.constrained_students(students):
             for k in self.P.modules:
                 if(k.id in s.modules):
                     for f in k.configs:
@@ -988,7 +1368,7 @@ class ModelObject:
     
 
     # Student has at most one class from a subpart and doesn't attend subpart if no classes attended
-    def addBase29(self):
+    def addBase29(self,students=None):
         """
         Student has at most one class from a subpart
         """
@@ -996,7 +1376,7 @@ class ModelObject:
         if(fn.intersection([29],self.inactive_constraints)):
             return
         # Adding constraint  
-        for s in self.P.students:
+        for s in self.constrained_students(students):
             for k in self.P.modules:
                 if(k.id in s.modules):
                     for f in k.configs:
@@ -1006,7 +1386,7 @@ class ModelObject:
    
 
     # Student attends either the online version or the in-person class (or neither)
-    def addBase30(self):
+    def addBase30(self,students=None):
         """
         Student attends online or inperson or neither
         """
@@ -1014,7 +1394,7 @@ class ModelObject:
         if(fn.intersection([30],self.inactive_constraints)):
             return
         # Adding constraint
-        for s in self.P.students:
+        for s in self.constrained_students(students):
             for k in self.P.modules:
                 if(k.id in s.modules):
                     for f in k.configs:
@@ -1031,6 +1411,8 @@ class ModelObject:
         - Room capacity
         - Subscription capacity
         """
+        # Rows of each class (students added later are put into them)
+        self.capacity_constraints = {}
         # Check if need to include constraint 
         if(fn.intersection([31,32],self.inactive_constraints)):
             return
@@ -1057,13 +1439,14 @@ class ModelObject:
                         # Maximum physical attendance constraint
                         max_attendance = quicksum(r_id_cap[1]*self.yr[c.id,r_id_cap[0]] for r_id_cap in room_id_cap_list)
                         total_inperson_attendance = quicksum(self.alphainp[s_id,c.id] for s_id in student_id_list)
-                        self.M.addConstr(total_inperson_attendance <= max_attendance, name='cthirtyone')
+                        c31 = self.M.addConstr(total_inperson_attendance <= max_attendance, name='cthirtyone')
                         # Subscription limit constraints
                         total_attendance = quicksum(self.alphainp[s_id,c.id] + self.alphaonl[s_id,c.id] for s_id in student_id_list)
-                        self.M.addConstr(total_attendance <= c.sub_limit, name='cthirtytwo')
+                        c32 = self.M.addConstr(total_attendance <= c.sub_limit, name='cthirtytwo')
+                        self.capacity_constraints[c.id] = (c31,c32)
     
     # Parent child classes
-    def addBase33(self):
+    def addBase33(self,students=None):
         """
         If a student attends a child class then they
         must attend a parent class if one exists.
@@ -1072,7 +1455,7 @@ class ModelObject:
         if(fn.intersection([33],self.inactive_constraints)):
             return
         # Adding constraint
-        for s in self.P.students:
+        for s in self.constrained_students(students):
             for k in self.P.modules:
                 if(k.id in s.modules):
                     for f in k.configs:
@@ -1086,7 +1469,7 @@ class ModelObject:
 
     
     # Mode request constraints
-    def addBase3435(self):
+    def addBase3435(self,students=None):
         """
         Linking the mode request variables to attendance variables
         """
@@ -1094,7 +1477,7 @@ class ModelObject:
         if(fn.intersection([34,35],self.inactive_constraints)):
             return
         # Adding constraint
-        for s in self.P.students:
+        for s in self.constrained_students(students):
             pi_value = s.mode_preference
             for k in self.P.modules:
                 if(k.id in s.modules):
@@ -1102,15 +1485,16 @@ class ModelObject:
                         for p in f.subparts:
                             for c in self.P.classes:
                                 if(c.id in p.classes):
-                                    self.M.addConstr(self.tau[s.id,c.id] >= pi_value*(self.alphaonl[s.id,c.id] - self.alphainp[s.id,c.id]), name='cthirtyfour')
+                                    c34 = self.M.addConstr(self.tau[s.id,c.id] >= pi_value*(self.alphaonl[s.id,c.id] - self.alphainp[s.id,c.id]), name='cthirtyfour')
+                                    self.preference_constraints[s.id,c.id] = c34
                                     self.M.addConstr(self.tau[s.id,c.id] <= self.alphaonl[s.id,c.id] + self.alphainp[s.id,c.id], name='cthirtyfive')
 
         
     # Detection of if student has overlapping class
-    def addBase36to44(self):
+    def addBase36to44(self,students=None):
         print("Adding student overlap constraints")
         D_array_sameattendee = self.P.distribution_arrays["InteriorDistance"]
-        for s in self.P.students:
+        for s in self.constrained_students(students):
             # Check if need to skip student
             if(self.fixed_elements != None):
                 if(s.id in self.fixed_elements.students):
@@ -1156,10 +1540,10 @@ class ModelObject:
                     
         
     # Detection if a student has enough travel time between classes
-    def addBase45to53(self):
+    def addBase45to53(self,students=None):
         print("Adding student travel time constraints")
         D_array_sameattendee = self.P.distribution_arrays["InteriorDistance"]
-        for s in self.P.students:
+        for s in self.constrained_students(students):
             # Check if need to skip student
             if(self.fixed_elements != None):
                 if(s.id in self.fixed_elements.students):
@@ -1208,9 +1592,12 @@ class ModelObject:
                         for r2 in c2.rooms:
                             if(self.P.weightedRoomAdjacency.distance(r1,r2) > D_array_sameattendee[t1_id,t2_id]):
                                 if(pair[0] < pair[1]):
-                                    self.M.addConstr(self.gamma[s.id,c1.id,r1,t1_id] + self.gamma[s.id,c2.id,r2,t2_id] <= 1 + self.h[s.id,pair[0],pair[1]]).Lazy = 1
+                                    constr = self.M.addConstr(self.gamma[s.id,c1.id,r1,t1_id] + self.gamma[s.id,c2.id,r2,t2_id] <= 1 + self.h[s.id,pair[0],pair[1]])
                                 else:
-                                    self.M.addConstr(self.gamma[s.id,c1.id,r1,t1_id] + self.gamma[s.id,c2.id,r2,t2_id] <= 1 + self.h[s.id,pair[1],pair[0]]).Lazy = 1
+                                    constr = self.M.addConstr(self.gamma[s.id,c1.id,r1,t1_id] + self.gamma[s.id,c2.id,r2,t2_id] <= 1 + self.h[s.id,pair[1],pair[0]])
+                                constr.Lazy = 1
+                                if(r1 == 0 or r2 == 0):
+                                    self.online_distance_constraints.append((constr,r1,r2,D_array_sameattendee[t1_id,t2_id],1,2))
     
 
     # Staff must be able to attend classes they can teach (time consuming)
@@ -1224,43 +1611,24 @@ class ModelObject:
                 class_pair_combos = itertools.combinations(dist.classes, 2)
                 for pair in class_pair_combos:
                     if(self.fixed_elements != None):
-                        if(pair[0] not in self.fixed_elements.classes or pair[0] not in self.fixed_elements.classes):
-                            # Neither are fixed
-                            if(pair[0] not in self.fixed_elements.classes and pair[0] not in self.fixed_elements.classes):
-                                self.addSameAttendeeNoneFixed(pair[0],pair[1])
-                            # Pair 0 is fixed
-                            elif(pair[0] not in self.fixed_elements.classes):
-                                self.addSameAttendeeOneFixed(pair[0],pair[1])
-                            # Pair 1 is fixed
-                                self.addSameAttendeeOneFixed(pair[1],pair[0])
+                        fixed0 = pair[0] in self.fixed_elements.classes
+                        fixed1 = pair[1] in self.fixed_elements.classes
+                        # Neither are fixed
+                        if(fixed0 == False and fixed1 == False):
+                            self.addSameAttendeeNoneFixed(pair[0],pair[1])
+                        # Pair 0 is fixed
+                        elif(fixed0 == True and fixed1 == False):
+                            self.addSameAttendeeOneFixed(pair[0],pair[1])
+                        # Pair 1 is fixed
+                        elif(fixed0 == False and fixed1 == True):
+                            self.addSameAttendeeOneFixed(pair[1],pair[0])
                     else:
                         self.addSameAttendeeNoneFixed(pair[0],pair[1])
     
     # One fixed and one unfixed
     def addSameAttendeeOneFixed(self,fixed,unfixed):
         # Retrieving details of fixed class
-        solution = self.solution
-        # Check if class has an allocation at all
-        timeset = None
-        room = None
-        online = None
-        for c_sol in solution:
-            if(c_sol.attrib['id'] == fixed):
-                # Locations
-                room = c_sol.attrib['room']
-                online = c_sol.attrib['online']
-                # Timeset
-                days = c_sol.attrib['online']
-                start = c_sol.attrib['start']
-                length = c_sol.attrib['length']
-                weeks = c_sol.attrib['weeks']
-                for t in self.P.timesets:
-                    if(t.days == days and
-                       t.start == start and
-                       t.length == length and
-                       t.weeks == weeks):
-                        timeset = t.id
-                break
+        room, online, timeset = self.solution.class_assignment(fixed)
         # If fixed class has no allocation then pass
         if(timeset == None):
             return
@@ -1280,10 +1648,13 @@ class ModelObject:
                     for r in c2.rooms:
                         if(room != None):
                             if(self.P.weightedRoomAdjacency.distance(room,r) > D_array_sameattendee[timeset,t]):
-                                self.M.addConstr(self.x[c2.id,r,t] <= 0, name='ctwentyonefix')
+                                constr = self.M.addConstr(self.x[c2.id,r,t] <= 0, name='ctwentyonefix')
+                                if(r == 0):
+                                    self.online_distance_constraints.append((constr,room,r,D_array_sameattendee[timeset,t],0,1))
                         if(online == True):
                             if(self.P.weightedRoomAdjacency.distance(0,r) > D_array_sameattendee[timeset,t]):
-                                self.M.addConstr(self.x[c2.id,r,t] <= 0, name='ctwentyonefix')
+                                constr = self.M.addConstr(self.x[c2.id,r,t] <= 0, name='ctwentyonefix')
+                                self.online_distance_constraints.append((constr,0,r,D_array_sameattendee[timeset,t],0,1))
                 else:
                     self.M.addConstr(self.yt[c2.id,t] <= 0, name='ctwentyonefix').Lazy = 1
 
@@ -1309,6 +1680,9 @@ class ModelObject:
                 for r1 in c1.rooms:
                     for r2 in c2.rooms:
                         if(self.P.weightedRoomAdjacency.distance(r1,r2) > D_array_sameattendee[t1,t2]):
-                            self.M.addConstr(self.x[c1.id,r1,t1] + self.x[c2.id,r2,t2] <= 1, name='ctwentynonefix').Lazy = 1
+                            constr = self.M.addConstr(self.x[c1.id,r1,t1] + self.x[c2.id,r2,t2] <= 1, name='ctwentynonefix')
+                            constr.Lazy = 1
+                            if(r1 == 0 or r2 == 0):
+                                self.online_distance_constraints.append((constr,r1,r2,D_array_sameattendee[t1,t2],1,2))
             else:
                self.M.addConstr(self.yt[c1.id,t1] + self.yt[c2.id,t2] <= 1, name='ctwentynonefix').Lazy = 1
\ No newline at end of file
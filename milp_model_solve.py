@@ -1,50 +1,329 @@
 import random as rd
+import os
+import hashlib
+import pickle
 import time
 import copy
+import math
 import itertools
+import multiprocessing
+import numpy as np
+from gurobipy import Env, GRB
 
 # Local packages
 import instance as inst
 import functions as fn
 from milp_model_construction import ModelObject
+from construction import GreedyConstruction
+from evaluation import SolutionEvaluator
 
 """
 Lexicographic solution method
 """
 
 class LexicographicOnly:
-    def __init__(self,P,number_cores,node_memory,solution=None,fixed_elements=None):
+    def __init__(self,P,number_cores,node_memory,solution=None,fixed_elements=None,instance_settings=None,warm_start=None,time_limit=None,checkpoint=None):
         self.P = P
         self.cores = number_cores
         self.nodemem = node_memory
         self.solution = solution
         self.fixed_elements = fixed_elements
+        self.instance_settings = instance_settings
+        self.warm_start = warm_start
+        self.time_limit = time_limit
+        self.budget_end = None
+        self.stages_left = 0
+        self.checkpoint = checkpoint
+        self.resume_incumbent = None
+        self.env = None
+
+
+    # Builds the model that every ordering is solved with
+    def build_model(self):
+        if(self.env == None):
+            self.env = Env()
+        base_model = ModelObject(self.P,
+                                solution = self.solution,
+                                fixed_elements = self.fixed_elements,
+                                inactive_constraints = [],
+                                number_cores = self.cores, 
+                                node_memory = self.nodemem,
+                                env = self.env)
+        return base_model
+
+
+    # Frees the Gurobi environment (worker processes must not be forked while one exists)
+    def dispose_env(self):
+        if(self.env != None):
+            self.env.dispose()
+            self.env = None
 
 
     # Solve all possible orderings of the objectives given
     def lexicographic_solve(self,objective_list):
+        """
+        Orderings are solved by walking the tree of objective prefixes,
+        so a stage shared by several orderings is only solved once.
+        """
         results_dictionary = {}
-        for ordering in itertools.permutations(objective_list):
-            [objective_values,solution] = self.lexicographic_solve_ordering(list(ordering))
-            ordering_name = tuple([i[0] for i in ordering])
-            results_dictionary[ordering_name] = [objective_values,solution]
+        self.load_checkpoint(objective_list)
+        self.start_budget(number_of_stages(len(objective_list)) - len(self.stage_results))
+        # The model is only built once and reused by every ordering
+        base_model = self.build_model()
+        self.solve_prefix_tree(base_model,[],objective_list,results_dictionary)
+        self.remove_checkpoint(self.checkpoint)
+        return results_dictionary
+
+
+    # Solve every stage that follows on from a prefix of objectives
+    def solve_prefix_tree(self,base_model,prefix,remaining,results_dictionary):
+        """
+        Stage results are stored as [objective value, incumbent, solution, optimal].
+        The last objective of the prefix is fixed while its subtree is solved,
+        and each child stage is warm started from the prefix incumbent.
+        A prefix stopped without an incumbent is left unconstrained.
+        """
+        parent_incumbent = None
+        constrained = False
+        if(len(prefix) != 0):
+            parent_name = tuple([i[0] for i in prefix])
+            parent_value = self.stage_results[parent_name][0]
+            parent_incumbent = self.stage_results[parent_name][1]
+            if(self.stage_results[parent_name][2] != None):
+                base_model.constrain_objective(prefix[-1][0],parent_value,sense=prefix[-1][1])
+                constrained = True
+        for objective in remaining:
+            stage = prefix + [objective]
+            stage_name = tuple([i[0] for i in stage])
+            # Solving the stage if it hasn't been solved already
+            if(stage_name not in self.stage_results):
+                self.solve_stage(base_model,stage,parent_incumbent)
+            # Recording the ordering or moving further down the tree
+            children = [i for i in remaining if i != objective]
+            if(len(children) == 0):
+                objective_values = {}
+                non_optimal = []
+                for i,name in enumerate(stage_name):
+                    objective_values[name] = self.stage_results[stage_name[:i+1]][0]
+                    if(self.stage_results[stage_name[:i+1]][3] == False):
+                        non_optimal.append(name)
+                results_dictionary[stage_name] = [objective_values,self.stage_results[stage_name][2],non_optimal]
+            else:
+                self.solve_prefix_tree(base_model,stage,children,results_dictionary)
+            # Incumbent no longer needed once every child stage is solved
+            self.stage_results[stage_name][1] = None
+        # Removing the prefix constraint so siblings can be solved
+        if(constrained == True):
+            base_model.unconstrain_last_objective(prefix[-1][0])
+
+
+    # Solve the last objective of a stage and store the result
+    def solve_stage(self,base_model,stage,parent_incumbent=None):
+        """
+        A stage stopped by its time limit keeps the incumbent value (or the best
+        bound if there is no incumbent) and is marked as not optimal. A stage that
+        ends without a solution for any other reason (e.g. infeasible) has no value.
+        The solve stops as soon as the incumbent reaches the bound of the objective
+        and the stage is skipped if the prefix incumbent already reaches it (only
+        when the prefix stage has a solution to pass on).
+        """
+        stage_name = tuple([i[0] for i in stage])
+        base_model.set_objective(stage[-1][0],sense=stage[-1][1])
+        parent_solution = None
+        if(len(stage_name) > 1 and stage_name[:-1] in self.stage_results):
+            parent_solution = self.stage_results[stage_name[:-1]][2]
+        if(parent_incumbent is not None and parent_solution != None and base_model.objective_target != None):
+            start_value = base_model.incumbent_objective(stage[-1][0],parent_incumbent)
+            if(base_model.M.ModelSense*(start_value - base_model.objective_target) <= 1e-6):
+                print("Stage {} skipped, the start reaches the bound {}".format(stage_name,base_model.objective_target))
+                self.stage_results[stage_name] = [start_value,parent_incumbent,parent_solution,True]
+                # The share of the time limit is passed on to the stages left
+                self.stage_time_limit()
+                self.save_checkpoint(parent_incumbent)
+                return
+        # The first stage after resuming starts from the last stored incumbent
+        if(self.resume_incumbent is not None):
+            base_model.set_start(self.resume_incumbent)
+            self.resume_incumbent = None
+        elif(parent_incumbent is not None):
+            base_model.set_start(parent_incumbent)
+        elif(self.warm_start != None):
+            base_model.set_solution_start(self.warm_start)
+        stage_time = self.stage_time_limit()
+        if(stage_time != None):
+            base_model.M.Params.TimeLimit = stage_time
+        base_model.optimise_model()
+        optimal = base_model.M.Status in (GRB.OPTIMAL, GRB.USER_OBJ_LIMIT) or base_model.target_reached()
+        if(base_model.M.SolCount != 0):
+            base_model.updateSolution()
+            self.stage_results[stage_name] = [base_model.objective_value(),
+                                              base_model.get_incumbent(),
+                                              base_model.solution,
+                                              optimal]
+        elif(base_model.M.Status == GRB.TIME_LIMIT):
+            self.stage_results[stage_name] = [base_model.M.ObjBound,parent_incumbent,None,False]
+        else:
+            print("Warning: Stage {} ended without a solution (status {})".format(stage_name,base_model.M.Status))
+            self.stage_results[stage_name] = [None,parent_incumbent,None,False]
+        if(optimal == False and self.stage_results[stage_name][0] != None):
+            print("Warning: Stage {} stopped before optimality, value {}".format(stage_name,self.stage_results[stage_name][0]))
+        self.save_checkpoint(self.stage_results[stage_name][1])
+
+
+    # Stores the completed stages so a stopped run can be resumed
+    def save_checkpoint(self,last_incumbent):
+        """
+        The file is written next to the checkpoint and then moved over it,
+        so a run stopped while writing keeps the previous checkpoint.
+        """
+        if(self.checkpoint == None):
+            return
+        if(last_incumbent is not None):
+            self.last_incumbent = last_incumbent
+        checkpoint = {"key": self.checkpoint_key(),
+                      "stage_results": self.stage_results,
+                      "last_incumbent": self.last_incumbent}
+        outfile = open(self.checkpoint+"_writing","wb")
+        pickle.dump(checkpoint, outfile)
+        outfile.close()
+        os.replace(self.checkpoint+"_writing",self.checkpoint)
+
+    # Loads the completed stages of a previous run with the same objectives and instance
+    def load_checkpoint(self,objective_list):
+        """
+        Completed stages are skipped by the prefix tree, which adds the objective
+        constraints again from the stored values.
+        """
+        self.objective_list = list(objective_list)
+        self.stage_results = {}
+        self.last_incumbent = None
+        self.resume_incumbent = None
+        if(self.checkpoint == None or not os.path.exists(self.checkpoint)):
+            return
+        infile = open(self.checkpoint,"rb")
+        checkpoint = pickle.load(infile)
+        infile.close()
+        if(checkpoint.get("key") != self.checkpoint_key()):
+            print("Warning: Checkpoint {} is from a different run, starting from the beginning".format(self.checkpoint))
+            return
+        self.stage_results = checkpoint["stage_results"]
+        self.last_incumbent = checkpoint["last_incumbent"]
+        self.resume_incumbent = checkpoint["last_incumbent"]
+        print("Resuming from {} with {} completed stages".format(self.checkpoint,len(self.stage_results)))
+
+    # Settings a checkpoint has to be written with to be resumed
+    def checkpoint_key(self):
+        """
+        The warm start is compared through a digest of its class and attendance arrays.
+        """
+        warm_start = None
+        if(self.warm_start != None):
+            digest = hashlib.sha1()
+            for array in [self.warm_start.class_ids,self.warm_start.class_rooms,self.warm_start.class_online,
+                          self.warm_start.class_timesets,self.warm_start.attendance_students,
+                          self.warm_start.attendance_classes,self.warm_start.attendance_online]:
+                digest.update(array.tobytes())
+            warm_start = digest.hexdigest()
+        return {"objective_list": self.objective_list,
+                "instance_settings": self.instance_settings,
+                "time_limit": self.time_limit,
+                "warm_start": warm_start,
+                "cores": self.cores,
+                "node_memory": self.nodemem}
+
+    # Removes a checkpoint once its run has finished
+    def remove_checkpoint(self,checkpoint):
+        if(checkpoint != None and os.path.exists(checkpoint)):
+            os.remove(checkpoint)
+
+
+    # Starts the time limit shared by a number of stages
+    def start_budget(self,number_stages):
+        self.budget_end = None
+        if(self.time_limit != None):
+            self.budget_end = time.time() + self.time_limit
+        self.stages_left = number_stages
+
+    # Time limit of the next stage (the time left is split evenly over the stages left)
+    def stage_time_limit(self):
+        if(self.budget_end == None):
+            return None
+        stage_time = max(self.budget_end - time.time(),0)/max(self.stages_left,1)
+        self.stages_left -= 1
+        return max(stage_time,1)
+
+
+    # Solve every ordering that starts with a given objective
+    def lexicographic_solve_branch(self,objective_list,first_objective):
+        results_dictionary = {}
+        self.load_checkpoint(objective_list)
+        self.start_budget(1 + number_of_stages(len(objective_list) - 1) - len(self.stage_results))
+        base_model = self.build_model()
+        if((first_objective[0],) not in self.stage_results):
+            self.solve_stage(base_model,[first_objective])
+        remaining = [i for i in objective_list if i != first_objective]
+        if(len(remaining) == 0):
+            stage_result = self.stage_results[(first_objective[0],)]
+            non_optimal = [first_objective[0]] if stage_result[3] == False else []
+            results_dictionary[(first_objective[0],)] = [{first_objective[0]: stage_result[0]},stage_result[2],non_optimal]
+        else:
+            self.solve_prefix_tree(base_model,[first_objective],remaining,results_dictionary)
+        return results_dictionary
+
+
+    # Solve the branches of the prefix tree in a pool of worker processes
+    def lexicographic_solve_parallel(self,objective_list,number_workers):
+        """
+        Each worker rebuilds the instance from the on-disk cache using the
+        instance settings and solves every ordering with one first objective.
+        Cores are split evenly between the workers and the time limit between
+        the rounds of branches.
+        """
+        if(self.instance_settings == None):
+            print("Warning: No instance settings given, solving orderings sequentially")
+            return self.lexicographic_solve(objective_list)
+        if("fork" not in multiprocessing.get_all_start_methods()):
+            print("Warning: Worker processes not supported, solving orderings sequentially")
+            return self.lexicographic_solve(objective_list)
+        number_workers = max(min(number_workers,len(objective_list)),1)
+        total_cores = self.cores
+        if(total_cores == None):
+            total_cores = multiprocessing.cpu_count()
+        worker_cores = max(int(total_cores/number_workers),1)
+        branch_time = None
+        if(self.time_limit != None):
+            branch_time = self.time_limit/math.ceil(len(objective_list)/number_workers)
+        print("Solving {} branches with {} workers ({} cores each)".format(len(objective_list),number_workers,worker_cores))
+        # Solving the branches
+        context = multiprocessing.get_context("fork")
+        with context.Pool(processes=number_workers) as pool:
+            branch_arguments = [(self.instance_settings,worker_cores,self.nodemem,objective_list,objective,self.warm_start,branch_time,
+                                 None if self.checkpoint == None else self.checkpoint+"_"+str(objective[0]))
+                                for objective in objective_list]
+            branch_results = pool.starmap(lexicographic_branch_worker,branch_arguments)
+        # Merging the results in the same order as the sequential method
+        results_dictionary = {}
+        for branch in branch_results:
+            results_dictionary.update(branch)
+        # Branch checkpoints are only removed once every branch has finished
+        if(self.checkpoint != None):
+            for objective in objective_list:
+                self.remove_checkpoint(self.checkpoint+"_"+str(objective[0]))
         return results_dictionary
 
 
     # Solve a particular ordering of objectives
-    def lexicographic_solve_ordering(self,ordered_objective_list):
+    def lexicographic_solve_ordering(self,ordered_objective_list,base_model=None):
         objective_values = {}
         resulting_solution = None
-        # Building the model
-        base_model = ModelObject(self.P,
-                                solution = self.solution,
-                                fixed_elements = self.fixed_elements,
-                                inactive_constraints = [],
-                                number_cores = self.cores, 
-                                node_memory = self.nodemem)
+        # Building the model if one isn't given
+        if(base_model == None):
+            base_model = self.build_model()
         # Looping through
         for i,objective in enumerate(ordered_objective_list):
             base_model.set_objective(objective[0],sense=objective[1])
+            if(i == 0 and self.warm_start != None):
+                base_model.set_solution_start(self.warm_start)
             if(i != 0):
                 objective_name = ordered_objective_list[i-1][0]
                 objective_value = objective_values[objective_name]
@@ -54,4 +333,410 @@ class LexicographicOnly:
             objective_values[objective[0]] = base_model.objective_value()
         # Saving final solution file for ordering
         resulting_solution = base_model.solution
-        return objective_values,resulting_solution
\ No newline at end of file
+        # Removing the objective constraints so the model can be reused
+        for objective in reversed(ordered_objective_list[:-1]):
+            base_model.unconstrain_last_objective(objective[0])
+        return objective_values,resulting_solution
+
+
+"""
+Hierarchical multi-objective solution method
+"""
+
+class HierarchicalMultiObjective(LexicographicOnly):
+    """
+    Alternative to LexicographicOnly that registers every objective with
+    the solver at once, so no objective constraints are added between
+    stages and the search is not restarted for each objective.
+    """
+
+    # Solve all possible orderings of the objectives given
+    def lexicographic_solve(self,objective_list):
+        results_dictionary = {}
+        orderings = list(itertools.permutations(objective_list))
+        self.start_budget(len(orderings))
+        base_model = self.build_model()
+        for ordering in orderings:
+            [objective_values,solution] = self.lexicographic_solve_ordering(list(ordering),base_model)
+            ordering_name = tuple([i[0] for i in ordering])
+            results_dictionary[ordering_name] = [objective_values,solution,self.non_optimal_objectives(list(ordering))]
+        return results_dictionary
+
+
+    # Solve a particular ordering of objectives
+    def lexicographic_solve_ordering(self,ordered_objective_list,base_model=None):
+        objective_values = {}
+        # Building the model if one isn't given
+        if(base_model == None):
+            base_model = self.build_model()
+        # Solving all objectives in one call
+        base_model.set_hierarchical_objectives(ordered_objective_list)
+        if(self.warm_start != None):
+            base_model.set_solution_start(self.warm_start)
+        # The time left is split evenly over the orderings left
+        ordering_time = self.stage_time_limit()
+        if(ordering_time != None):
+            base_model.M.Params.TimeLimit = ordering_time
+        base_model.optimise_model()
+        self.ordering_optimal = base_model.M.Status == GRB.OPTIMAL
+        if(base_model.M.SolCount == 0):
+            print("Warning: No solution found for {} (status {})".format(tuple([i[0] for i in ordered_objective_list]),base_model.M.Status))
+            return {objective[0]: None for objective in ordered_objective_list},None
+        base_model.updateSolution()
+        for objective in ordered_objective_list:
+            objective_values[objective[0]] = base_model.named_objective_value(objective[0])
+        return objective_values,base_model.solution
+
+    # Objectives of the last ordering solved that are not proven optimal
+    def non_optimal_objectives(self,ordered_objective_list):
+        if(self.ordering_optimal == True):
+            return []
+        return [objective[0] for objective in ordered_objective_list]
+
+
+"""
+Rolling student batches
+"""
+
+class RollingStudentBatches(HierarchicalMultiObjective):
+    """
+    The model is built with the first batch of students and each further batch
+    is added to the live model (ModelObject.add_students) and solved warm started
+    from the previous incumbent, so there is a solution for the students added so
+    far after every batch and the full model is never built cold.
+    """
+    def __init__(self,P,number_cores,node_memory,batch_size=100,instance_settings=None,warm_start=None):
+        HierarchicalMultiObjective.__init__(self,P,number_cores,node_memory,instance_settings=instance_settings,warm_start=warm_start)
+        self.batch_size = batch_size
+
+
+    # Solve all possible orderings of the objectives given
+    def lexicographic_solve(self,objective_list):
+        results_dictionary = {}
+        for ordering in itertools.permutations(objective_list):
+            [objective_values,solution] = self.lexicographic_solve_ordering(list(ordering))
+            ordering_name = tuple([i[0] for i in ordering])
+            results_dictionary[ordering_name] = [objective_values,solution,self.non_optimal_objectives(list(ordering))]
+        return results_dictionary
+
+
+    # Solve a particular ordering of objectives, adding the students a batch at a time
+    def lexicographic_solve_ordering(self,ordered_objective_list,base_model=None):
+        batches = [self.P.students[i:i+self.batch_size] for i in range(0,len(self.P.students),self.batch_size)]
+        if(len(batches) == 0):
+            batches = [[]]
+        if(self.env == None):
+            self.env = Env()
+        batch_P = copy.copy(self.P)
+        batch_P.students = batches[0]
+        base_model = ModelObject(batch_P,
+                                 number_cores = self.cores,
+                                 node_memory = self.nodemem,
+                                 env = self.env)
+        base_model.set_hierarchical_objectives(ordered_objective_list)
+        if(self.warm_start != None):
+            base_model.set_solution_start(self.warm_start)
+        base_model.solve_model()
+        print("Batch 1 of {} solved with {} students".format(len(batches),len(base_model.P.students)))
+        for i,batch in enumerate(batches[1:]):
+            # The objectives are set again by add_students and the incumbent is kept as the start
+            base_model.add_students(batch)
+            base_model.solve_model()
+            print("Batch {} of {} solved with {} students".format(i+2,len(batches),len(base_model.P.students)))
+        self.ordering_optimal = base_model.M.Status == GRB.OPTIMAL
+        objective_values = {}
+        for objective in ordered_objective_list:
+            objective_values[objective[0]] = base_model.named_objective_value(objective[0])
+        solution = base_model.solution
+        base_model.M.dispose()
+        return objective_values,solution
+
+
+"""
+Sensitivity sweeps over instance parameters
+"""
+
+class SensitivitySweep(LexicographicOnly):
+    """
+    Solves every ordering for a list of room capacity reductions ("roomcapreduction"),
+    online distances ("onlinedist") or preference proportions ("proportion") with a
+    single model. Capacities and preferences are changed with chgCoeff and rows
+    involving the online room are made binding or relaxed,
+    each point starts from the solution of the previous point.
+    The instance must have its full room capacities for a capacity sweep.
+    """
+    def __init__(self,P,number_cores,node_memory,sweep,values,instance_settings=None,warm_start=None):
+        LexicographicOnly.__init__(self,P,number_cores,node_memory,instance_settings=instance_settings,warm_start=warm_start)
+        self.sweep = sweep
+        self.values = list(values)
+        self.full_capacities = {r.id: r.capacity for r in P.rooms if r.id != 0}
+
+
+    # Solve all possible orderings of the objectives at every value of the sweep
+    def sweep_solve(self,objective_list):
+        sweep_results = {}
+        self.start_budget(len(self.values)*number_of_stages(len(objective_list)))
+        # Rows for the online room are built for the largest distance
+        if(self.sweep == "onlinedist"):
+            self.P = copy.copy(self.P)
+            self.P.weightedRoomAdjacency = copy.deepcopy(self.P.weightedRoomAdjacency)
+            self.P.weightedRoomAdjacency.set_dummy_distance(max(self.values))
+            self.P.dummyRoomDistanceScaling = max(self.values)
+        base_model = self.build_model()
+        for value in self.values:
+            print("Sweep point {} = {}".format(self.sweep,value))
+            start_time = time.time()
+            if(self.sweep == "roomcapreduction"):
+                base_model.set_room_capacities(self.reduced_capacities(value))
+            elif(self.sweep == "proportion"):
+                base_model.set_mode_preferences(self.proportion_preferences(value))
+            else:
+                base_model.set_online_distance(value)
+            results_dictionary = {}
+            self.stage_results = {}
+            self.solve_prefix_tree(base_model,[],objective_list,results_dictionary)
+            # The next point starts from the solution of the first ordering
+            first_ordering = tuple([i[0] for i in objective_list])
+            self.warm_start = results_dictionary[first_ordering][1]
+            sweep_results[value] = [results_dictionary,time.time() - start_time]
+        return sweep_results
+
+
+    # Room capacities after a percentage decrease (as in reduce_capacity)
+    def reduced_capacities(self,percentage_decrease):
+        decimal = max(100-percentage_decrease,0)/100
+        return {r_id: int(capacity*decimal) for r_id,capacity in self.full_capacities.items()}
+
+    # Student preferences given by a proportion (as in student_preferences)
+    def proportion_preferences(self,proportion):
+        P = copy.copy(self.P)
+        P.students = [copy.copy(s) for s in self.P.students]
+        P.student_preferences(proportion=proportion)
+        return {s.id: s.mode_preference for s in P.students}
+
+
+"""
+Large neighbourhood search (fix and optimise)
+"""
+
+class LargeNeighbourhoodSearch(LexicographicOnly):
+    """
+    Starts from an incumbent (the warm start or a greedy construction) and
+    repeatedly frees a neighbourhood of classes and students, fixes everything
+    else to the incumbent and re-solves the free part with a short time limit.
+    Only the free students are built into each neighbourhood model (the fixed
+    students keep their place in the capacity rows), so the full model is never built.
+    Neighbourhoods cycle through modules, rooms, time windows and student groups.
+    Each ordering is given an equal share of the time budget.
+    """
+    neighbourhoods = ["module","room","time","students"]
+
+    def __init__(self,P,number_cores,node_memory,
+                 time_budget=600,
+                 iteration_time=60,
+                 max_free_classes=20,
+                 max_free_students=100,
+                 seed=0,
+                 instance_settings=None,
+                 warm_start=None):
+        LexicographicOnly.__init__(self,P,number_cores,node_memory,instance_settings=instance_settings,warm_start=warm_start)
+        self.time_budget = time_budget
+        self.iteration_time = iteration_time
+        self.max_free_classes = max_free_classes
+        self.max_free_students = max_free_students
+        self.random = rd.Random(seed)
+        self.classes = {c.id: c for c in P.classes}
+        self.config_subparts = {}
+        for k in P.modules:
+            for f in k.configs:
+                self.config_subparts[k.id,f.id] = len(f.subparts)
+        self.evaluator = SolutionEvaluator(P)
+
+
+    # Improve a solution for every ordering of the objectives given
+    def lexicographic_solve(self,objective_list):
+        results_dictionary = {}
+        orderings = list(itertools.permutations(objective_list))
+        for ordering in orderings:
+            [objective_values,solution] = self.lexicographic_solve_ordering(list(ordering),time_budget=self.time_budget/len(orderings))
+            ordering_name = tuple([i[0] for i in ordering])
+            results_dictionary[ordering_name] = [objective_values,solution,self.non_optimal_objectives(list(ordering))]
+        return results_dictionary
+
+    # The search never proves an objective optimal
+    def non_optimal_objectives(self,ordered_objective_list):
+        return [objective[0] for objective in ordered_objective_list]
+
+
+    # Improve a solution for a particular ordering of objectives
+    def lexicographic_solve_ordering(self,ordered_objective_list,base_model=None,time_budget=None):
+        if(time_budget == None):
+            time_budget = self.time_budget
+        start_time = time.time()
+        incumbent = self.initial_solution()
+        incumbent_key = self.solution_key(incumbent,ordered_objective_list)
+        print("LNS starting incumbent {}".format(incumbent_key))
+        iteration = 0
+        while(time.time() - start_time < time_budget):
+            remaining_time = time_budget - (time.time() - start_time)
+            neighbourhood = self.neighbourhoods[iteration % len(self.neighbourhoods)]
+            free_classes, free_students = self.choose_neighbourhood(neighbourhood,incumbent)
+            candidate = self.solve_neighbourhood(incumbent,free_classes,free_students,ordered_objective_list,
+                                                 min(self.iteration_time,remaining_time))
+            # Accepting solutions that are no worse (sideways moves help diversify)
+            if(candidate != None):
+                candidate_key = self.solution_key(candidate,ordered_objective_list)
+                if(candidate_key <= incumbent_key):
+                    incumbent = candidate
+                    incumbent_key = candidate_key
+            print("LNS iteration {} ({}, {} classes, {} students): {}".format(iteration,neighbourhood,
+                                                                              len(free_classes),len(free_students),incumbent_key))
+            iteration += 1
+        objective_values = self.evaluator.objective_values(incumbent)
+        objective_values = {objective[0]: objective_values[objective[0]] for objective in ordered_objective_list}
+        return objective_values,incumbent
+
+
+    # Warm start if given, otherwise a greedy construction
+    def initial_solution(self):
+        if(self.warm_start != None):
+            return self.warm_start
+        return GreedyConstruction(self.P).construct()
+
+
+    # Violations then objective values (all minimised) for lexicographic comparisons
+    def solution_key(self,solution,ordered_objective_list):
+        objective_values, violations = self.evaluator.evaluate(solution)
+        key = [len(violations)]
+        for objective in ordered_objective_list:
+            if(objective[1] == "Maximise"):
+                key.append(-objective_values[objective[0]])
+            else:
+                key.append(objective_values[objective[0]])
+        return tuple(key)
+
+
+    # Solve the model with everything outside of the neighbourhood fixed
+    def solve_neighbourhood(self,incumbent,free_classes,free_students,ordered_objective_list,time_limit):
+        """
+        The model only holds the free students, the fixed classes are fixed to the
+        incumbent and the fixed students are added back to the candidate afterwards.
+        """
+        if(self.env == None):
+            self.env = Env()
+        fixed_elements = inst.FixedElements(self.P)
+        fixed_elements.fix_all_except(incumbent,free_classes,free_students)
+        fixed_students = set(fixed_elements.students)
+        neighbourhood_P = copy.copy(self.P)
+        neighbourhood_P.students = [s for s in self.P.students if s.id not in fixed_students]
+        neighbourhood_fixed = inst.FixedElements(neighbourhood_P)
+        neighbourhood_fixed.fix_classes(incumbent,fixed_elements.classes)
+        fixed_attendance = [a for a in zip(incumbent.attendance_students.tolist(),
+                                           incumbent.attendance_classes.tolist(),
+                                           incumbent.attendance_online.tolist()) if a[0] in fixed_students]
+        model = ModelObject(neighbourhood_P,
+                            solution = incumbent,
+                            fixed_elements = neighbourhood_fixed,
+                            number_cores = self.cores,
+                            node_memory = self.nodemem,
+                            console_output = False,
+                            time_limit = time_limit,
+                            env = self.env)
+        model.reserve_capacity(fixed_attendance)
+        model.set_hierarchical_objectives(ordered_objective_list)
+        model.set_solution_start(incumbent)
+        model.optimise_model()
+        candidate = None
+        if(model.M.SolCount != 0):
+            model.updateSolution()
+            candidate = model.solution
+            free_attendance = list(zip(candidate.attendance_students.tolist(),
+                                       candidate.attendance_classes.tolist(),
+                                       candidate.attendance_online.tolist()))
+            candidate.set_attendance(fixed_attendance + free_attendance)
+        model.M.dispose()
+        return candidate
+
+
+    # Classes and students that are free in the next iteration
+    def choose_neighbourhood(self,neighbourhood,incumbent):
+        free_classes = []
+        free_students = []
+        if(neighbourhood == "module"):
+            modules = list(self.P.modules)
+            self.random.shuffle(modules)
+            for k in modules:
+                module_classes = [c_id for f in k.configs for p in f.subparts for c_id in p.classes]
+                if(len(free_classes) != 0 and len(free_classes) + len(module_classes) > self.max_free_classes):
+                    break
+                free_classes += module_classes
+        elif(neighbourhood == "room"):
+            used_rooms = sorted(set(int(r) for r in incumbent.class_rooms if r != -1))
+            if(len(used_rooms) != 0):
+                room = self.random.choice(used_rooms)
+                free_classes = [c.id for c in self.P.classes if room in c.rooms]
+        elif(neighbourhood == "time"):
+            if(len(incumbent.class_ids) != 0):
+                i = self.random.randrange(len(incumbent.class_ids))
+                window = max(int(self.P.slots_per_day/4),1)
+                in_window = (((incumbent.class_days & incumbent.class_days[i]) != 0) &
+                             ((incumbent.class_weeks & incumbent.class_weeks[i]) != 0) &
+                             (np.abs(incumbent.class_starts - incumbent.class_starts[i]) <= window))
+                free_classes = [int(c_id) for c_id in incumbent.class_ids[in_window]]
+        else:
+            # Students missing a requested module first, then random students
+            missing = sorted(self.missing_modules(incumbent))
+            free_students = self.random.sample(missing,min(self.max_free_students,len(missing)))
+            chosen = set(free_students)
+            others = [s.id for s in self.P.students if s.id not in chosen]
+            free_students += self.random.sample(others,min(self.max_free_students - len(free_students),len(others)))
+        # Limiting the number of free classes
+        if(len(free_classes) > self.max_free_classes):
+            free_classes = self.random.sample(free_classes,self.max_free_classes)
+        # Students requesting the free modules (so they can take them up)
+        free_modules = set(self.classes[c_id].module for c_id in free_classes)
+        if(len(free_modules) != 0):
+            requesting = [s.id for s in self.P.students if len(free_modules.intersection(s.modules)) != 0]
+            free_students += self.random.sample(requesting,min(self.max_free_students,len(requesting)))
+        # Students missing a requested module whenever the module is free
+        if(len(free_modules) != 0):
+            for s_id,modules in self.missing_modules(incumbent).items():
+                if(len(free_modules.intersection(modules)) != 0):
+                    free_students.append(s_id)
+        return set(free_classes), set(free_students)
+
+
+    # Requested modules of each student without every subpart of a configuration attended
+    def missing_modules(self,solution):
+        attended_subparts = {}
+        for s_id,c_id in zip(solution.attendance_students.tolist(),solution.attendance_classes.tolist()):
+            c = self.classes[c_id]
+            attended_subparts.setdefault((s_id,c.module,c.module_config),set()).add(c.module_subpart)
+        complete = set((s_id,k_id) for (s_id,k_id,f_id),subparts in attended_subparts.items()
+                       if len(subparts) == self.config_subparts[k_id,f_id])
+        missing = {}
+        for s in self.P.students:
+            modules = set(k_id for k_id in s.modules if (s.id,k_id) not in complete)
+            if(len(modules) != 0):
+                missing[s.id] = modules
+        return missing
+
+
+"""
+Stage counting for the time limit
+"""
+
+# Number of stages in the prefix tree of a number of objectives
+def number_of_stages(number_objectives):
+    return sum(math.perm(number_objectives,k) for k in range(1,number_objectives+1))
+
+
+"""
+Worker process for parallel lexicographic solves
+"""
+
+def lexicographic_branch_worker(instance_settings,number_cores,node_memory,objective_list,first_objective,warm_start=None,time_limit=None,checkpoint=None):
+    P = fn.instancePrepare(instance_settings)
+    LexModel = LexicographicOnly(P,number_cores,node_memory,instance_settings=instance_settings,warm_start=warm_start,
+                                 time_limit=time_limit,checkpoint=checkpoint)
+    return LexModel.lexicographic_solve_branch(objective_list,first_objective)
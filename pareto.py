@@ -0,0 +1,191 @@
+import itertools
+import multiprocessing
+import numpy as np
+
+# Local packages
+import functions as fn
+from milp_model_solve import LexicographicOnly
+
+
+"""
+Epsilon-constraint enumeration of the Pareto front
+"""
+
+class EpsilonConstraintPareto(LexicographicOnly):
+    """
+    The first objective is optimised with bounds on the other objectives taken
+    from a grid between their best and worst values over the lexicographic
+    results (the payoff table). Ties are broken by optimising the bounded
+    objectives in turn so every point found is non-dominated.
+    Points are solved from the loosest bounds to the tightest in waves of
+    number_workers points, each one warm started from the nearest solved point.
+    A point is skipped when a point with looser bounds already has a solution
+    within its bounds (the same solution is optimal) or has no solution at all.
+    """
+    def __init__(self,P,number_cores,node_memory,grid_points=5,number_workers=1,instance_settings=None,warm_start=None):
+        LexicographicOnly.__init__(self,P,number_cores,node_memory,instance_settings=instance_settings,warm_start=warm_start)
+        self.grid_points = grid_points
+        self.number_workers = number_workers
+
+
+    # Non-dominated solutions found over the grid of bounds
+    def pareto_solve(self,objective_list,lexicographic_results=None):
+        """
+        Returns a list of [objective values, solution], the lexicographic results
+        are solved first if they are not given and are part of the front.
+        """
+        if(lexicographic_results == None):
+            lexicographic_results = self.lexicographic_solve(objective_list)
+        if(len(lexicographic_results) == 0):
+            print("Warning: No lexicographic results to build the Pareto grid from")
+            return []
+        self.objective_list = objective_list
+        self.bounded = objective_list[1:]
+        self.signs = [1 if sense == "Minimise" else -1 for (z,sense) in self.bounded]
+        grids = self.bound_grids(lexicographic_results)
+        pending = sorted(itertools.product(*[list(enumerate(grid)) for grid in grids]),
+                         key=lambda point: sum(i for (i,value) in point))
+        pending = [tuple(value for (i,value) in point) for point in pending]
+        self.ranges = [max(max(grid) - min(grid),1) for grid in grids]
+        print("Epsilon-constraint grid of {} points".format(len(pending)))
+        # Solved points as [bounds, result], the result is None when there is no solution
+        solved = []
+        # Every lexicographic result can start a point, placed at its own objective values
+        starts = [[tuple(sign*result[0][z] for (z,sense),sign in zip(self.bounded,self.signs)),result]
+                  for result in lexicographic_results.values()]
+        parallel = (self.number_workers > 1 and self.instance_settings != None
+                    and "fork" in multiprocessing.get_all_start_methods())
+        if(parallel == True):
+            # The environment must not exist when the workers are forked
+            self.dispose_env()
+            total_cores = self.cores
+            if(total_cores == None):
+                total_cores = multiprocessing.cpu_count()
+            worker_cores = max(int(total_cores/self.number_workers),1)
+            context = multiprocessing.get_context("fork")
+            with context.Pool(processes=self.number_workers,
+                              initializer=pareto_worker_setup,
+                              initargs=(self.instance_settings,worker_cores,self.nodemem)) as pool:
+                while(len(pending) != 0):
+                    wave, pending = self.next_wave(pending,solved,self.number_workers)
+                    point_arguments = [(objective_list,self.bound_values(bounds),self.nearest_start(bounds,starts))
+                                       for bounds in wave]
+                    self.record_wave(wave,pool.starmap(pareto_point_worker,point_arguments),solved,starts)
+        else:
+            base_model = self.build_model()
+            while(len(pending) != 0):
+                wave, pending = self.next_wave(pending,solved,1)
+                results = [solve_epsilon_point(base_model,objective_list,self.bound_values(bounds),self.nearest_start(bounds,starts))
+                           for bounds in wave]
+                self.record_wave(wave,results,solved,starts)
+        candidates = list(lexicographic_results.values()) + [result for (bounds,result) in solved if result != None]
+        return self.non_dominated(candidates)
+
+
+    # Grid of bounds for each bounded objective (loosest first, minimisation form)
+    def bound_grids(self,lexicographic_results):
+        grids = []
+        for (z,sense),sign in zip(self.bounded,self.signs):
+            values = [sign*result[0][z] for result in lexicographic_results.values()]
+            grid = np.round(np.linspace(max(values),min(values),self.grid_points))
+            grids.append(sorted(set(grid.tolist()),reverse=True))
+        return grids
+
+    # Bounds in the sense of each objective
+    def bound_values(self,bounds):
+        return {z: sign*bound for (z,sense),sign,bound in zip(self.bounded,self.signs,bounds)}
+
+    # Next points to solve once the points already answered are skipped
+    def next_wave(self,pending,solved,wave_size):
+        pending = [bounds for bounds in pending if not self.is_covered(bounds,solved)]
+        return pending[:wave_size], pending[wave_size:]
+
+    # Stores the results of a wave
+    def record_wave(self,wave,results,solved,starts):
+        for bounds,result in zip(wave,results):
+            if(result == None):
+                print("Bounds {}: no solution".format(self.bound_values(bounds)))
+            else:
+                print("Bounds {}: {}".format(self.bound_values(bounds),result[0]))
+                starts.append([bounds,result])
+            solved.append([bounds,result])
+
+    # Checks if a point with looser bounds already answers the point
+    def is_covered(self,bounds,solved):
+        for solved_bounds,result in solved:
+            if(all(b <= sb for b,sb in zip(bounds,solved_bounds))):
+                if(result == None):
+                    return True
+                values = [sign*result[0][z] for (z,sense),sign in zip(self.bounded,self.signs)]
+                if(all(v <= b + 1e-6 for v,b in zip(values,bounds))):
+                    return True
+        return False
+
+    # Solution of the solved point nearest to the bounds
+    def nearest_start(self,bounds,starts):
+        distances = [sum(abs(b - sb)/r for b,sb,r in zip(bounds,start_bounds,self.ranges))
+                     for start_bounds,result in starts]
+        return starts[int(np.argmin(distances))][1][1]
+
+    # Removes repeated and dominated results
+    def non_dominated(self,candidates):
+        signs = [1 if sense == "Minimise" else -1 for (z,sense) in self.objective_list]
+        points = {}
+        for result in candidates:
+            values = tuple(sign*result[0][z] for (z,sense),sign in zip(self.objective_list,signs))
+            if(values not in points):
+                points[values] = result
+        front = []
+        for values in sorted(points):
+            dominated = any(all(o <= v for o,v in zip(other,values)) and other != values for other in points)
+            if(dominated == False):
+                front.append([points[values][0],points[values][1]])
+        return front
+
+
+"""
+Solving a point of the grid
+"""
+
+# Optimises the objectives in order within the bounds (None if there is no solution)
+def solve_epsilon_point(base_model,objective_list,bounds,warm_start=None):
+    for (z,sense) in objective_list[1:]:
+        base_model.bound_objective(z,bounds[z],sense=sense)
+    objective_values = {}
+    constrained = []
+    result = None
+    for i,objective in enumerate(objective_list):
+        base_model.set_objective(objective[0],sense=objective[1])
+        if(i == 0 and warm_start != None):
+            base_model.set_solution_start(warm_start)
+        if(i != 0):
+            previous = objective_list[i-1]
+            base_model.constrain_objective(previous[0],objective_values[previous[0]],sense=previous[1])
+            constrained.append(previous[0])
+        base_model.optimise_model()
+        if(base_model.M.SolCount == 0):
+            break
+        objective_values[objective[0]] = base_model.objective_value()
+    if(len(objective_values) == len(objective_list)):
+        base_model.updateSolution()
+        result = [objective_values,base_model.solution]
+    # Removing the objective constraints so the model can be reused
+    for z in reversed(constrained):
+        base_model.unconstrain_last_objective(z)
+    return result
+
+
+"""
+Worker processes for parallel points
+"""
+
+worker_model = None
+
+# Builds the model once in each worker process
+def pareto_worker_setup(instance_settings,number_cores,node_memory):
+    global worker_model
+    P = fn.instancePrepare(instance_settings)
+    worker_model = LexicographicOnly(P,number_cores,node_memory,instance_settings=instance_settings).build_model()
+
+def pareto_point_worker(objective_list,bounds,warm_start=None):
+    return solve_epsilon_point(worker_model,objective_list,bounds,warm_start)
@@ -0,0 +1,159 @@
+import copy
+
+# Local packages
+import instance as inst
+from milp_model_solve import LexicographicOnly
+from evaluation import SolutionEvaluator
+
+
+"""
+Changes to an instance after it has been solved
+"""
+
+class ChangeSet():
+    """
+    Edits made to an instance during term time:
+    - student_modules: new module requests of a student (modules, required modules)
+    - room_capacities: new capacity of a room
+    - room_unavailable: timesets a room can no longer be used at (None for all of them)
+    - class_rooms and class_timesets: the rooms and timesets a class is now restricted to
+    """
+    def __init__(self):
+        self.student_modules = {}
+        self.room_capacities = {}
+        self.room_unavailable = {}
+        self.class_rooms = {}
+        self.class_timesets = {}
+
+    # Student changes their module requests
+    def change_student_modules(self,student_id,modules,required_modules=[]):
+        self.student_modules[student_id] = (list(modules),list(required_modules))
+
+    # Room capacity changes
+    def change_room_capacity(self,room_id,capacity):
+        self.room_capacities[room_id] = capacity
+
+    # Room can no longer be used at some (or all) timesets
+    def make_room_unavailable(self,room_id,timesets=None):
+        if(timesets == None):
+            self.room_unavailable[room_id] = None
+        elif(self.room_unavailable.get(room_id,[]) != None):
+            self.room_unavailable[room_id] = sorted(set(self.room_unavailable.get(room_id,[]) + list(timesets)))
+
+    # Class can only use some of its rooms or timesets
+    def restrict_class(self,class_id,rooms=None,timesets=None):
+        if(rooms != None):
+            self.class_rooms[class_id] = list(rooms)
+        if(timesets != None):
+            self.class_timesets[class_id] = list(timesets)
+
+
+    # Copy of the instance with the changes made
+    def apply(self,P):
+        """
+        Module requests for modules that are not in the instance (e.g. removed with
+        the students that requested them) are left unchanged with a warning.
+        """
+        P = copy.deepcopy(P)
+        modules = set(k.id for k in P.modules)
+        for s in P.students:
+            if(s.id in self.student_modules):
+                new_modules, new_required_modules = self.student_modules[s.id]
+                unknown = [k_id for k_id in new_modules + new_required_modules if k_id not in modules]
+                if(len(unknown) != 0):
+                    print("Warning: Modules {} requested by student {} are not in the instance, their requests are not changed".format(unknown,s.id))
+                    continue
+                s.modules, s.required_modules = copy.deepcopy(self.student_modules[s.id])
+        for r in P.rooms:
+            if(r.id in self.room_capacities):
+                r.capacity = self.room_capacities[r.id]
+        # Unavailable rooms are removed through the room time compatibility (constraint 9)
+        for room_id in self.room_unavailable:
+            timesets = self.room_unavailable[room_id]
+            if(timesets == None):
+                timesets = range(len(P.timesets))
+            for t in timesets:
+                P.roomtimeCompatibility.array[P.roomtimeCompatibility.id_dictionary[room_id],t] = False
+        for c in P.classes:
+            if(c.id in self.class_rooms):
+                c.rooms = {r: penalty for r,penalty in c.rooms.items() if r in self.class_rooms[c.id]}
+            if(c.id in self.class_timesets):
+                c.timesets = {t: penalty for t,penalty in c.timesets.items() if t in self.class_timesets[c.id]}
+        return P
+
+    # Classes and students of a solution that the changes can affect
+    def affected(self,P,solution):
+        """
+        Classes in a changed room (or one that is now unavailable when they use it)
+        and restricted classes are freed, along with their required SameAttendees
+        partners so they can move together. Students with changed requests are freed
+        (students attending a free class are freed by the fixed elements).
+        """
+        free_classes = set(self.class_rooms) | set(self.class_timesets)
+        for i,c_id in enumerate(solution.class_ids.tolist()):
+            room = int(solution.class_rooms[i])
+            timeset = int(solution.class_timesets[i])
+            if(room in self.room_capacities):
+                free_classes.add(c_id)
+            if(room in self.room_unavailable):
+                if(self.room_unavailable[room] == None or timeset in self.room_unavailable[room]):
+                    free_classes.add(c_id)
+            if(solution.class_online[i] == True and 0 in self.room_unavailable):
+                if(self.room_unavailable[0] == None or timeset in self.room_unavailable[0]):
+                    free_classes.add(c_id)
+        for dist in P.distributions:
+            if(dist.required == True and dist.type == "SameAttendees"):
+                if(len(free_classes.intersection(dist.classes)) != 0):
+                    free_classes.update(dist.classes)
+        free_students = set(self.student_modules)
+        return free_classes, free_students
+
+
+"""
+Re-optimising a solution after a change set
+"""
+
+class IncrementalRetimetabling(LexicographicOnly):
+    """
+    The change set is applied to a copy of the instance and everything outside of
+    the affected classes and students is fixed to the previous solution
+    (FixedElements and fixVariablesBase), the free part is then solved
+    lexicographically starting from the previous solution.
+    When the previous solution is feasible on the changed instance each ordering
+    is bounded so no objective is worse than in the previous solution. Otherwise
+    the previous solution is not a point of the model and the bounds could leave
+    no solution, so the ordering is solved without them.
+    """
+    def __init__(self,P,number_cores,node_memory,previous_solution,change_set,instance_settings=None):
+        changed_P = change_set.apply(P)
+        free_classes, free_students = change_set.affected(changed_P,previous_solution)
+        fixed_elements = inst.FixedElements(changed_P)
+        fixed_elements.fix_all_except(previous_solution,free_classes,free_students)
+        print("Re-timetabling {} classes and {} students".format(len(changed_P.classes) - len(fixed_elements.classes),
+                                                                len(changed_P.students) - len(fixed_elements.students)))
+        LexicographicOnly.__init__(self,changed_P,number_cores,node_memory,
+                                   solution=previous_solution,
+                                   fixed_elements=fixed_elements,
+                                   instance_settings=instance_settings,
+                                   warm_start=previous_solution)
+        self.previous_solution = previous_solution
+        self.evaluator = SolutionEvaluator(changed_P)
+
+
+    # Objective values and violations of the previous solution on the changed instance
+    def previous_evaluation(self):
+        objective_values, violations = self.evaluator.evaluate(self.previous_solution)
+        print("Previous solution on the changed instance: {} ({} violations)".format(objective_values,len(violations)))
+        return objective_values, violations
+
+    # Solve a particular ordering with the objectives bounded by the previous solution
+    def lexicographic_solve_ordering(self,ordered_objective_list,base_model=None):
+        if(base_model == None):
+            base_model = self.build_model()
+        objective_values, violations = self.previous_evaluation()
+        if(len(violations) == 0):
+            for (z,sense) in ordered_objective_list:
+                base_model.bound_objective(z,objective_values[z],sense=sense)
+        else:
+            print("Previous solution is infeasible on the changed instance, the objectives are not bounded")
+        return LexicographicOnly.lexicographic_solve_ordering(self,ordered_objective_list,base_model)
@@ -0,0 +1,101 @@
+# External packages
+import argparse
+import pandas as pd
+
+# Local packages
+import functions as fn
+from milp_model_solve import SensitivitySweep
+
+"""
+Importing arguments
+"""
+
+parser = argparse.ArgumentParser(description='UCTTP sensitivity sweep')
+
+# Filename of instance
+parser.add_argument('--filename', type=str, default = 'wbg-fal10',
+                    help='Filename of the instance stored in data folder (default = wbg-fal10)')
+# Do not add a dummy to instance
+parser.add_argument('--nodummy',action='store_true',
+                    help='Do not build an instance with a dummy room')
+
+# Student count
+parser.add_argument('--studentcount', type=int, default = None,
+                    help='Number of students to be kept in the instance (default = All)')
+# Student count start point
+parser.add_argument('--studentstart', type=int, default = 1,
+                    help='The student that we start the student count from (default = 1)')
+# Online space distance
+parser.add_argument('--onlinedist', type=float, default = 1.5,
+                    help='Distance that the online space is away from physical space when not swept (default = 1.5)')
+# Online space distance
+parser.add_argument('--roomcapreduction', type=float, default = 75,
+                    help='Percentage decrease in room capacity when not swept (default = 75)')
+
+# Parameter being swept
+parser.add_argument('--sweep', type=str, default = 'roomcapreduction', choices = ['roomcapreduction','onlinedist','proportion'],
+                    help='Instance parameter to sweep (default = roomcapreduction)')
+# Values of the sweep
+parser.add_argument('--values', type=float, nargs='+', default = [50,60,70,75,80,90],
+                    help='Values of the swept parameter, solved in the order given (default = 50 60 70 75 80 90)')
+# Preference proportions of the sweep
+parser.add_argument('--proportions', type=str, nargs='+', default = ['1,1,1','2,1,1','1,1,2','1,0,1'],
+                    help='Preference proportions (in-person, indifferent, online) for the proportion sweep (default = 1,1,1 2,1,1 1,1,2 1,0,1)')
+
+# Number of cores for solver
+parser.add_argument('--solvercores', type=int, default = None,
+                    help='Number of cores the solver can use (default = All)')
+# Number of cores for solver
+parser.add_argument('--solvernodefile', type=int, default = 1,
+                    help='Memory in GB before solver creates nodefile (default = 1)')
+
+args = parser.parse_args()
+args.dummy = not args.nodummy
+
+"""
+Importing the instance
+"""
+
+# Capacity sweeps start from the full room capacities
+roomcapreduction = args.roomcapreduction
+if(args.sweep == "roomcapreduction"):
+    roomcapreduction = 0
+instance_settings = {"filename": args.filename,
+                     "dummyRoomPenaltyScaling": 1,
+                     "dummyRoomDistanceScaling": args.onlinedist,
+                     "addDummy": args.dummy,
+                     "studentcount": args.studentcount,
+                     "studentstart": args.studentstart,
+                     "roomcapreduction": roomcapreduction,
+                     "proportion": (1,1,1)}
+P = fn.instancePrepare(instance_settings)
+if(args.sweep == "roomcapreduction"):
+    P.weightedRoomAdjacency.set_dummy_distance(args.onlinedist)
+    P.dummyRoomDistanceScaling = args.onlinedist
+
+"""
+Running the sweep
+"""
+
+objective_list = [("ModuleRequest","Maximise"),("ModePreferences","Minimise"),("StudentConflicts","Minimise")]
+values = args.values
+if(args.sweep == "proportion"):
+    values = [tuple(int(i) for i in proportion.split(",")) for proportion in args.proportions]
+sweep = SensitivitySweep(P,args.solvercores,args.solvernodefile,args.sweep,values,instance_settings=instance_settings)
+sweep_results = sweep.sweep_solve(objective_list)
+
+sweep_table = pd.DataFrame(data={"Sweep":[],"Value":[],"Ordering":[],
+                                 "Z1":[],"Z2":[],"Z3":[],
+                                 "PointSeconds":[]})
+for value in sweep_results:
+    results, point_time = sweep_results[value]
+    for ordering in results:
+        new_row = {"Sweep": args.sweep,
+                   "Value": value,
+                   "Ordering": ordering,
+                   "Z1": results[ordering][0]["ModuleRequest"],
+                   "Z2": results[ordering][0]["ModePreferences"],
+                   "Z3": results[ordering][0]["StudentConflicts"],
+                   "PointSeconds": point_time}
+        sweep_table = pd.concat([sweep_table, pd.DataFrame([new_row])], ignore_index=True)
+sweep_table.to_csv("output/"+str(args.filename)+"_"+str(args.sweep)+"_sweep.csv", index=False)
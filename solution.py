@@ -0,0 +1,231 @@
+import xml.etree.ElementTree as ET
+import numpy as np
+
+# Local packages
+import functions as fn
+
+
+"""
+Compact solution object, stores the timetable as arrays rather than an xml tree.
+"""
+
+class Solution():
+    """
+    Each scheduled class is one row of the class arrays:
+    - class_ids, class_timesets, class_rooms (physical room, -1 if none)
+    - class_online (class can be attended online)
+    - class_starts, class_lengths, class_days and class_weeks (bitmasks, bit 0 is day/week 1)
+    Each attending student is one row of the attendance arrays:
+    - attendance_students, attendance_classes, attendance_online
+    """
+    def __init__(self,name="NA",number_of_days=7,number_of_weeks=1):
+        self.name = name
+        self.number_of_days = number_of_days
+        self.number_of_weeks = number_of_weeks
+        # Classes
+        self.class_ids = np.zeros(0,dtype=np.int64)
+        self.class_timesets = np.zeros(0,dtype=np.int64)
+        self.class_rooms = np.zeros(0,dtype=np.int64)
+        self.class_online = np.zeros(0,dtype=bool)
+        self.class_starts = np.zeros(0,dtype=np.int64)
+        self.class_lengths = np.zeros(0,dtype=np.int64)
+        self.class_days = np.zeros(0,dtype=np.int64)
+        self.class_weeks = np.zeros(0,dtype=np.int64)
+        # Students
+        self.attendance_students = np.zeros(0,dtype=np.int64)
+        self.attendance_classes = np.zeros(0,dtype=np.int64)
+        self.attendance_online = np.zeros(0,dtype=bool)
+        # Lookups (built when first needed)
+        self.class_index = None
+        self.class_attendance = None
+
+
+    """
+    Setting the solution
+    """
+
+    # Sets the scheduled classes from (class id, physical room or None, online, timeset id) tuples
+    def set_classes(self,P,assignments):
+        self.class_ids = np.array([a[0] for a in assignments],dtype=np.int64)
+        self.class_rooms = np.array([-1 if a[1] == None else a[1] for a in assignments],dtype=np.int64)
+        self.class_online = np.array([a[2] == True for a in assignments],dtype=bool)
+        self.class_timesets = np.array([a[3] for a in assignments],dtype=np.int64)
+        timesets = [P.timesets[t] for t in self.class_timesets]
+        self.class_starts = np.array([t.start for t in timesets],dtype=np.int64)
+        self.class_lengths = np.array([t.length for t in timesets],dtype=np.int64)
+        self.class_days = np.array([bitmask(t.days) for t in timesets],dtype=np.int64)
+        self.class_weeks = np.array([bitmask(t.weeks) for t in timesets],dtype=np.int64)
+        self.class_index = None
+        self.class_attendance = None
+
+    # Sets the attending students from (student id, class id, online) tuples
+    def set_attendance(self,attendance):
+        self.attendance_students = np.array([a[0] for a in attendance],dtype=np.int64)
+        self.attendance_classes = np.array([a[1] for a in attendance],dtype=np.int64)
+        self.attendance_online = np.array([a[2] == True for a in attendance],dtype=bool)
+        self.class_attendance = None
+
+
+    """
+    Retrieving elements of the solution
+    """
+
+    # Row of the class arrays for a class id (None if the class is not scheduled)
+    def class_row(self,class_id):
+        if(self.class_index == None):
+            self.class_index = {int(c_id): i for i,c_id in enumerate(self.class_ids)}
+        return self.class_index.get(class_id)
+
+    # Room, online and timeset of a class (all None if the class is not scheduled)
+    def class_assignment(self,class_id):
+        i = self.class_row(class_id)
+        if(i == None):
+            return None, None, None
+        room = None
+        if(self.class_rooms[i] != -1):
+            room = int(self.class_rooms[i])
+        online = None
+        if(self.class_online[i] == True):
+            online = True
+        return room, online, int(self.class_timesets[i])
+
+    # Rows of the attendance arrays for each row of the class arrays
+    def attendance_rows(self,i):
+        if(self.class_attendance == None):
+            self.class_attendance = [[] for c in self.class_ids]
+            for j,c_id in enumerate(self.attendance_classes):
+                self.class_attendance[self.class_row(int(c_id))].append(j)
+        return self.class_attendance[i]
+
+    # Classes attended by a student with the mode of attendance
+    def student_attendance(self,student_id):
+        rows = np.nonzero(self.attendance_students == student_id)[0]
+        attended = {}
+        for j in rows:
+            if(self.attendance_online[j] == True):
+                attended[int(self.attendance_classes[j])] = "online"
+            else:
+                attended[int(self.attendance_classes[j])] = "inperson"
+        return attended
+
+    # Days and weeks of a row of the class arrays
+    def days(self,i):
+        return unpack_bitmask(self.class_days[i])
+
+    def weeks(self,i):
+        return unpack_bitmask(self.class_weeks[i])
+
+
+    """
+    Converting to and from xml
+    """
+
+    # ITC2019 style solution file (online attendance is stored as an extra mode attribute)
+    def to_xml(self):
+        sol = ET.Element("solution")
+        sol.attrib["name"] = str(self.name)
+        for i,c_id in enumerate(self.class_ids):
+            cls_add = ET.SubElement(sol, "class")
+            cls_add.attrib["id"] = str(c_id)
+            cls_add.attrib["days"] = bitstring(self.class_days[i],self.number_of_days)
+            cls_add.attrib["start"] = str(self.class_starts[i])
+            cls_add.attrib["weeks"] = bitstring(self.class_weeks[i],self.number_of_weeks)
+            if(self.class_rooms[i] != -1):
+                cls_add.attrib["room"] = str(self.class_rooms[i])
+            if(self.class_online[i] == True):
+                cls_add.attrib["online"] = "true"
+            for j in self.attendance_rows(i):
+                student_add = ET.SubElement(cls_add, "student")
+                student_add.attrib["id"] = str(self.attendance_students[j])
+                if(self.attendance_online[j] == True):
+                    student_add.attrib["mode"] = "online"
+                else:
+                    student_add.attrib["mode"] = "inperson"
+        return sol
+
+    # Writes the ITC2019 style solution file
+    def write_xml(self,filename):
+        tree = ET.ElementTree(self.to_xml())
+        tree.write(filename)
+
+    # Reads an ITC2019 solution (or the solution tree of older result dumps)
+    @classmethod
+    def from_xml(cls,P,xml_solution):
+        """
+        ITC2019 solutions store days and weeks as strings and have no length,
+        so the timeset is matched against the timesets of the class.
+        A class with no room that can be taught online is treated as online.
+        """
+        solution = cls(name=xml_solution.attrib.get("name",P.filename),
+                       number_of_days=P.number_of_days,
+                       number_of_weeks=P.number_of_weeks)
+        classes = {c.id: c for c in P.classes}
+        assignments = []
+        attendance = []
+        for cls_sol in xml_solution:
+            class_id = int(cls_sol.attrib["id"])
+            if(class_id not in classes):
+                continue
+            c = classes[class_id]
+            # Days, weeks and start of the class
+            days = cls_sol.attrib["days"]
+            weeks = cls_sol.attrib["weeks"]
+            if(type(days) == str):
+                days = [d+1 for d,char in enumerate(fn.split(days)) if char == '1']
+                weeks = [w+1 for w,char in enumerate(fn.split(weeks)) if char == '1']
+            start = int(cls_sol.attrib["start"])
+            timeset = None
+            for t in c.timesets:
+                tset = P.timesets[t]
+                if(tset.days == days and tset.weeks == weeks and tset.start == start):
+                    timeset = t
+                    break
+            if(timeset == None):
+                print("Warning: No matching timeset for class {}".format(class_id))
+                continue
+            # Rooms used by the class
+            room = cls_sol.attrib.get("room")
+            if(room != None):
+                room = int(room)
+            online = cls_sol.attrib.get("online")
+            if(online == True or online == "true" or (room == None and 0 in c.rooms)):
+                online = True
+            assignments.append((class_id,room,online,timeset))
+            # Students attending the class
+            for student in cls_sol:
+                mode = student.attrib.get("mode")
+                if(mode == None):
+                    mode = "inperson" if room != None else "online"
+                attendance.append((int(student.attrib["id"]),class_id,mode == "online"))
+        solution.set_classes(P,assignments)
+        solution.set_attendance(attendance)
+        return solution
+
+
+"""
+Helper functions for storing days and weeks
+"""
+
+# List of days (or weeks) starting at one to an integer bitmask
+def bitmask(values):
+    mask = 0
+    for v in values:
+        mask |= 1 << (v-1)
+    return mask
+
+# Integer bitmask to a list of days (or weeks) starting at one
+def unpack_bitmask(mask):
+    mask = int(mask)
+    values = []
+    position = 1
+    while(mask > 0):
+        if(mask & 1):
+            values.append(position)
+        mask >>= 1
+        position += 1
+    return values
+
+# Integer bitmask to an ITC2019 style string of a given length
+def bitstring(mask,length):
+    mask = int(mask)
+    return "".join(['1' if (mask >> i) & 1 else '0' for i in range(length)])
@@ -0,0 +1,48 @@
+# Local packages
+import functions as fn
+
+
+"""
+Analysis of a solution, the solution is indexed once and every metric
+used in Table 5 and Table 6 is calculated from the same index.
+"""
+
+class SolutionAnalysis():
+    """
+    The per student attendance index is shared by the Table 5 and Table 6 metrics.
+    The problem instance is only needed for the Table 6 metrics.
+    """
+    def __init__(self,P,solution):
+        self.P = P
+        self.solution = solution
+        self.index = fn.student_attendance_index(solution)
+
+
+    """
+    Table 5 metrics
+    """
+
+    # Attendance breakdown
+    def attendance_breakdown(self):
+        return fn.attendance_breakdown(self.solution,index=self.index)
+
+    # Switch counting
+    def switch_detection(self):
+        return fn.switch_detection(self.solution,index=self.index)
+
+
+    """
+    Table 6 metrics
+    """
+
+    # Electives offered
+    def elective_breakdown(self):
+        return fn.elective_breakdown(self.P,self.solution,index=self.index)
+
+    # Conflict breakdown
+    def conflict_breakdown(self):
+        return fn.conflict_breakdown(self.P,self.solution,index=self.index)
+
+    # Mode breakdown
+    def mode_breakdown(self):
+        return fn.mode_breakdown(self.P,self.solution,index=self.index)
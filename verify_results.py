@@ -0,0 +1,85 @@
+# External packages
+import argparse
+import pickle
+import xml.etree.ElementTree as ET
+import pandas as pd
+
+# Local packages
+import functions as fn
+from solution import Solution
+from evaluation import SolutionEvaluator
+
+"""
+Importing arguments
+"""
+
+parser = argparse.ArgumentParser(description='UCTTP result verification')
+
+# Filename of instance
+parser.add_argument('--filename', type=str, default = 'wbg-fal10',
+                    help='Filename of the instance stored in data folder (default = wbg-fal10)')
+# Do not add a dummy to instance
+parser.add_argument('--nodummy',action='store_true',
+                    help='Do not build an instance with a dummy room')
+
+# Student count
+parser.add_argument('--studentcount', type=int, default = None,
+                    help='Number of students to be kept in the instance (default = All)')
+# Student count start point
+parser.add_argument('--studentstart', type=int, default = 1,
+                    help='The student that we start the student count from (default = 1)')
+# Online space distance
+parser.add_argument('--onlinedist', type=float, default = 1.5,
+                    help='Distance that the online space is away from physical space (default = 1.5)')
+# Online space distance
+parser.add_argument('--roomcapreduction', type=float, default = 75,
+                    help='Percentage decrease in room capacity e.g. 75 is a four-fold reduction (default = 75)')
+
+args = parser.parse_args()
+args.dummy = not args.nodummy
+
+"""
+Importing the instance and results
+"""
+
+instance_settings = {"filename": args.filename,
+                     "dummyRoomPenaltyScaling": 1,
+                     "dummyRoomDistanceScaling": args.onlinedist,
+                     "addDummy": args.dummy,
+                     "studentcount": args.studentcount,
+                     "studentstart": args.studentstart,
+                     "roomcapreduction": args.roomcapreduction,
+                     "proportion": (1,1,1)}
+P = fn.instancePrepare(instance_settings)
+
+infile = open("output/"+str(args.filename)+"_dumped","rb")
+results = pickle.load(infile)
+infile.close()
+
+"""
+Evaluating the stored solutions
+"""
+
+evaluator = SolutionEvaluator(P)
+verification = pd.DataFrame(data={"Ordering":[],"Objective":[],
+                                  "Stored":[],"Evaluated":[]})
+for ordering in results:
+    solution = results[ordering][1]
+    # Dumps written before the Solution object store an xml tree
+    if(type(solution) == ET.Element):
+        solution = Solution.from_xml(P,solution)
+    objective_values, violations = evaluator.evaluate(solution)
+    for z in results[ordering][0]:
+        new_row = {"Ordering": ordering,
+                   "Objective": z,
+                   "Stored": results[ordering][0][z],
+                   "Evaluated": objective_values[z]}
+        verification = pd.concat([verification, pd.DataFrame([new_row])], ignore_index=True)
+    new_row = {"Ordering": ordering,
+               "Objective": "Violations",
+               "Stored": 0,
+               "Evaluated": len(violations)}
+    verification = pd.concat([verification, pd.DataFrame([new_row])], ignore_index=True)
+    for violation in violations:
+        print(ordering,violation)
+verification.to_csv("output/"+str(args.filename)+"_verification.csv", index=False)